@@ -0,0 +1,99 @@
+"""
+Microbenchmark of JSON extraction from model responses.
+
+Compares parse_llm_json (strict fast path, repair only as a fallback) with the
+previous greedy-regex + repair_json implementation on a corpus of response
+shapes: fenced JSON, fenced JSON with trailing text, bare JSON, rewrite answers
+quoting fences inside JSON strings, malformed JSON and text without JSON.
+Results are printed as JSON with microseconds per call and the parser path
+taken for each shape.
+
+    python -m benchmarks.bench_parsers --repeat 20000
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+# Allow running as a script from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from json_repair import repair_json
+
+from src.utils.parsers import parse_llm_json
+
+ANSWER = {"prediction": "PIN_RESET", "explanation": "The customer asks for a new PIN for their debit card."}
+REWRITE = {
+    "root_cause": "Overlapping categories.",
+    "improved_template": "Classify the inquiry.\n${user_question}\nWhen you output JSON, ALWAYS start with ```json",
+}
+
+CORPUS = {
+    "fenced": "```json\n" + json.dumps(ANSWER) + "\n```",
+    "fenced_trailing_text": "```json\n" + json.dumps(ANSWER) + "\n```\n\nLet me know if you need anything else.",
+    "bare": json.dumps(ANSWER),
+    "bare_with_preamble": "Here is the classification: " + json.dumps(ANSWER),
+    "rewrite_inner_fence": "```json\n" + json.dumps(REWRITE, indent=2) + "\n```",
+    "malformed": "```json\n{'prediction': 'PIN_RESET', \"explanation\": \"missing brace\"\n```",
+    "no_json": "I cannot classify this inquiry.",
+}
+
+
+def legacy_load_json_from_llm_result(text):
+    """The previous implementation: greedy fence regex, repair_json on every block"""
+    pattern = r"```(?:json)?\s*([\s\S]*)```"
+    matches = re.findall(pattern, text, re.DOTALL)
+    if not matches:
+        return None
+    for json_text in matches:
+        good_json_string = repair_json(json_text)
+        try:
+            return json.loads(good_json_string)
+        except json.JSONDecodeError:
+            continue
+    return None
+
+
+def time_per_call_us(function, text, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function(text)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def run_benchmark(repeat=10000):
+    """
+    Time both parsers on every corpus entry.
+
+    Returns:
+        list: One result per response shape
+    """
+    results = []
+    for name, text in CORPUS.items():
+        parsed = parse_llm_json(text)
+        legacy_us = time_per_call_us(legacy_load_json_from_llm_result, text, repeat)
+        layered_us = time_per_call_us(parse_llm_json, text, repeat)
+        results.append({
+            "shape": name,
+            "chars": len(text),
+            "method": parsed.method,
+            "legacy_parsed": legacy_load_json_from_llm_result(text) is not None,
+            "legacy_us": round(legacy_us, 2),
+            "layered_us": round(layered_us, 2),
+            "speedup": round(legacy_us / layered_us, 1) if layered_us > 0 else None,
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JSON extraction from model responses")
+    parser.add_argument("--repeat", type=int, default=10000, help="Calls per response shape")
+    args = parser.parse_args()
+    print(json.dumps(run_benchmark(args.repeat), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
\ No newline at end of file
@@ -0,0 +1,251 @@
+"""
+Benchmark of the evaluate -> critique -> rewrite pipeline on synthetic suites.
+
+Generates test suites in the test_cases.json schema (prompt_template +
+test_cases) and runs execute_test_cases, load_json_from_llm_result,
+evaluate_test_results and PromptOptimizer.generate_critique_prompt against the
+mock Converse backend. Results are printed as JSON (one object per suite size)
+with throughput, per-call p50/p99 latency, peak RSS and per-stage wall time.
+
+    python -m benchmarks.bench_pipeline --sizes 100,1000,10000 --latency-ms 5
+    python -m benchmarks.bench_pipeline --sizes 1000000 --latency-ms 0 --max-concurrency 256
+
+Each size runs in its own subprocess by default so peak RSS is per size.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# Allow running as a script from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.evaluation.executor import execute_with_engine
+from src.inference.backends import set_backend
+from src.inference.mock_server import MockConverseBackend, default_responder
+from src.prompt_optimization.error_analysis_with_reasoning import PromptOptimizer
+from src.utils.evaluation import evaluate_test_results
+from src.utils.parsers import load_json_from_llm_result
+
+DEFAULT_TEMPLATE_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "data", "test_cases.json"
+)
+
+LABEL_PHRASES = {
+    "ACKNOWLEDGMENT": ["thanks a lot for the help", "just wanted to say hello", "appreciate the quick answer"],
+    "PASSWORD_RESET": ["I forgot my online banking password", "my login keeps saying the password is wrong"],
+    "CONTACT_INFO_UPDATE": ["I moved and need to change my address", "please update my phone number"],
+    "PIN_RESET": ["I need a new PIN for my debit card", "my card PIN is locked after three tries"],
+    "TRANSACTION_STATUS": ["my transfer from Monday is still pending", "where is the payment I sent yesterday"],
+    "AUTHENTICATION_SETUP": ["how do I turn on fingerprint login", "I want to set up two-factor authentication"],
+    "CARD_DISPUTE": ["there is a charge I never made", "I was billed twice by a store"],
+    "ESCALATION": ["someone got into my account", "I need a manager, this is urgent"],
+    "IN_SCOPE": ["what are the fees on a savings account", "do you offer car loans"],
+    "OUT_OF_SCOPE": ["what's the weather tomorrow", "can you recommend a pizza place"],
+}
+FILLERS = ["", "Hi there, ", "Quick question: ", "Hello, ", "Sorry to bother you, "]
+SUFFIXES = ["", " Thanks.", " Can you help?", " It's been a few days.", " Please advise."]
+
+
+def generate_suite(size, seed=0, template_file=DEFAULT_TEMPLATE_FILE):
+    """
+    Generate a synthetic test suite in the test_cases.json schema.
+
+    Args:
+        size (int): Number of test cases
+        seed (int): Random seed
+        template_file (str): Test file whose prompt_template is reused
+
+    Returns:
+        dict: {"prompt_template": ..., "test_cases": [{"user_question", "ground_truth"}, ...]}
+    """
+    with open(template_file, "r") as f:
+        prompt_template = json.load(f)["prompt_template"]
+
+    rng = random.Random(seed)
+    labels = list(LABEL_PHRASES)
+    test_cases = []
+    for case_number in range(size):
+        label = rng.choice(labels)
+        question = (rng.choice(FILLERS) + rng.choice(LABEL_PHRASES[label])
+                    + rng.choice(SUFFIXES) + f" (ref {case_number})")
+        test_cases.append({"user_question": question, "ground_truth": label})
+    return {"prompt_template": prompt_template, "test_cases": test_cases}
+
+
+class LatencyRecordingBackend(MockConverseBackend):
+    """Mock backend that records the wall time of every call"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.latencies = []
+        self._latency_lock = threading.Lock()
+
+    def converse(self, **request):
+        start = time.perf_counter()
+        try:
+            return super().converse(**request)
+        finally:
+            with self._latency_lock:
+                self.latencies.append(time.perf_counter() - start)
+
+    async def converse_async(self, **request):
+        start = time.perf_counter()
+        try:
+            return await super().converse_async(**request)
+        finally:
+            self.latencies.append(time.perf_counter() - start)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))
+    return ordered[index]
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MiB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_benchmark(size, latency_ms=5.0, latency_distribution="lognormal", engine="threads",
+                  max_concurrency=None, throttle_rate=0.0, seed=0):
+    """
+    Run the pipeline stages on one synthetic suite.
+
+    Returns:
+        dict: Machine-readable benchmark result for this suite size
+    """
+    stage_seconds = {}
+
+    start = time.perf_counter()
+    data = generate_suite(size, seed=seed)
+    stage_seconds["generate_suite"] = time.perf_counter() - start
+
+    backend = LatencyRecordingBackend(
+        latency_ms=latency_ms,
+        latency_distribution=latency_distribution,
+        throttle_rate=throttle_rate,
+        seed=seed,
+    )
+    set_backend(backend)
+
+    start = time.perf_counter()
+    results = execute_with_engine(data, "mock.model", engine=engine, max_concurrency=max_concurrency)
+    stage_seconds["execute_test_cases"] = time.perf_counter() - start
+
+    # Parse the same kind of responses the executor parses, without the call overhead
+    rng = random.Random(seed)
+    responses = [
+        default_responder({"messages": [{"content": [{"text": data["prompt_template"] + case["user_question"]}]}]}, rng)
+        for case in data["test_cases"]
+    ]
+    start = time.perf_counter()
+    for response_text in responses:
+        load_json_from_llm_result(response_text)
+    stage_seconds["load_json_from_llm_result"] = time.perf_counter() - start
+    del responses
+
+    start = time.perf_counter()
+    evaluate_test_results(results)
+    stage_seconds["evaluate_test_results"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    critique_prompt = PromptOptimizer(backend=backend).generate_critique_prompt(results)
+    stage_seconds["generate_critique_prompt"] = time.perf_counter() - start
+
+    execute_seconds = stage_seconds["execute_test_cases"]
+    return {
+        "suite_size": size,
+        "engine": engine,
+        "max_concurrency": max_concurrency,
+        "mock_latency_ms": latency_ms,
+        "mock_latency_distribution": latency_distribution,
+        "throughput_cases_per_s": size / execute_seconds if execute_seconds > 0 else None,
+        "latency_p50_ms": (percentile(backend.latencies, 0.50) or 0) * 1000,
+        "latency_p99_ms": (percentile(backend.latencies, 0.99) or 0) * 1000,
+        "calls": len(backend.latencies),
+        "critique_prompt_chars": len(critique_prompt),
+        "llm_fail": results["stats"]["llm_fail"],
+        "peak_rss_mb": peak_rss_mb(),
+        "stage_seconds": stage_seconds,
+    }
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Benchmark the prompt optimization pipeline")
+    parser.add_argument("--sizes", default="100,1000,10000",
+                        help="Comma-separated suite sizes (100 to 1000000)")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Median mock call latency")
+    parser.add_argument("--latency-distribution", choices=["fixed", "uniform", "lognormal"], default="lognormal")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of throttled mock calls")
+    parser.add_argument("--engine", choices=["threads", "async"], default="threads")
+    parser.add_argument("--max-concurrency", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-isolate", action="store_true",
+                        help="Run all sizes in this process instead of one subprocess per size")
+    parser.add_argument("--write-suite", default=None,
+                        help="Write the generated suite of the first size to this path and exit")
+    parser.add_argument("--output", "-o", default=None, help="Write the JSON results to this file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+
+    if args.write_suite:
+        with open(args.write_suite, "w") as f:
+            json.dump(generate_suite(sizes[0], seed=args.seed), f, indent=2)
+        print(f"Wrote {sizes[0]} test cases to {args.write_suite}", file=sys.stderr)
+        return 0
+
+    results = []
+    for size in sizes:
+        if args.no_isolate or len(sizes) == 1:
+            results.append(run_benchmark(
+                size,
+                latency_ms=args.latency_ms,
+                latency_distribution=args.latency_distribution,
+                engine=args.engine,
+                max_concurrency=args.max_concurrency,
+                throttle_rate=args.throttle_rate,
+                seed=args.seed,
+            ))
+            continue
+
+        # Run each size in a fresh process so peak RSS is measured per size
+        command = [sys.executable, os.path.abspath(__file__), "--sizes", str(size),
+                   "--latency-ms", str(args.latency_ms),
+                   "--latency-distribution", args.latency_distribution,
+                   "--throttle-rate", str(args.throttle_rate),
+                   "--engine", args.engine, "--seed", str(args.seed)]
+        if args.max_concurrency:
+            command += ["--max-concurrency", str(args.max_concurrency)]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            child_output = os.path.join(tmp_dir, "result.json")
+            subprocess.run(command + ["--output", child_output], stdout=subprocess.DEVNULL, check=True)
+            with open(child_output, "r") as f:
+                results.extend(json.load(f))
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -1,11 +1,29 @@
 import json
 import os
 import argparse
+import sys
 import traceback
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from src.evaluation import run_evaluation
+from src.evaluation.population import evaluate_candidates, suite_success_rate
+from src.evaluation.batching import calibrate_batching
+from src.evaluation.distributed import configure_distributed, run_worker, start_local_workers, stop_workers
 from src.prompt_optimization.prompt_rewrite import PromptRewriter
 from src.prompt_optimization.error_analysis_with_reasoning import PromptOptimizer
+from src.prompt_optimization.suggestion_history import make_model_summarizer
+from src.utils.response_cache import configure_response_cache
+from src.utils.rate_limit import configure_rate_limits
+from src.utils.structured_output import configure_known_labels, configure_structured_output
+from src.utils.prompt_layout import configure_prompt_caching
+from src.inference import BedrockConverseBackend, MockConverseBackend, RoutingConverseBackend, load_endpoints, set_backend
+from src.inference.streaming import print_delta
+from src.utils.checkpoint import RunCheckpoint
+from src.utils.result_store import ResultStore
+from src.utils.result_writer import load_suite_results
+from src.utils.test_data import TestCaseSource, load_test_data, read_prompt_template, suite_paths
+from src.evaluation.stream_evaluation import load_sampled_results
+from src.utils.telemetry import configure_span_exporter, span
     
 def parse_arguments():
     """Parse command line arguments."""
@@ -17,7 +35,8 @@ def parse_arguments():
     
     parser.add_argument('--test-file', '-t', 
                         default="./src/data/test_cases.json",
-                        help='Path to test cases JSON file')
+                        help='Test suite: a JSON file, a JSONL file (one case per line, optional '
+                             'header line with the prompt_template) or a directory or glob of shards')
     
     parser.add_argument('--results-dir', '-r', 
                         default="./src/results",
@@ -29,13 +48,541 @@ def parse_arguments():
     
     parser.add_argument("--max-iterations", type=int, default=5, help="Maximum optimization iterations")
 
+    parser.add_argument('--resume',
+                        default=None,
+                        metavar='RUN_DIR',
+                        help='Continue an interrupted run from its checkpoint directory')
+
+    parser.add_argument('--backend',
+                        choices=['bedrock', 'mock'],
+                        default='bedrock',
+                        help='Inference backend: Amazon Bedrock or the in-process mock Converse API')
+
+    parser.add_argument('--endpoint-url', default=None,
+                        help='Bedrock endpoint override, e.g. a local mock server (python -m src.inference.mock_server)')
+
+    parser.add_argument('--endpoints-file', default=None,
+                        help='JSON list of weighted {region, model_id, weight, endpoint_url} endpoints to route '
+                             'evaluation traffic across by live latency and throttle rate; with --backend mock '
+                             'each endpoint is a mock with its own latency_ms/throttle_rate/error_rate profile')
+
+    parser.add_argument('--mock-latency-ms', type=float, default=200.0,
+                        help='Median latency of mock backend calls in milliseconds')
+
+    parser.add_argument('--mock-latency-distribution',
+                        choices=['fixed', 'uniform', 'lognormal'],
+                        default='lognormal',
+                        help='Latency distribution of mock backend calls')
+
+    parser.add_argument('--mock-throttle-rate', type=float, default=0.0,
+                        help='Fraction of mock backend calls that are throttled')
+
+    parser.add_argument('--mock-error-rate', type=float, default=0.0,
+                        help='Fraction of mock backend calls that fail with a model error')
+
+    parser.add_argument('--mock-seed', type=int, default=None,
+                        help='Seed for reproducible mock latency and fault injection')
+
+    parser.add_argument('--engine',
+                        choices=['threads', 'async', 'distributed'],
+                        default='threads',
+                        help='Evaluation engine: thread pool, asyncio, or worker processes pulling work units '
+                             'from a queue directory')
+
+    parser.add_argument('--max-concurrency', type=int, default=None,
+                        help='Worker threads (threads engine) or in-flight requests (async engine); '
+                             'per worker process with the distributed engine')
+
+    parser.add_argument('--queue-dir', default=None,
+                        help='Work queue directory of the distributed engine, on a shared mount for workers '
+                             'on other hosts (default: RESULTS_DIR/queue)')
+
+    parser.add_argument('--local-workers', type=int, default=2,
+                        help='Worker processes the distributed engine starts on this host; each gets an '
+                             'equal share of --rpm/--tpm')
+
+    parser.add_argument('--unit-size', type=int, default=25,
+                        help='Test cases per work unit of the distributed engine')
+
+    parser.add_argument('--lease-timeout', type=float, default=60.0,
+                        help='Seconds without a worker heartbeat after which a work unit is reassigned')
+
+    parser.add_argument('--max-unit-attempts', type=int, default=3,
+                        help='Leases a work unit gets before its unfinished cases are recorded as errors')
+
+    parser.add_argument('--worker', default=None, metavar='QUEUE_DIR',
+                        help='Run as a distributed evaluation worker on QUEUE_DIR instead of optimizing; '
+                             'backend, rate limit and cache options apply to this worker, so --rpm/--tpm '
+                             'should be its share of the quota')
+
+    parser.add_argument('--worker-engine',
+                        choices=['threads', 'async'],
+                        default='threads',
+                        help='Engine a distributed worker runs its work units with')
+
+    parser.add_argument('--rpm', type=int, default=None,
+                        help='Requests-per-minute budget per model ID (default: unlimited)')
+
+    parser.add_argument('--tpm', type=int, default=None,
+                        help='Tokens-per-minute budget per model ID (default: unlimited)')
+
+    parser.add_argument('--max-retries', type=int, default=6,
+                        help='Maximum retries of a throttled call, with jittered backoff')
+
+    parser.add_argument('--racing',
+                        action='store_true',
+                        help='Evaluate in stratified minibatches and stop early against the best template so far')
+
+    parser.add_argument('--racing-batch-size', type=int, default=50,
+                        help='Number of test cases per racing minibatch')
+
+    parser.add_argument('--racing-confidence', type=float, default=0.95,
+                        help='Confidence level of the racing success-rate interval')
+
+    parser.add_argument('--racing-min-cases', type=int, default=100,
+                        help='Test cases evaluated before racing may stop early')
+
+    parser.add_argument('--batch-size', type=int, default=1,
+                        help='Test cases packed into one evaluation request, answered as a JSON array '
+                             '(1 sends every case on its own)')
+
+    parser.add_argument('--calibrate-batching', type=int, default=0, metavar='SAMPLE_SIZE',
+                        help='Before optimizing, score this many sampled cases both one per request and '
+                             'batched with --batch-size, and report the accuracy difference')
+
+    parser.add_argument('--no-dedup', action='store_true',
+                        help='Run every test case, even when several share the same question')
+
+    parser.add_argument('--racing-near-duplicate-threshold', type=float, default=None,
+                        help='In racing mode, only run one representative of each cluster of questions '
+                             'at least this similar (estimated Jaccard similarity, e.g. 0.8)')
+
+    parser.add_argument('--population-size', type=int, default=1,
+                        help='Candidate templates rewritten and evaluated per iteration; above 1 runs a beam search')
+
+    parser.add_argument('--beam-width', type=int, default=2,
+                        help='Number of best templates kept between iterations in beam search')
+
+    parser.add_argument('--stream', action='store_true',
+                        help='Stream critique and rewrite responses and stop at the closing </suggestion> '
+                             'tag or JSON fence (with --verbose the text is shown live)')
+
+    parser.add_argument('--structured-output', action='store_true',
+                        help='Force evaluation and rewrite answers through Converse tool schemas '
+                             '(prediction restricted to the template labels) instead of parsing JSON text')
+
+    parser.add_argument('--prompt-caching', action='store_true',
+                        help='Send the case-independent template prefix before a Converse cachePoint '
+                             'and keep rewritten templates in that layout')
+
+    parser.add_argument('--no-move-instructions', action='store_true',
+                        help='With --prompt-caching, leave instructions that follow the question '
+                             'placeholder where they are instead of moving them into the cached prefix')
+
+    parser.add_argument('--critique-token-budget', type=int, default=8000,
+                        help='Approximate token budget of the evaluation results sent to the critique '
+                             'model (0 sends every test case verbatim)')
+
+    parser.add_argument('--critique-mode', choices=['single', 'sharded'], default='single',
+                        help='Critique all failures in one call, or map-reduce over ground-truth class shards')
+
+    parser.add_argument('--max-shards', type=int, default=16,
+                        help='Maximum number of critique shards in sharded critique mode')
+
+    parser.add_argument('--shard-thinking-budget', type=int, default=1024,
+                        help='Thinking token budget of each shard critique call')
+
+    parser.add_argument('--history-keep-recent', type=int, default=3,
+                        help='Number of recent critiques kept verbatim in the suggestion history')
+
+    parser.add_argument('--history-max-tokens', type=int, default=4000,
+                        help='Approximate token ceiling of the suggestion history in the critique prompt')
+
+    parser.add_argument('--history-summary-model', default=None,
+                        help='Model used to summarize older suggestions (default: local summary, no model call)')
+
+    parser.add_argument('--results-format', choices=['jsonl', 'arrow', 'parquet'], default='jsonl',
+                        help='Also save each evaluation as a compact columnar file (requires pyarrow), '
+                             'which later stages load instead of the JSONL results')
+
+    parser.add_argument('--stream-suite', action='store_true',
+                        help='Read the test suite from disk during each evaluation instead of loading it, '
+                             'keeping memory independent of the suite size (threads or async engine, JSONL results)')
+    parser.add_argument('--stream-sample-size', type=int, default=2000,
+                        help='Case results of a streamed suite kept for the critique (uniform sample)')
+
+    parser.add_argument('--cache-file',
+                        default=None,
+                        help='SQLite file for the response cache (default: <results-dir>/response_cache.sqlite)')
+
+    parser.add_argument('--no-cache',
+                        action='store_true',
+                        help='Disable the response cache')
+
     return parser.parse_args()
 
 
+def save_columnar_results(args, results, results_file, test_data):
+    """
+    Save a columnar copy of evaluation results next to their JSONL file.
+
+    Returns:
+        str: Path of the columnar file, or results_file itself with --results-format jsonl
+    """
+    if args.results_format == 'jsonl' or results is None:
+        return results_file
+    columnar_file = os.path.splitext(results_file)[0] + "." + args.results_format
+    ResultStore.from_suite_results(results, test_data.get('test_cases')).save(columnar_file)
+    return columnar_file
+
+
+def run_iterations(args, optimizer, rewriter, test_data, checkpoint):
+    """Run the evaluate -> critique -> rewrite loop on one template at a time."""
+    state = checkpoint.state
+
+    # Run optimization iterations, continuing from the checkpointed iteration and stage
+    for i in range(state["iteration"], args.max_iterations):
+        print(f"\n\n======== ITERATION {i+1}/{args.max_iterations} ========")
+        
+        # Get the current prompt template and ensure it is in test data
+        current_prompt_template = state["current_prompt_template"]
+        test_data['prompt_template'] = current_prompt_template
+        results = None
+        
+        try:
+            if state["stage"] == "evaluation":
+                with span("evaluation", iteration=i) as evaluation_span:
+                    # Record the results file before starting so an interrupted evaluation can resume it
+                    results_file = state["pending"].get("results_file") or checkpoint.path_for(f"test_results_iteration_{i}.jsonl")
+                    checkpoint.advance("evaluation", pending={"results_file": results_file})
+
+                    # Run evaluation
+                    print("\nStarting evaluation...")
+                    start_time = datetime.now()
+                
+                    # Run evaluation with current prompt template
+                    results = run_evaluation(
+                        test_data, args.model, checkpoint.run_dir,
+                        racing=args.racing,
+                        baseline_success_rate=state["best_success_rate"],
+                        racing_batch_size=args.racing_batch_size,
+                        racing_confidence=args.racing_confidence,
+                        racing_min_cases=args.racing_min_cases,
+                        engine=args.engine,
+                        max_concurrency=args.max_concurrency,
+                        resume_file=results_file,
+                        dedup=not args.no_dedup,
+                        near_duplicate_threshold=args.racing_near_duplicate_threshold,
+                        request_batch_size=args.batch_size,
+                        stream_sample_size=args.stream_sample_size,
+                    )
+                
+                    # Print summary
+                    elapsed_time = datetime.now() - start_time
+                    print("\nEvaluation complete!")
+                    print(f"Time taken: {elapsed_time}")
+                    print(f"Total test cases: {results['stats']['total']}")
+                    print(f"Failed calls: {results['stats']['llm_fail']}")
+                    print(f"Cache hits/misses: {results['stats']['cache_hits']}/{results['stats']['cache_misses']}")
+                    print(f"Deduplicated cases: {results['stats']['deduplicated']} "
+                          f"(ratio {results['stats']['dedup_ratio']:.2%})")
+                    if args.batch_size > 1:
+                        print(f"Batched requests: {results['stats']['batch_requests']} "
+                              f"({args.batch_size} cases each), single-case retries: {results['stats']['batch_retries']}")
+                    wall_latency = results['stats']['latency_ms']['wall']
+                    if wall_latency:
+                        print(f"Call latency p50/p99: {wall_latency['p50']:.0f}/{wall_latency['p99']:.0f} ms")
+                    print(f"Tokens in/out: {results['stats']['tokens']['input']}/{results['stats']['tokens']['output']}, "
+                          f"throttle retries: {results['stats']['retries']}")
+                    if 'endpoints' in results['stats']:
+                        print("Cases per endpoint: " + ", ".join(
+                            f"{name}: {count}" for name, count in results['stats']['endpoints'].items()))
+                    if args.prompt_caching:
+                        print(f"Prompt cache tokens read/written: {results['stats']['tokens']['cache_read']}/"
+                              f"{results['stats']['tokens']['cache_write']}")
+                    evaluation_span.set_attribute("total", results['stats']['total'])
+                    evaluation_span.set_attribute("tokens", results['stats']['tokens'])
+                    evaluation_span.set_attribute("latency_ms", results['stats']['latency_ms'])
+                
+                    # Print success rate if available
+                    success_rate = suite_success_rate(results)
+                    if success_rate is not None:
+                        print(f"Task success rate: {success_rate:.2f}%")
+                        if 'scores' in results['stats']:
+                            print(f"Macro precision/recall/F1: {results['stats']['scores']['macro']['precision']:.3f}/"
+                                  f"{results['stats']['scores']['macro']['recall']:.3f}/"
+                                  f"{results['stats']['scores']['macro']['f1']:.3f}")
+                        if state["best_success_rate"] is None or success_rate / 100 > state["best_success_rate"]:
+                            state["best_success_rate"] = success_rate / 100
+                            state["best_template"] = {
+                                "template": current_prompt_template,
+                                "success_rate": success_rate,
+                                "iteration": i,
+                            }
+                        # Score the previous critique by the template it produced
+                        if optimizer.history.record_outcome(i - 1, success_rate):
+                            checkpoint.save(suggestion_history=optimizer.history.to_dict())
+
+                    if 'racing' in results['stats']:
+                        racing_stats = results['stats']['racing']
+                        print(f"Racing decision: {racing_stats['decision']} after "
+                              f"{racing_stats['cases_evaluated']}/{racing_stats['suite_size']} cases")
+
+                    call_metrics = {
+                        "evaluation": {key: results['stats'][key]
+                                       for key in ("latency_ms", "tokens", "retries", "endpoints")
+                                       if key in results['stats']},
+                    }
+                    checkpoint.advance("feedback", pending={
+                        "results_file": results_file,
+                        "columnar_file": save_columnar_results(args, results, results_file, test_data),
+                        "success_rate": success_rate,
+                        "call_metrics": call_metrics,
+                    })
+
+            if state["stage"] == "feedback":
+                with span("feedback", iteration=i) as feedback_span:
+                    if results is None and args.stream_suite:
+                        results = load_sampled_results(state["pending"]["results_file"], args.stream_sample_size)
+                    elif results is None:
+                        results = load_suite_results(state["pending"].get("columnar_file")
+                                                     or state["pending"]["results_file"])
+
+                    # Get feedback on the current results
+                    print("\nGenerating feedback for prompt improvement...")
+                    feedback = optimizer.get_prompt_feedback(results, iteration=i)
+                    print(f"Feedback generated.")
+
+                    call_metrics = dict(state["pending"].get("call_metrics", {}), critique=optimizer.last_call_metrics)
+                    feedback_span.set_attribute("call_metrics", optimizer.last_call_metrics)
+                    checkpoint.advance(
+                        "rewrite",
+                        pending=dict(state["pending"], feedback=feedback, call_metrics=call_metrics),
+                        suggestion_history=optimizer.history.to_dict(),
+                    )
+
+            if state["stage"] == "rewrite":
+                with span("rewrite", iteration=i) as rewrite_span:
+                    feedback = state["pending"]["feedback"]
+
+                    # Generate improved prompt
+                    print("Generating improved prompt...")
+                    improved_result = rewriter.improving_prompt_with_feedback(
+                        current_template=current_prompt_template,
+                        critique_feedbacks=feedback
+                    )
+
+                    # Get the improved template
+                    improved_template = improved_result.get('improved_template', current_prompt_template)
+                    print(f"Improved prompt created.")
+
+                    # Create iteration data dictionary
+                    iteration_data = {
+                        "iteration": i,
+                        "current_prompt_template": current_prompt_template,
+                        "success_rate": state["pending"].get("success_rate"),
+                        "feedback": feedback,
+                        "improved_result": improved_result,
+                        "call_metrics": dict(state["pending"].get("call_metrics", {}), rewrite=rewriter.last_call_metrics)
+                    }
+                
+                    rewrite_span.set_attribute("call_metrics", rewriter.last_call_metrics)
+                    
+                    # Add to the list of all iterations and update current prompt template for next iteration
+                    checkpoint.complete_iteration(iteration_data, current_prompt_template=improved_template)
+                
+                    print("\n===== IMPROVED TEMPLATE =====")
+                    print(improved_template)
+                    print("============================\n")
+                
+        except Exception as e:
+            print(f"Error during iteration {i+1}: {str(e)}")
+            if args.verbose:
+                traceback.print_exc()
+            # Continue to next iteration with the same template
+            checkpoint.save(iteration=i + 1, stage="evaluation", pending={})
+            continue
+
+
+def rank_beam(members, beam_width):
+    """Keep the beam_width members with the highest success rate (unscored members last)."""
+    ranked = sorted(members, key=lambda member: -1 if member["success_rate"] is None else member["success_rate"],
+                    reverse=True)
+    return ranked[:beam_width]
+
+
+def run_population_search(args, optimizer, rewriter, test_data, checkpoint):
+    """
+    Run a beam search over prompt templates.
+
+    Each iteration critiques every template in the beam, rewrites
+    --population-size candidates from the critiques in parallel (varied
+    temperature), evaluates all candidates together through one shared worker
+    pool and keeps the --beam-width best templates seen so far.
+    """
+    state = checkpoint.state
+    state.setdefault("beam", [])
+
+    for i in range(state["iteration"], args.max_iterations):
+        print(f"\n\n======== ITERATION {i+1}/{args.max_iterations} (beam search) ========")
+
+        try:
+            # Seed the beam with the initial template
+            if not state["beam"]:
+                with span("evaluation", iteration=i, candidates=1):
+                    print("\nEvaluating the initial template...")
+                    seed_file = checkpoint.path_for("test_results_initial.jsonl")
+                    seed_results = evaluate_candidates(
+                        test_data, [state["current_prompt_template"]], args.model, checkpoint.run_dir,
+                        output_files=[seed_file],
+                        max_workers=args.max_concurrency or 8,
+                        engine=args.engine,
+                        dedup=not args.no_dedup,
+                        request_batch_size=args.batch_size,
+                    )[0]
+                    if seed_results is None:
+                        raise RuntimeError("Evaluation of the initial template failed")
+                    seed_rate = suite_success_rate(seed_results)
+                    print(f"Task success rate: {seed_rate:.2f}%")
+                    checkpoint.save(
+                        beam=[{"template": state["current_prompt_template"], "success_rate": seed_rate,
+                               "results_file": save_columnar_results(args, seed_results, seed_file, test_data),
+                               "iteration": i}],
+                        best_success_rate=seed_rate / 100,
+                        best_template={"template": state["current_prompt_template"],
+                                       "success_rate": seed_rate, "iteration": i},
+                    )
+
+            # Critique every beam member and rewrite candidates from the critiques
+            if "candidates" not in state["pending"]:
+                with span("feedback", iteration=i, beam=len(state["beam"])) as feedback_span:
+                    critiques = []
+                    for member in state["beam"]:
+                        print(f"\nGenerating feedback for a beam template ({member['success_rate']:.2f}%)...")
+                        results = load_suite_results(member["results_file"])
+                        critiques.append(optimizer.get_prompt_feedback(results, iteration=i))
+                    feedback_span.set_attribute("call_metrics", optimizer.last_call_metrics)
+
+                with span("rewrite", iteration=i, candidates=args.population_size):
+                    # Spread the candidates over the beam, best members first
+                    counts = [args.population_size // len(critiques) + (position < args.population_size % len(critiques))
+                              for position in range(len(critiques))]
+
+                    def rewrite(position):
+                        return rewriter.generate_candidates(
+                            state["beam"][position]["template"], critiques[position],
+                            num_candidates=counts[position]
+                        ) if counts[position] else []
+
+                    print(f"Generating {args.population_size} candidate templates...")
+                    with ThreadPoolExecutor(max_workers=len(critiques)) as rewrite_pool:
+                        rewrites = list(rewrite_pool.map(rewrite, range(len(critiques))))
+
+                    candidates = []
+                    seen_templates = {member["template"] for member in state["beam"]}
+                    for position, parent_candidates in enumerate(rewrites):
+                        for candidate in parent_candidates:
+                            if candidate["improved_template"] in seen_templates:
+                                continue
+                            seen_templates.add(candidate["improved_template"])
+                            candidates.append({
+                                "template": candidate["improved_template"],
+                                "root_cause": candidate.get("root_cause", ""),
+                                "temperature": candidate["temperature"],
+                                "parent": position,
+                                "call_metrics": candidate["call_metrics"],
+                            })
+                    print(f"{len(candidates)} distinct candidates")
+                    checkpoint.save(pending={"candidates": candidates, "critiques": critiques})
+
+            # Evaluate all candidates together through one shared worker pool
+            with span("evaluation", iteration=i, candidates=len(state["pending"]["candidates"])) as evaluation_span:
+                candidates = state["pending"]["candidates"]
+                output_files = [checkpoint.path_for(f"test_results_iteration_{i}_candidate_{position}.jsonl")
+                                for position in range(len(candidates))]
+                print(f"\nEvaluating {len(candidates)} candidates...")
+                start_time = datetime.now()
+                candidate_results = evaluate_candidates(
+                    test_data, [candidate["template"] for candidate in candidates], args.model, checkpoint.run_dir,
+                    output_files=output_files,
+                    max_workers=args.max_concurrency or 8,
+                    engine=args.engine,
+                    racing=args.racing,
+                    baseline_success_rate=state["best_success_rate"],
+                    racing_batch_size=args.racing_batch_size,
+                    racing_confidence=args.racing_confidence,
+                    racing_min_cases=args.racing_min_cases,
+                    dedup=not args.no_dedup,
+                    near_duplicate_threshold=args.racing_near_duplicate_threshold,
+                    request_batch_size=args.batch_size,
+                )
+                print(f"Candidates evaluated in {datetime.now() - start_time}")
+
+                members = list(state["beam"])
+                for candidate, results, results_file in zip(candidates, candidate_results, output_files):
+                    candidate["success_rate"] = suite_success_rate(results)
+                    candidate["results_file"] = results_file
+                    rate = "failed" if candidate["success_rate"] is None else f"{candidate['success_rate']:.2f}%"
+                    print(f"  Candidate (T={candidate['temperature']}, parent {candidate['parent']}): {rate}")
+                    if candidate["success_rate"] is not None:
+                        members.append({"template": candidate["template"], "success_rate": candidate["success_rate"],
+                                        "results_file": save_columnar_results(args, results, results_file, test_data),
+                                        "iteration": i})
+                beam = rank_beam(members, args.beam_width)
+                evaluation_span.set_attribute("beam_success_rates", [member["success_rate"] for member in beam])
+
+                # Score this iteration's critiques by the best candidate they produced
+                scored = [candidate["success_rate"] for candidate in candidates if candidate["success_rate"] is not None]
+                if scored:
+                    optimizer.history.record_outcome(i, max(scored))
+
+                best_template = state.get("best_template")
+                if beam and (best_template is None or beam[0]["success_rate"] > best_template["success_rate"]):
+                    best_template = {"template": beam[0]["template"], "success_rate": beam[0]["success_rate"],
+                                     "iteration": beam[0]["iteration"]}
+                print(f"Best success rate so far: {best_template['success_rate']:.2f}%")
+
+                iteration_data = {
+                    "iteration": i,
+                    "feedback": state["pending"].get("critiques", []),
+                    "candidates": [{key: value for key, value in candidate.items() if key != "results_file"}
+                                   for candidate in candidates],
+                    "beam": [{"template": member["template"], "success_rate": member["success_rate"]}
+                             for member in beam],
+                    "best_success_rate": best_template["success_rate"],
+                }
+                checkpoint.complete_iteration(
+                    iteration_data,
+                    beam=beam,
+                    best_template=best_template,
+                    best_success_rate=best_template["success_rate"] / 100,
+                    current_prompt_template=beam[0]["template"],
+                    suggestion_history=optimizer.history.to_dict(),
+                )
+
+        except Exception as e:
+            print(f"Error during iteration {i+1}: {str(e)}")
+            if args.verbose:
+                traceback.print_exc()
+            # Continue to next iteration with the same beam
+            checkpoint.save(iteration=i + 1, stage="evaluation", pending={})
+            continue
+
+
 def main():
     """Main function to run the evaluation."""
     # Parse command line arguments
     args = parse_arguments()
+
+    # An interrupted run keeps its model and test file
+    if args.resume:
+        try:
+            checkpoint = RunCheckpoint.load(args.resume)
+        except Exception as e:
+            print(f"Error loading checkpoint: {str(e)}")
+            return 1
+        args.model = checkpoint.state["model_id"]
+        args.test_file = checkpoint.state["test_file"]
     
     # Print configuration
     print(f"Configuration:")
@@ -44,113 +591,221 @@ def main():
     print(f"  Results directory: {args.results_dir}")
     print(f"  Verbose mode: {'Enabled' if args.verbose else 'Disabled'}")
     print(f"  Max iterations: {args.max_iterations}")
+    print(f"  Evaluation engine: {args.engine}")
+    print(f"  Racing mode: {'Enabled' if args.racing else 'Disabled'}")
+    print(f"  Streaming: {'Enabled' if args.stream else 'Disabled'}")
+    print(f"  Structured output: {'Enabled' if args.structured_output else 'Disabled'}")
+    print(f"  Results format: {args.results_format}")
+    print(f"  Prompt caching: {'Enabled' if args.prompt_caching else 'Disabled'}")
+    print(f"  Cases per request: {args.batch_size}")
+    print(f"  Streamed suite: {'Enabled' if args.stream_suite else 'Disabled'}")
+
+    # A streamed suite is evaluated in one pass on this process; these modes need it in memory
+    if args.stream_suite:
+        unsupported = [flag for flag, used in (
+            ("--racing", args.racing),
+            ("--population-size", args.population_size > 1),
+            ("--calibrate-batching", args.calibrate_batching),
+            ("--engine " + args.engine, args.engine == 'distributed'),
+            ("--results-format " + args.results_format, args.results_format != 'jsonl'),
+        ) if used]
+        if unsupported:
+            print(f"Error: --stream-suite cannot be combined with {', '.join(unsupported)}")
+            return 1
 
-    # Initialize optimizer and rewriter
-    optimizer = PromptOptimizer()
-    rewriter = PromptRewriter()
-    
     # Ensure results directory exists
     os.makedirs(args.results_dir, exist_ok=True)
 
-    # Create a list to store iteration data
-    iterations_data = []
+    # Configure the inference backend shared by the evaluation, critique and rewrite calls
+    if args.backend == 'mock':
+        backend = MockConverseBackend(
+            latency_ms=args.mock_latency_ms,
+            latency_distribution=args.mock_latency_distribution,
+            throttle_rate=args.mock_throttle_rate,
+            error_rate=args.mock_error_rate,
+            seed=args.mock_seed,
+        )
+    else:
+        backend = BedrockConverseBackend(endpoint_url=args.endpoint_url)
+    if args.endpoints_file:
+        # Only the evaluation model is routed; critique and rewrite calls keep their model on the plain backend
+        backend = router = RoutingConverseBackend(load_endpoints(
+            args.endpoints_file,
+            mock=args.backend == 'mock',
+            latency_ms=args.mock_latency_ms,
+            latency_distribution=args.mock_latency_distribution,
+            throttle_rate=args.mock_throttle_rate,
+            error_rate=args.mock_error_rate,
+            seed=args.mock_seed,
+        ), model_id=args.model, fallback=backend, seed=args.mock_seed)
+        print(f"  Routing {args.model} across {len(router.endpoints)} endpoints: "
+              + ", ".join(f"{endpoint.name} (weight {endpoint.weight:g})" for endpoint in router.endpoints))
+    set_backend(backend)
+    print(f"  Backend: {args.backend}" + (f" ({args.endpoint_url})" if args.endpoint_url else ""))
+
+    # Configure per-model rate limits; the engine's worker count (--max-concurrency or the engine
+    # default) is the ceiling of the adaptive limit
+    engine = args.worker_engine if args.worker else args.engine
+    max_concurrency = args.max_concurrency or (64 if engine == 'async' else 8)
+    configure_rate_limits(
+        requests_per_minute=args.rpm,
+        tokens_per_minute=args.tpm,
+        max_concurrency=max_concurrency,
+        max_retries=args.max_retries,
+    )
+    print(f"  Rate limits: RPM={args.rpm or 'unlimited'}, TPM={args.tpm or 'unlimited'}, "
+          f"adaptive concurrency up to {max_concurrency}, max retries={args.max_retries}")
+
+    # Configure the persistent response cache shared by the evaluation and rewrite calls
+    cache_file = args.cache_file or os.path.join(args.results_dir, "response_cache.sqlite")
+    configure_response_cache(db_path=cache_file, enabled=not args.no_cache)
+    print(f"  Response cache: {'Disabled' if args.no_cache else cache_file}")
+
+    # Read evaluation answers from toolUse blocks instead of ```json text
+    configure_structured_output(args.structured_output)
 
-    # Ensure test file exists
-    if not os.path.exists(args.test_file):
+    # Split evaluation prompts into a cached static prefix and the per-case question
+    configure_prompt_caching(args.prompt_caching, move_instructions=not args.no_move_instructions)
+
+    # Serve work units of a distributed coordinator instead of optimizing
+    if args.worker:
+        run_worker(args.worker, engine=args.worker_engine, max_concurrency=args.max_concurrency)
+        return 0
+
+    # Initialize optimizer and rewriter
+    optimizer = PromptOptimizer(
+        critique_token_budget=args.critique_token_budget or None,
+        history_keep_recent=args.history_keep_recent,
+        history_max_tokens=args.history_max_tokens,
+        critique_mode=args.critique_mode,
+        max_shards=args.max_shards,
+        shard_thinking_budget=args.shard_thinking_budget,
+        history_summarizer=make_model_summarizer(args.history_summary_model) if args.history_summary_model else None,
+        stream=args.stream,
+        on_delta=print_delta if args.verbose else None,
+    )
+    rewriter = PromptRewriter(stream=args.stream, on_delta=print_delta if args.verbose else None,
+                              structured_output=args.structured_output,
+                              cache_friendly=args.prompt_caching and not args.no_move_instructions)
+
+    # Restore the suggestion history of an interrupted run
+    if args.resume:
+        optimizer.suggestion_history = checkpoint.state["suggestion_history"]
+        print(f"Resuming run {checkpoint.run_dir} at iteration {checkpoint.state['iteration']+1}, "
+              f"stage '{checkpoint.state['stage']}'")
+
+    # Ensure the test file (or every shard) exists
+    test_paths = suite_paths(args.test_file)
+    if not test_paths or not all(os.path.exists(path) for path in test_paths):
         print(f"Error: Test file '{args.test_file}' not found")
         return 1
     
-    # Load initial test cases
+    # Load initial test cases, or only the template when the suite is streamed from disk
     try:
-        with open(args.test_file, 'r') as file:
-            test_data = json.load(file)
-        print(f"Loaded {len(test_data.get('test_cases', []))} test cases")
-        
-        # Get the initial prompt template
-        current_prompt_template = test_data.get('prompt_template')
+        if args.stream_suite:
+            test_data = {"prompt_template": read_prompt_template(args.test_file),
+                         "test_source": TestCaseSource(args.test_file)}
+            print(f"Streaming test cases from {len(test_paths)} file(s)")
+        else:
+            test_data = load_test_data(args.test_file)
+            print(f"Loaded {len(test_data['test_cases'])} test cases")
         
-    except json.JSONDecodeError:
-        print(f"Error: Invalid JSON in test file '{args.test_file}'")
+    except ValueError as e:
+        print(f"Error: Invalid JSON in test file '{args.test_file}': {str(e)}")
         return 1
     except Exception as e:
         print(f"Error loading test file: {str(e)}")
         return 1
 
-    # Run optimization iterations
-    for i in range(0, args.max_iterations):
-        print(f"\n\n======== ITERATION {i+1}/{args.max_iterations} ========")
-        
-        # Ensure current prompt template is in test data
-        test_data['prompt_template'] = current_prompt_template
-        
-        # Run evaluation
-        print("\nStarting evaluation...")
-        start_time = datetime.now()
-        
-        try:
-            
-            # Run evaluation with current prompt template
-            results = run_evaluation(test_data, args.model, args.results_dir)
-            
-            # Print summary
-            elapsed_time = datetime.now() - start_time
-            print("\nEvaluation complete!")
-            print(f"Time taken: {elapsed_time}")
-            print(f"Total test cases: {results['stats']['total']}")
-            print(f"Failed calls: {results['stats']['llm_fail']}")
-            
-            # Print success rate if available
-            if 'task_succeed' in results['stats']:
-                success_rate = results['stats']['task_succeed'] / results['stats']['total'] * 100
-                print(f"Task success rate: {success_rate:.2f}%")
-            
-
-            # Get feedback on the current results
-            print("\nGenerating feedback for prompt improvement...")
-            feedback = optimizer.get_prompt_feedback(results, iteration=i)
-            print(f"Feedback generated.")
-
-            # Generate improved prompt
-            print("Generating improved prompt...")
-            improved_result = rewriter.improving_prompt_with_feedback(
-                current_template=current_prompt_template,
-                critique_feedbacks=feedback
+    # Only force predictions into the template's labels when those cover the suite's ground truth
+    if args.structured_output:
+        configure_known_labels(test_case.get("ground_truth", "") for test_case in
+                               (test_data["test_source"] if args.stream_suite else test_data["test_cases"]))
+
+    if not args.resume:
+        checkpoint = RunCheckpoint.create(args.results_dir, {
+            "model_id": args.model,
+            "test_file": args.test_file,
+            "current_prompt_template": test_data.get('prompt_template'),
+            "suggestion_history": optimizer.history.to_dict(),
+            # Best success rate so far (0-1), used as the racing baseline
+            "best_success_rate": None,
+        })
+        print(f"Run directory: {checkpoint.run_dir}")
+
+    state = checkpoint.state
+
+    # Export stage timing spans of this run to a local file
+    configure_span_exporter(checkpoint.path_for("spans.jsonl"))
+
+    # Measure how batching moves accuracy before relying on it
+    if args.calibrate_batching and args.batch_size > 1:
+        with span("batch_calibration", batch_size=args.batch_size):
+            print(f"\nCalibrating batched scoring on {args.calibrate_batching} cases...")
+            calibration = calibrate_batching(
+                dict(test_data, prompt_template=state["current_prompt_template"]), args.model,
+                batch_size=args.batch_size,
+                sample_size=args.calibrate_batching,
+                max_workers=args.max_concurrency or 8,
             )
+            with open(checkpoint.path_for("batch_calibration.json"), 'w') as f:
+                json.dump(calibration, f, indent=2)
+            print(f"Single-case accuracy: {calibration['single_accuracy']:.2%} "
+                  f"({calibration['single_requests']} requests), batched accuracy: "
+                  f"{calibration['batched_accuracy']:.2%} ({calibration['batched_requests']} requests), "
+                  f"agreement: {calibration['agreement']:.2%}")
 
-            # Get the improved template
-            improved_template = improved_result.get('improved_template', current_prompt_template)
-            print(f"Improved prompt created.")
-
-            # Create iteration data dictionary
-            iteration_data = {
-                "iteration": i,
-                "current_prompt_template": current_prompt_template,
-                "success_rate": success_rate,
-                "feedback": feedback,
-                "improved_result": improved_result
-            }
-            
-            # Add to the list of all iterations
-            iterations_data.append(iteration_data)
-            
-            print("\n===== IMPROVED TEMPLATE =====")
-            print(improved_template)
-            print("============================\n")
-            # Update current prompt template for next iteration
-            current_prompt_template = improved_template
-                
-        except Exception as e:
-            print(f"Error during iteration {i+1}: {str(e)}")
-            if args.verbose:
-                traceback.print_exc()
-            # Continue to next iteration
-            continue
+    # Start local workers of the distributed engine; they get this run's backend and cache options
+    workers = []
+    if args.engine == 'distributed':
+        queue_dir = args.queue_dir or os.path.join(args.results_dir, "queue")
+        configure_distributed(queue_dir, unit_size=args.unit_size, lease_timeout=args.lease_timeout,
+                              max_attempts=args.max_unit_attempts)
+        # The workers make the evaluation calls, so they split the rate budget between them
+        # (the last --rpm/--tpm on a command line wins)
+        worker_args = [sys.executable, os.path.abspath(__file__)] + sys.argv[1:] + ['--worker', queue_dir]
+        for flag, budget in (('--rpm', args.rpm), ('--tpm', args.tpm)):
+            if budget:
+                worker_args += [flag, str(max(1, budget // max(1, args.local_workers)))]
+        workers = start_local_workers(queue_dir, args.local_workers, worker_args)
+        print(f"Distributed evaluation on {queue_dir} with {args.local_workers} local workers "
+              f"(more: python main.py --worker {queue_dir}, with --rpm/--tpm set to that worker's share)")
+
+    # Run optimization iterations, continuing from the checkpointed iteration and stage
+    try:
+        if args.population_size > 1:
+            run_population_search(args, optimizer, rewriter, test_data, checkpoint)
+        else:
+            run_iterations(args, optimizer, rewriter, test_data, checkpoint)
+    finally:
+        if args.engine == 'distributed':
+            stop_workers(queue_dir, workers)
+
+    # Report the best template seen, which need not be the last one
+    best_template = state.get("best_template")
+    if best_template:
+        best_template_path = os.path.join(args.results_dir, "best_template.json")
+        with open(best_template_path, 'w') as f:
+            json.dump(best_template, f, indent=2)
+        print(f"\nBest template: {best_template['success_rate']:.2f}% success rate "
+              f"(iteration {best_template['iteration']+1}), saved to {best_template_path}")
 
+    # Report how the routed endpoints fared
+    if args.endpoints_file:
+        endpoint_health = router.snapshot()
+        endpoint_health_path = os.path.join(args.results_dir, "endpoint_health.json")
+        with open(endpoint_health_path, 'w') as f:
+            json.dump(endpoint_health, f, indent=2)
+        print(f"\nEndpoint failovers: {endpoint_health['failovers']}")
+        for endpoint in endpoint_health['endpoints']:
+            print(f"  {endpoint['name']}: {endpoint['calls']} calls, latency EWMA {endpoint['latency_ewma_ms']} ms, "
+                  f"throttles {endpoint['throttles']}, errors {endpoint['errors']}")
+        print(f"Saved endpoint health to {endpoint_health_path}")
 
     # Save the cumulative iteration data
     iteration_file_path = os.path.join(args.results_dir, f"optimization_iteratiion_log.json")
     with open(iteration_file_path, 'w') as f:
-        json.dump(iterations_data, f, indent=2)
+        json.dump(state["iterations_data"], f, indent=2)
     print(f"Saved iteration data to {iteration_file_path}")
     
     print("\nOptimization process complete!")
@@ -2,9 +2,24 @@
 Evaluation module for testing LLM responses against expected outputs.
 """
 from src.evaluation.executor import process_single_test_case, execute_test_cases, run_evaluation
+from src.evaluation.async_executor import execute_test_cases_async
+from src.evaluation.racing import run_racing_evaluation, wilson_interval
+from src.evaluation.population import evaluate_candidates
+from src.evaluation.batching import execute_test_cases_batched, calibrate_batching
+from src.evaluation.distributed import execute_test_cases_distributed, run_worker
+from src.evaluation.stream_evaluation import execute_test_case_stream
 
 __all__ = [
     'process_single_test_case', 
     'execute_test_cases', 
     'run_evaluation',
+    'execute_test_cases_async',
+    'run_racing_evaluation',
+    'wilson_interval',
+    'evaluate_candidates',
+    'execute_test_cases_batched',
+    'calibrate_batching',
+    'execute_test_cases_distributed',
+    'run_worker',
+    'execute_test_case_stream',
 ]
\ No newline at end of file
@@ -0,0 +1,235 @@
+import asyncio
+import concurrent.futures
+import time
+import traceback
+from tqdm import tqdm
+
+from src.evaluation.dedup import fan_out_result, plan_evaluation
+from src.evaluation.executor import (
+    render_prompt_parts,
+    build_case_result,
+    build_error_result,
+    build_executor_error_result,
+    build_converse_request,
+    extract_response_text,
+    request_cache_key,
+    new_suite_results,
+    record_case_stats,
+    finalize_suite_results,
+    open_result_stream,
+    close_result_stream,
+    parse_case_output,
+    IN_FLIGHT_PER_WORKER,
+)
+from src.utils.telemetry import CALL_METRIC_FIELDS, empty_call_metrics, response_metrics
+from src.inference.backends import get_backend
+from src.utils.response_cache import get_response_cache
+from src.utils.rate_limit import call_with_rate_limit_async
+from src.utils.structured_output import classification_tool_config, extract_tool_input, structured_output_enabled
+from src.utils.result_store import ResultStore
+
+async def invoke_converse_async(client, prompt, model_id, temperature=0.7, max_tokens=4096, tool_config=None,
+                                cache_prefix=None, validate=None):
+    """
+    Async counterpart of executor.invoke_converse, going through the response cache.
+
+    Args:
+        client: Async client from ConverseBackend.async_client
+        prompt (str): The prompt to send to the model
+        model_id (str): The model ID
+        temperature (float): Controls randomness (0-1)
+        max_tokens (int): Maximum tokens to generate
+        tool_config (dict, optional): Converse toolConfig for structured output
+        cache_prefix (str, optional): Static prompt prefix to send before a cachePoint
+        validate (callable, optional): Parser called with (text, tool_input) on a fresh response, returning
+            None for an unusable output; only parsed responses are cached
+
+    Returns:
+        dict: "text", "tool_input", "parsed", "cache_hit" and the call metrics, as in executor.invoke_converse
+    """
+    start_time = time.perf_counter()
+    request = build_converse_request(prompt, model_id, temperature, max_tokens, tool_config, cache_prefix)
+
+    # Cache lookups and stores touch SQLite, so they run off the event loop
+    cache = get_response_cache()
+    cache_key = None
+    if cache is not None:
+        cache_key = request_cache_key(cache, request)
+        cached = await asyncio.to_thread(cache.get, cache_key)
+        if cached is not None:
+            return dict(empty_call_metrics(), text=cached["text"], tool_input=cached.get("tool_input"),
+                        parsed=None, cache_hit=True, wall_time_ms=(time.perf_counter() - start_time) * 1000)
+
+    response, retries = await call_with_rate_limit_async(client.converse, request)
+    text = extract_response_text(response)
+    tool_input = extract_tool_input(response) if tool_config is not None else None
+
+    parsed = validate(text, tool_input) if validate is not None else None
+    if cache is not None and (validate is None or parsed is not None):
+        await asyncio.to_thread(cache.put, cache_key, {"text": text, "tool_input": tool_input})
+
+    return dict(response_metrics(response), text=text, tool_input=tool_input, parsed=parsed, cache_hit=False,
+                endpoint=response.get("endpoint"), retries=retries,
+                wall_time_ms=(time.perf_counter() - start_time) * 1000)
+
+
+async def process_single_test_case_async(client, test_case, prompt_template, target_model_id, case_idx,
+                                         temperature=0.1, max_tokens=2000):
+    """
+    Process a single test case on the event loop and return the result
+
+    Args:
+        client: Async client from ConverseBackend.async_client
+        test_case (dict): The test case to process
+        prompt_template (str): Template string with {user_question} placeholder
+        target_model_id (str): Model ID to use for inference
+        case_idx (int): Case index for tracking
+        temperature (float): Temperature setting for inference
+        max_tokens (int): Maximum tokens to generate
+
+    Returns:
+        dict: The processed test case result
+    """
+    generated_text = ""
+    cache_hit = False
+    endpoint = None
+    call_metrics = empty_call_metrics()
+
+    try:
+        cache_prefix, formatted_prompt = render_prompt_parts(prompt_template, test_case.get("user_question", ""))
+        llm_response = await invoke_converse_async(
+            client,
+            prompt=formatted_prompt,
+            cache_prefix=cache_prefix,
+            model_id=target_model_id,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            tool_config=classification_tool_config(prompt_template) if structured_output_enabled() else None,
+            validate=parse_case_output,
+        )
+        generated_text = llm_response["text"]
+        cache_hit = llm_response["cache_hit"]
+        endpoint = llm_response.get("endpoint")
+        call_metrics = {field: llm_response[field] for field in CALL_METRIC_FIELDS}
+        case_result = build_case_result(test_case, generated_text, llm_response["tool_input"],
+                                        parsed=llm_response["parsed"])
+
+    except Exception:
+        error_trace = traceback.format_exc()
+        case_result = build_error_result(test_case, generated_text)
+
+        print(f"\nError in test case {case_idx+1}:")
+        print(error_trace)
+
+    case_result.update({
+        "case_idx": case_idx + 1,
+        "cache_hit": cache_hit
+    })
+    case_result.update(call_metrics)
+    if endpoint is not None:
+        case_result["endpoint"] = endpoint
+
+    return case_result
+
+
+async def execute_test_cases_async(data, target_model_id, output_file=None, max_concurrency=64,
+                                   case_indices=None, resume=False, dedup=True):
+    """
+    Execute all test cases on a single event loop and track results
+
+    Same inputs and suite_results structure as execute_test_cases, but the
+    number of in-flight Converse calls is bounded by a semaphore instead of a
+    thread pool. Tasks are created for a bounded window of cases at a time
+    (IN_FLIGHT_PER_WORKER per request slot), not for the whole suite. Calls
+    without a native async client (e.g. Bedrock without aiobotocore) run on
+    the loop's default thread pool, which is sized to max_concurrency, as do
+    the response cache and result file I/O.
+
+    Args:
+        data (dict): Data containing prompt template and test cases
+        target_model_id (str): Model ID to use for inference
+        output_file (str, optional): Path to save results. If None, results aren't saved.
+        max_concurrency (int): Maximum number of in-flight requests
+        case_indices (list, optional): Original suite index of each entry in test_cases
+        resume (bool): Skip the cases already present in a partial ".jsonl" output_file
+        dedup (bool): Run each group of identical questions once and copy the result to the others
+
+    Returns:
+        dict: Results of all test cases with statistics
+    """
+    prompt_template = data.get("prompt_template", "")
+    test_cases = data.get("test_cases", [])
+    total_cases = len(test_cases)
+
+    suite_results = new_suite_results(prompt_template, total_cases)
+    writer, completed_cases = open_result_stream(output_file, prompt_template, resume)
+    store = ResultStore(prompt_template, test_cases=test_cases)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    # asyncio.to_thread fallbacks would otherwise be capped by the default pool size
+    asyncio.get_running_loop().set_default_executor(
+        concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrency))
+
+    def write_results(case_results):
+        for case_result in case_results:
+            writer.write(case_result)
+
+    async with get_backend().async_client(max_pool_connections=max_concurrency) as client:
+
+        async def run_case(group):
+            position = group[0]
+            case_idx = case_indices[position] if case_indices is not None else position
+            async with semaphore:
+                try:
+                    case_result = await process_single_test_case_async(
+                        client, test_cases[position], prompt_template, target_model_id, case_idx
+                    )
+                except Exception as exc:
+                    print(f"\nError processing case {case_idx+1}: {exc}")
+                    case_result = build_executor_error_result(test_cases[position], case_idx, exc)
+            return group, case_result
+
+        with tqdm(total=total_cases, desc="Processing Test Cases") as pbar:
+            plan = plan_evaluation(test_cases, case_indices, completed_cases, dedup)
+            for position, case_result in plan.restored + plan.fanned_out:
+                store.append(case_result, position)
+                record_case_stats(suite_results["stats"], case_result)
+                pbar.update(1)
+            if writer is not None:
+                await asyncio.to_thread(write_results, [case_result for _, case_result in plan.fanned_out])
+
+            # One task per group of identical questions, a bounded window at a time
+            groups = iter(plan.groups)
+            pending = set()
+            while True:
+                for group in groups:
+                    pending.add(asyncio.ensure_future(run_case(group)))
+                    if len(pending) >= IN_FLIGHT_PER_WORKER * max_concurrency:
+                        break
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+                finished = []
+                for task in done:
+                    group, case_result = task.result()
+                    for position in group:
+                        if position != group[0]:
+                            case_idx = case_indices[position] if case_indices is not None else position
+                            case_result = fan_out_result(case_result, test_cases[position], case_idx)
+                        store.append(case_result, position)
+                        record_case_stats(suite_results["stats"], case_result)
+                        finished.append(case_result)
+
+                    pbar.update(len(group))
+                    pbar.set_postfix({
+                        "Success": f"{suite_results['stats']['llm_successful']}/{total_cases}",
+                    })
+                if writer is not None:
+                    await asyncio.to_thread(write_results, finished)
+
+    suite_results["test_cases"] = store
+    suite_results = finalize_suite_results(suite_results)
+
+    close_result_stream(writer, suite_results, output_file)
+
+    return suite_results
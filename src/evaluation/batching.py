@@ -0,0 +1,332 @@
+"""
+Batched evaluation: several test cases per Converse request.
+
+The template is rendered once with an indexed block of K inquiries in place
+of the question and the model is asked for a JSON array with one
+{id, prediction, explanation} object per inquiry, so a suite takes a Kth of
+the requests and sends the instructions a Kth as often. The array is
+demultiplexed back to the cases by id; inquiries the answer leaves out or
+answers malformed are run again one at a time. calibrate_batching measures
+how far batched scoring moves accuracy against single-case scoring.
+"""
+import concurrent.futures
+import random
+import time
+import traceback
+from contextlib import nullcontext
+from string import Template
+
+from tqdm import tqdm
+
+from src.evaluation.dedup import fan_out_result, plan_evaluation
+from src.evaluation.executor import (
+    build_case_result,
+    close_result_stream,
+    IN_FLIGHT_PER_WORKER,
+    execute_test_cases,
+    finalize_suite_results,
+    invoke_converse,
+    new_suite_results,
+    open_result_stream,
+    process_single_test_case,
+    record_case_stats,
+    render_prompt_parts,
+    submit_windowed,
+)
+from src.inference.backends import get_backend
+from src.utils.parsers import parse_llm_json
+from src.utils.response_cache import response_cache_disabled
+from src.utils.scoring import normalize_label
+from src.utils.structured_output import batch_classification_tool_config, structured_output_enabled
+from src.utils.telemetry import CALL_METRIC_FIELDS
+from src.utils.result_store import ResultStore
+
+BATCH_INSTRUCTIONS = Template("""
+
+The ${count} inquiries above are separate customer inquiries, each in an <inquiry> tag with its id. \
+Classify every inquiry on its own, following the instructions above, but instead of a single JSON object \
+respond with a JSON array in a ```json block holding exactly one object per inquiry:
+[{"id": <inquiry id>, "prediction": "<category>", "explanation": "<reasoning>"}, ...]""")
+
+# Output token budget of a batched request: a base plus an allowance per inquiry
+BATCH_BASE_TOKENS = 512
+TOKENS_PER_CASE = 300
+
+# Token counts are divided between the cases of a batch, latencies are shared by all of them
+ADDITIVE_METRICS = ("input_tokens", "output_tokens", "cache_read_tokens", "cache_write_tokens")
+
+
+def render_batch_prompt_parts(prompt_template, test_cases):
+    """
+    Render the prompt of a batch of cases.
+
+    Returns:
+        tuple: (cache_prefix or None, prompt text), as render_prompt_parts
+    """
+    inquiries = "\n".join(f'<inquiry id="{item_id}">{test_case.get("user_question", "")}</inquiry>'
+                          for item_id, test_case in enumerate(test_cases, start=1))
+    cache_prefix, prompt = render_prompt_parts(prompt_template, f"<inquiries>\n{inquiries}\n</inquiries>")
+    return cache_prefix, prompt + BATCH_INSTRUCTIONS.substitute(count=len(test_cases))
+
+
+def parse_batch_response(text, count, tool_input=None):
+    """
+    Demultiplex a batched answer.
+
+    Args:
+        text (str): Response text
+        count (int): Number of inquiries in the batch (ids 1..count)
+        tool_input (dict, optional): Input of the toolUse block in structured-output mode
+
+    Returns:
+        tuple: (dict of item id -> {prediction, explanation, ...}, parse method); items without
+            a valid id or a prediction and repeated ids are left out
+    """
+    if tool_input is not None:
+        items, method = tool_input.get("classifications"), "tool_use"
+    else:
+        parsed = parse_llm_json(text)
+        items, method = parsed.value, parsed.method
+    if isinstance(items, dict):
+        # Tolerate the array wrapped in an object
+        items = next((value for value in items.values() if isinstance(value, list)), None)
+
+    by_id = {}
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict) or "prediction" not in item:
+            continue
+        try:
+            item_id = int(item.get("id"))
+        except (TypeError, ValueError):
+            continue
+        if 1 <= item_id <= count and item_id not in by_id:
+            by_id[item_id] = item
+    return by_id, method
+
+
+def _batch_tool_input(tool_input):
+    # A toolUse block without the classifications array falls back to the text
+    if tool_input is not None and "classifications" not in tool_input:
+        return None
+    return tool_input
+
+
+def _complete_batch_parser(count):
+    """validate callable of invoke_converse accepting only batched answers with all count cases"""
+    def parse(text, tool_input):
+        items, method = parse_batch_response(text, count, _batch_tool_input(tool_input))
+        return (items, method) if len(items) == count else None
+    return parse
+
+
+def _metric_share(call_metrics, count, position):
+    """Metrics of one of count cases sharing a call: tokens split (remainder to the first), the rest shared"""
+    share = {}
+    for field in CALL_METRIC_FIELDS:
+        value = call_metrics.get(field)
+        if field in ADDITIVE_METRICS and value is not None:
+            value = value // count + (1 if position < value % count else 0)
+        elif field == "retries" and position:
+            # Retries belong to the call, count them once
+            value = 0
+        share[field] = value
+    return share
+
+
+def process_batch(test_cases, prompt_template, target_model_id, case_indices, temperature=0.1):
+    """
+    Run a batch of test cases in one request.
+
+    Args:
+        test_cases (list): The test cases of the batch
+        prompt_template (str): Template string with the user_question placeholder
+        target_model_id (str): Model ID to use for inference
+        case_indices (list): 0-based suite index of each case
+        temperature (float): Temperature setting for inference
+
+    Returns:
+        list: Case results in batch order; cases missing from the answer were run on their own
+            and carry batch_retry
+    """
+    llm_response = None
+    items, method = {}, None
+    try:
+        cache_prefix, prompt = render_batch_prompt_parts(prompt_template, test_cases)
+        llm_response = invoke_converse(
+            prompt=prompt,
+            cache_prefix=cache_prefix,
+            model_id=target_model_id,
+            temperature=temperature,
+            max_tokens=BATCH_BASE_TOKENS + TOKENS_PER_CASE * len(test_cases),
+            tool_config=batch_classification_tool_config(prompt_template) if structured_output_enabled() else None,
+            # Answers missing cases are not cached, so the whole batch is asked again next time
+            validate=_complete_batch_parser(len(test_cases)),
+        )
+        items, method = llm_response["parsed"] or parse_batch_response(
+            llm_response["text"], len(test_cases), _batch_tool_input(llm_response["tool_input"]))
+    except Exception:
+        print(f"\nError in batch of cases {', '.join(str(case_idx + 1) for case_idx in case_indices)}:")
+        print(traceback.format_exc())
+
+    case_results = []
+    for position, (test_case, case_idx) in enumerate(zip(test_cases, case_indices)):
+        share = _metric_share(llm_response, len(test_cases), position) if llm_response is not None else {}
+        item = items.get(position + 1)
+        if item is None:
+            # Missing or malformed in the batched answer: run the case on its own
+            case_result = process_single_test_case(test_case, prompt_template, target_model_id, case_idx,
+                                                   temperature=temperature)
+            for field in ADDITIVE_METRICS + ("wall_time_ms",):
+                if share.get(field) is not None:
+                    case_result[field] = (case_result.get(field) or 0) + share[field]
+            case_result["batch_retry"] = True
+        else:
+            case_result = build_case_result(test_case, "", {key: value for key, value in item.items() if key != "id"})
+            case_result["parse_method"] = f"batch_{method}"
+            case_result.update({"case_idx": case_idx + 1, "cache_hit": llm_response["cache_hit"]})
+            case_result.update(share)
+            if llm_response.get("endpoint") is not None:
+                case_result["endpoint"] = llm_response["endpoint"]
+        case_result["batch_size"] = len(test_cases)
+        case_results.append(case_result)
+    return case_results
+
+
+def execute_test_cases_batched(data, target_model_id, output_file=None, batch_size=8, max_workers=8,
+                               case_indices=None, resume=False, executor=None, dedup=True):
+    """
+    Execute test cases K per request and track results
+
+    Same inputs and suite_results structure as execute_test_cases. Duplicate
+    questions are removed before batching, so a batch holds batch_size
+    distinct questions. stats gains batch_requests (batched calls made) and
+    batch_retries (cases re-run on their own).
+
+    Args:
+        data (dict): Data containing prompt template and test cases
+        target_model_id (str): Model ID to use for inference
+        output_file (str, optional): Path to save results; a ".jsonl" path is appended to as batches complete
+        batch_size (int): Number of cases per request
+        max_workers (int): Maximum number of batches in flight (the size of executor if one is given)
+        case_indices (list, optional): Original suite index of each entry in test_cases
+        resume (bool): Skip the cases already present in a partial ".jsonl" output_file
+        executor (ThreadPoolExecutor, optional): Shared worker pool to submit the batches to
+        dedup (bool): Run each group of identical questions once
+
+    Returns:
+        dict: Results of all test cases with statistics
+    """
+    get_backend().reserve_connections(max_workers)
+
+    prompt_template = data.get("prompt_template", "")
+    test_cases = data.get("test_cases", [])
+    total_cases = len(test_cases)
+
+    suite_results = new_suite_results(prompt_template, total_cases)
+    suite_results["stats"].update({"batch_requests": 0, "batch_retries": 0})
+    writer, completed_cases = open_result_stream(output_file, prompt_template, resume)
+    store = ResultStore(prompt_template, test_cases=test_cases)
+
+    def index_of(position):
+        return case_indices[position] if case_indices is not None else position
+
+    with tqdm(total=total_cases, desc="Processing Test Cases") as pbar:
+        if executor is not None:
+            pool_context = nullcontext(executor)
+        else:
+            pool_context = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        with pool_context as executor:
+            plan = plan_evaluation(test_cases, case_indices, completed_cases, dedup)
+            for position, case_result in plan.restored + plan.fanned_out:
+                store.append(case_result, position)
+                record_case_stats(suite_results["stats"], case_result)
+                pbar.update(1)
+            if writer is not None:
+                for _, case_result in plan.fanned_out:
+                    writer.write(case_result)
+
+            # Pack the representatives of the groups still to run into batches, a bounded window at a time
+            submissions = (
+                (groups, process_batch, [test_cases[group[0]] for group in groups], prompt_template,
+                 target_model_id, [index_of(group[0]) for group in groups])
+                for groups in (plan.groups[start:start + batch_size]
+                               for start in range(0, len(plan.groups), batch_size))
+            )
+
+            for groups, future in submit_windowed(executor, submissions, IN_FLIGHT_PER_WORKER * max_workers):
+                case_results = future.result()
+                suite_results["stats"]["batch_requests"] += 1
+                for group, case_result in zip(groups, case_results):
+                    if case_result.get("batch_retry"):
+                        suite_results["stats"]["batch_retries"] += 1
+                    for position in group:
+                        if position != group[0]:
+                            case_result = fan_out_result(case_result, test_cases[position], index_of(position))
+                        store.append(case_result, position)
+                        record_case_stats(suite_results["stats"], case_result)
+                        if writer is not None:
+                            writer.write(case_result)
+                    pbar.update(len(group))
+                pbar.set_postfix({
+                    "Success": f"{suite_results['stats']['llm_successful']}/{total_cases}",
+                })
+
+    suite_results["test_cases"] = store
+    suite_results = finalize_suite_results(suite_results)
+    close_result_stream(writer, suite_results, output_file)
+
+    return suite_results
+
+
+def calibrate_batching(data, target_model_id, batch_size=8, sample_size=50, seed=0, max_workers=8):
+    """
+    Score a sample of the suite both one case per request and batched.
+
+    Args:
+        data (dict): Data containing prompt template and test cases
+        target_model_id (str): Model ID to use for inference
+        batch_size (int): Number of cases per batched request
+        sample_size (int): Number of cases to sample
+        seed (int): Seed of the sample
+        max_workers (int): Maximum number of requests in flight
+
+    Returns:
+        dict: Accuracy of both modes and their difference (batched minus single), the share of
+            cases with the same prediction in both, and the requests and input tokens each took
+    """
+    test_cases = data.get("test_cases", [])
+    positions = sorted(random.Random(seed).sample(range(len(test_cases)), min(sample_size, len(test_cases))))
+    sample = {"prompt_template": data.get("prompt_template", ""),
+              "test_cases": [test_cases[position] for position in positions]}
+
+    # Without the cache both modes reach the model, so their requests and tokens compare
+    with response_cache_disabled():
+        start_time = time.perf_counter()
+        single = execute_test_cases(sample, target_model_id, max_workers=max_workers, case_indices=positions)
+        single_time = time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        batched = execute_test_cases_batched(sample, target_model_id, batch_size=batch_size,
+                                             max_workers=max_workers, case_indices=positions)
+        batched_time = time.perf_counter() - start_time
+
+    def accuracy(results):
+        total = results["stats"]["total"]
+        return results["stats"]["task_succeed"] / total if total else 0.0
+
+    single_predictions = {case["case_idx"]: normalize_label(case.get("prediction")) for case in single["test_cases"]}
+    agreement = sum(single_predictions.get(case["case_idx"]) == normalize_label(case.get("prediction"))
+                    for case in batched["test_cases"])
+    return {
+        "sample_size": len(positions),
+        "batch_size": batch_size,
+        "single_accuracy": round(accuracy(single), 4),
+        "batched_accuracy": round(accuracy(batched), 4),
+        "accuracy_delta": round(accuracy(batched) - accuracy(single), 4),
+        "agreement": round(agreement / len(positions), 4) if positions else 0.0,
+        "single_requests": single["stats"]["cache_misses"],
+        "batched_requests": batched["stats"]["batch_requests"] + batched["stats"]["batch_retries"],
+        "single_input_tokens": single["stats"]["tokens"]["input"],
+        "batched_input_tokens": batched["stats"]["tokens"]["input"],
+        "single_seconds": round(single_time, 3),
+        "batched_seconds": round(batched_time, 3),
+    }
\ No newline at end of file
@@ -0,0 +1,207 @@
+"""
+Deduplication of test cases before evaluation.
+
+Test sets mined from production traffic repeat the same question many times.
+Questions are normalized (whitespace collapsed, case folded) and hashed, each
+group of identical questions is run once, and the representative's result is
+copied to every other case of the group with that case's own case_idx and
+ground truth, so scoring stays per case. Copies carry duplicate_of and no call
+metrics or serving endpoint.
+
+For racing, near_duplicate_clusters groups questions that are merely similar
+(MinHash over word shingles with LSH banding), so a minibatch can run one
+representative per cluster.
+"""
+import hashlib
+from collections import namedtuple
+
+import numpy as np
+
+from src.utils.telemetry import empty_call_metrics
+
+# Modulus of the MinHash permutations; products of two values below it fit in 64 bits
+MINHASH_PRIME = (1 << 31) - 1
+
+EvaluationPlan = namedtuple("EvaluationPlan", ["restored", "fanned_out", "groups"])
+
+
+def normalize_question(text):
+    """Collapse whitespace and fold case, so trivially different copies of a question match"""
+    return " ".join(str(text or "").split()).casefold()
+
+
+def question_key(test_case):
+    """Hash of the normalized question of a test case"""
+    normalized = normalize_question(test_case.get("user_question", ""))
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).digest()
+
+
+def group_duplicates(test_cases):
+    """
+    Group the positions of test cases with the same normalized question.
+
+    Returns:
+        list: Lists of positions in order of first occurrence; the first position
+            of each group is its representative
+    """
+    groups = {}
+    for position, test_case in enumerate(test_cases):
+        groups.setdefault(question_key(test_case), []).append(position)
+    return list(groups.values())
+
+
+def fan_out_result(case_result, test_case, case_idx):
+    """
+    Copy of a representative's result for a duplicate test case.
+
+    Args:
+        case_result (dict): Result of the representative (or of an earlier copy)
+        test_case (dict): The duplicate test case
+        case_idx (int): 0-based suite index of the duplicate
+
+    Returns:
+        dict: The duplicate's result, with its own question, ground truth and case_idx
+    """
+    duplicate = dict(case_result)
+    duplicate.pop("task_succeed", None)
+    # No endpoint served the copy
+    duplicate.pop("endpoint", None)
+    duplicate.update(empty_call_metrics())
+    duplicate.update({
+        "user_question": test_case.get("user_question", ""),
+        "ground_truth": test_case.get("ground_truth", ""),
+        "case_idx": case_idx + 1,
+        "cache_hit": False,
+        "duplicate_of": case_result.get("duplicate_of", case_result.get("case_idx")),
+    })
+    return duplicate
+
+
+def plan_evaluation(test_cases, case_indices=None, completed_cases=None, dedup=True):
+    """
+    Decide which test cases to run, restore or fan out.
+
+    Args:
+        test_cases (list): Test cases of the run
+        case_indices (list, optional): Original suite index of each entry in test_cases
+        completed_cases (dict, optional): Results already on disk, by 1-based case_idx
+        dedup (bool): Run each group of identical questions once
+
+    Returns:
+        EvaluationPlan: restored [(position, result)] read back from disk,
+            fanned_out [(position, result)] copied from a restored duplicate, and
+            groups [[position, ...]] still to run, the first position of each
+            group being the one to submit
+    """
+    completed_cases = completed_cases or {}
+    groups = group_duplicates(test_cases) if dedup else [[position] for position in range(len(test_cases))]
+    restored, fanned_out, pending_groups = [], [], []
+    for group in groups:
+        source = None
+        pending = []
+        for position in group:
+            case_idx = case_indices[position] if case_indices is not None else position
+            if case_idx + 1 in completed_cases:
+                restored.append((position, completed_cases[case_idx + 1]))
+                source = source or completed_cases[case_idx + 1]
+            else:
+                pending.append(position)
+        if not pending:
+            continue
+        if source is not None:
+            for position in pending:
+                case_idx = case_indices[position] if case_indices is not None else position
+                fanned_out.append((position, fan_out_result(source, test_cases[position], case_idx)))
+        else:
+            pending_groups.append(pending)
+    return EvaluationPlan(restored, fanned_out, pending_groups)
+
+
+def dedup_ratio(stats):
+    """Share of the evaluated cases answered from a duplicate instead of a model call"""
+    total = stats.get("total") or 0
+    return round(stats.get("deduplicated", 0) / total, 4) if total else 0.0
+
+
+def _shingle_hashes(text, shingle_size):
+    words = normalize_question(text).split()
+    if len(words) <= shingle_size:
+        shingles = {" ".join(words)}
+    else:
+        shingles = {" ".join(words[start:start + shingle_size]) for start in range(len(words) - shingle_size + 1)}
+    return np.array(
+        [int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest(), "little") % MINHASH_PRIME
+         for shingle in shingles],
+        dtype=np.uint64,
+    )
+
+
+def minhash_signatures(texts, num_perm=64, shingle_size=3, seed=0):
+    """
+    MinHash signatures of texts over their word shingles.
+
+    Returns:
+        np.ndarray: One row of num_perm minimum hashes per text
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, MINHASH_PRIME, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, MINHASH_PRIME, size=num_perm, dtype=np.uint64)
+    signatures = np.full((len(texts), num_perm), MINHASH_PRIME, dtype=np.uint64)
+    for row, text in enumerate(texts):
+        hashes = _shingle_hashes(text, shingle_size)
+        if hashes.size:
+            signatures[row] = ((np.outer(hashes, a) + b) % MINHASH_PRIME).min(axis=0)
+    return signatures
+
+
+def _lsh_rows(num_perm, threshold):
+    # Rows per band whose LSH threshold (1/bands)^(1/rows) is closest to the wanted similarity
+    divisors = [rows for rows in range(1, num_perm + 1) if num_perm % rows == 0]
+    return min(divisors, key=lambda rows: abs((rows / num_perm) ** (1 / rows) - threshold))
+
+
+def near_duplicate_clusters(test_cases, threshold=0.8, num_perm=64, shingle_size=3, seed=0):
+    """
+    Cluster test cases whose questions are near-duplicates.
+
+    Candidate pairs come from LSH banding of MinHash signatures and are joined
+    when their estimated Jaccard similarity of word shingles reaches threshold.
+
+    Args:
+        test_cases (list): Test cases with a user_question field
+        threshold (float): Minimum estimated Jaccard similarity, in (0, 1]
+        num_perm (int): Number of MinHash permutations
+        shingle_size (int): Words per shingle
+        seed (int): Seed of the permutations
+
+    Returns:
+        list: Lists of positions in order of first occurrence, the first position
+            of each cluster being its representative
+    """
+    signatures = minhash_signatures([test_case.get("user_question", "") for test_case in test_cases],
+                                    num_perm=num_perm, shingle_size=shingle_size, seed=seed)
+    parent = list(range(len(test_cases)))
+
+    def find(position):
+        while parent[position] != position:
+            parent[position] = parent[parent[position]]
+            position = parent[position]
+        return position
+
+    rows = _lsh_rows(num_perm, threshold)
+    for start in range(0, num_perm, rows):
+        buckets = {}
+        for position in range(len(test_cases)):
+            buckets.setdefault(signatures[position, start:start + rows].tobytes(), []).append(position)
+        for members in buckets.values():
+            first = members[0]
+            for position in members[1:]:
+                if find(position) != find(first) and np.mean(signatures[first] == signatures[position]) >= threshold:
+                    # Keep the earliest position as the root, i.e. the representative
+                    roots = sorted((find(first), find(position)))
+                    parent[roots[1]] = roots[0]
+
+    clusters = {}
+    for position in range(len(test_cases)):
+        clusters.setdefault(find(position), []).append(position)
+    return list(clusters.values())
\ No newline at end of file
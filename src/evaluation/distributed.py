@@ -0,0 +1,468 @@
+"""
+Coordinator/worker evaluation over a file-based work queue.
+
+The coordinator shards the test cases of a suite into work units and puts
+them in a queue directory that every worker can reach: a local directory for
+workers on the same host, a shared mount for workers on other hosts. Workers
+lease a unit by renaming it from pending/ to leased/ (only one rename can
+win), run it with the thread or asyncio engine and stream the case results to
+their own JSONL file under results/, which the coordinator tails and merges
+into the usual suite_results. A worker keeps its lease alive by touching the
+lease file; a unit whose lease has not been touched for lease_timeout seconds
+of the coordinator's clock goes back to pending/ with the cases that have no
+result yet, so units of a crashed or stalled worker are reassigned. A unit
+that has expired max_attempts times (e.g. one that fails on every worker) is
+not reassigned again; its missing cases are recorded as errors.
+
+Layout of a queue directory:
+
+    stop                                   written to let idle workers exit
+    job-<id>/job.json                      prompt template, model ID and settings of one evaluation
+    job-<id>/pending/unit-00003.json       units waiting for a worker
+    job-<id>/leased/unit-00003.json        units being run
+    job-<id>/done/unit-00003.json          units finished
+    job-<id>/results/unit-00003.<attempt>.<worker>.jsonl   streamed case results
+
+Start workers with python main.py --worker QUEUE_DIR (plus the backend options),
+or let the coordinator start local ones (start_local_workers).
+"""
+import glob
+import json
+import os
+import shutil
+import socket
+import subprocess
+import threading
+import time
+import traceback
+import uuid
+
+from tqdm import tqdm
+
+from src.evaluation.dedup import fan_out_result, plan_evaluation
+from src.evaluation.executor import (
+    build_executor_error_result,
+    close_result_stream,
+    execute_with_engine,
+    finalize_suite_results,
+    new_suite_results,
+    open_result_stream,
+    record_case_stats,
+)
+from src.utils.structured_output import configure_known_labels, known_labels
+from src.utils.result_store import ResultStore
+
+STOP_FILE = "stop"
+
+_settings = {"queue_dir": None, "unit_size": 25, "lease_timeout": 60.0, "poll_interval": 0.5, "max_attempts": 3}
+
+
+def configure_distributed(queue_dir, unit_size=25, lease_timeout=60.0, poll_interval=0.5, max_attempts=3):
+    """
+    Set the work queue used by the distributed engine.
+
+    Args:
+        queue_dir (str): Queue directory shared by the coordinator and its workers
+        unit_size (int): Test cases per work unit
+        lease_timeout (float): Seconds without a heartbeat after which a leased unit is reassigned
+        poll_interval (float): Seconds between polls of the queue
+        max_attempts (int): Leases a unit gets before its missing cases are recorded as errors
+    """
+    _settings.update(queue_dir=queue_dir, unit_size=unit_size, lease_timeout=lease_timeout,
+                     poll_interval=poll_interval, max_attempts=max_attempts)
+    os.makedirs(queue_dir, exist_ok=True)
+
+
+def _write_json_atomic(path, record):
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "w", encoding="utf-8") as f:
+        json.dump(record, f, ensure_ascii=False)
+    os.replace(temporary_path, path)
+
+
+def _read_json(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class ResultTail:
+    """Incremental reader of the JSONL files a job's workers append to"""
+
+    def __init__(self, results_dir):
+        self.results_dir = results_dir
+        self._offsets = {}
+
+    def read(self):
+        """Return the case results appended since the last read; partial last lines wait for the next one"""
+        records = []
+        for path in sorted(glob.glob(os.path.join(self.results_dir, "*.jsonl"))):
+            offset = self._offsets.get(path, 0)
+            with open(path, "rb") as f:
+                f.seek(offset)
+                data = f.read()
+            end = data.rfind(b"\n") + 1
+            if not end:
+                continue
+            self._offsets[path] = offset + end
+            for line in data[:end].decode("utf-8").splitlines():
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get("record_type") != "header":
+                    records.append(record)
+        return records
+
+
+class LeaseMonitor:
+    """
+    Coordinator-side lease expiry.
+
+    Heartbeats are judged by the coordinator's own clock: a lease expires when
+    its mtime has not changed for lease_timeout seconds since the coordinator
+    last saw it change, so clock skew between hosts does not matter.
+    """
+
+    def __init__(self, leased_dir, lease_timeout):
+        self.leased_dir = leased_dir
+        self.lease_timeout = lease_timeout
+        self._seen = {}
+
+    def expired(self):
+        """Paths of the leases whose heartbeat stopped"""
+        now = time.monotonic()
+        expired = []
+        paths = glob.glob(os.path.join(self.leased_dir, "*.json"))
+        # Forget leases that were completed or requeued
+        self._seen = {path: seen for path, seen in self._seen.items() if path in paths}
+        for path in paths:
+            try:
+                mtime = os.stat(path).st_mtime
+            except FileNotFoundError:
+                continue
+            seen = self._seen.get(path)
+            if seen is None or seen[0] != mtime:
+                self._seen[path] = (mtime, now)
+            elif now - seen[1] > self.lease_timeout:
+                expired.append(path)
+                del self._seen[path]
+        return expired
+
+
+def _requeue(job_dir, lease_path, remaining):
+    """
+    Put the cases of an expired lease that have no result yet back into pending/.
+
+    Returns:
+        list: Error results of the missing cases if the unit used up its attempts, else empty
+    """
+    try:
+        unit = _read_json(lease_path)
+        # Removing the lease also tells a worker that is merely slow that it lost the unit
+        os.remove(lease_path)
+    except FileNotFoundError:
+        # Finished (or requeued) in the meantime
+        return []
+    pending = [(case_idx, test_case) for case_idx, test_case in zip(unit["case_indices"], unit["test_cases"])
+               if case_idx + 1 in remaining]
+    if not pending:
+        return []
+    attempt = unit.get("attempt", 0) + 1
+    if attempt >= _settings["max_attempts"]:
+        print(f"\nLease of {unit['unit_id']} expired on attempt {attempt}; giving up on {len(pending)} cases")
+        exc = RuntimeError(f"Work unit {unit['unit_id']} did not finish in {attempt} attempts")
+        return [build_executor_error_result(test_case, case_idx, exc) for case_idx, test_case in pending]
+    print(f"\nLease of {unit['unit_id']} expired; reassigning {len(pending)} cases")
+    unit.update(case_indices=[case_idx for case_idx, _ in pending],
+                test_cases=[test_case for _, test_case in pending],
+                attempt=attempt)
+    _write_json_atomic(os.path.join(job_dir, "pending", os.path.basename(lease_path)), unit)
+    return []
+
+
+def execute_test_cases_distributed(data, target_model_id, output_file=None, case_indices=None, resume=False,
+                                   dedup=True, request_batch_size=1):
+    """
+    Execute test cases on queue workers and track results
+
+    Same inputs and suite_results structure as execute_test_cases; the queue
+    is the one set with configure_distributed. Duplicate questions are removed
+    before sharding, so only representatives are sent to the workers. With
+    request_batch_size above 1, stats gains batch_requests and batch_retries
+    as in execute_test_cases_batched.
+
+    Args:
+        data (dict): Data containing prompt template and test cases
+        target_model_id (str): Model ID to use for inference
+        output_file (str, optional): Path to save results; a ".jsonl" path is appended to as results arrive
+        case_indices (list, optional): Original suite index of each entry in test_cases
+        resume (bool): Skip the cases already present in a partial ".jsonl" output_file
+        dedup (bool): Run each group of identical questions once
+        request_batch_size (int): Cases the workers pack into one request
+
+    Returns:
+        dict: Results of all test cases with statistics
+    """
+    queue_dir = _settings["queue_dir"]
+    if queue_dir is None:
+        raise ValueError("The distributed engine needs a queue directory (configure_distributed)")
+
+    prompt_template = data.get("prompt_template", "")
+    test_cases = data.get("test_cases", [])
+    total_cases = len(test_cases)
+
+    suite_results = new_suite_results(prompt_template, total_cases)
+    if request_batch_size > 1:
+        suite_results["stats"].update({"batch_requests": 0, "batch_retries": 0})
+    # Cases in batches of batch_size add up to one request per batch
+    batch_shares = 0.0
+    writer, completed_cases = open_result_stream(output_file, prompt_template, resume)
+    store = ResultStore(prompt_template, test_cases=test_cases)
+
+    def index_of(position):
+        return case_indices[position] if case_indices is not None else position
+
+    job_dir = os.path.join(queue_dir, f"job-{time.strftime('%Y%m%d_%H%M%S')}-{uuid.uuid4().hex[:8]}")
+    for name in ("pending", "leased", "done", "results"):
+        os.makedirs(os.path.join(job_dir, name), exist_ok=True)
+
+    with tqdm(total=total_cases, desc="Processing Test Cases") as pbar:
+        plan = plan_evaluation(test_cases, case_indices, completed_cases, dedup)
+        for position, case_result in plan.restored + plan.fanned_out:
+            store.append(case_result, position)
+            record_case_stats(suite_results["stats"], case_result)
+            pbar.update(1)
+        if writer is not None:
+            for _, case_result in plan.fanned_out:
+                writer.write(case_result)
+
+        # 1-based case_idx of each representative still to run -> its group
+        remaining = {index_of(group[0]) + 1: group for group in plan.groups}
+        _write_json_atomic(os.path.join(job_dir, "job.json"), {
+            "prompt_template": prompt_template,
+            "model_id": target_model_id,
+            "request_batch_size": request_batch_size,
+            "lease_timeout": _settings["lease_timeout"],
+            "known_labels": sorted(known_labels()) if known_labels() is not None else None,
+        })
+        # Whole batches per unit, so batching on the workers leaves no partial batches but the last
+        unit_size = -(-_settings["unit_size"] // request_batch_size) * request_batch_size
+        for start in range(0, len(plan.groups), unit_size):
+            groups = plan.groups[start:start + unit_size]
+            unit_id = f"unit-{start // unit_size:05d}"
+            _write_json_atomic(os.path.join(job_dir, "pending", unit_id + ".json"), {
+                "unit_id": unit_id,
+                "case_indices": [index_of(group[0]) for group in groups],
+                "test_cases": [test_cases[group[0]] for group in groups],
+                "attempt": 0,
+            })
+
+        tail = ResultTail(os.path.join(job_dir, "results"))
+        leases = LeaseMonitor(os.path.join(job_dir, "leased"), _settings["lease_timeout"])
+        waiting_since = time.monotonic()
+        warned = False
+        abandoned = []
+        while remaining:
+            records = tail.read() + abandoned
+            abandoned = []
+            for case_result in records:
+                # A reassigned unit can deliver a case twice; the first result wins
+                group = remaining.pop(case_result.get("case_idx"), None)
+                if group is None:
+                    continue
+                if request_batch_size > 1:
+                    batch_shares += 1 / case_result.get("batch_size", 1)
+                    suite_results["stats"]["batch_requests"] = round(batch_shares)
+                    suite_results["stats"]["batch_retries"] += bool(case_result.get("batch_retry"))
+                for position in group:
+                    if position != group[0]:
+                        case_result = fan_out_result(case_result, test_cases[position], index_of(position))
+                    store.append(case_result, position)
+                    record_case_stats(suite_results["stats"], case_result)
+                    if writer is not None:
+                        writer.write(case_result)
+                pbar.update(len(group))
+            if records:
+                waiting_since = time.monotonic()
+                pbar.set_postfix({
+                    "Success": f"{suite_results['stats']['llm_successful']}/{total_cases}",
+                })
+            for lease_path in leases.expired():
+                abandoned.extend(_requeue(job_dir, lease_path, remaining))
+            if abandoned:
+                continue
+            if not remaining:
+                break
+            if not warned and time.monotonic() - waiting_since > max(10.0, _settings["lease_timeout"]):
+                print(f"\nNo results for a while; are workers running on {queue_dir}? "
+                      f"(python main.py --worker {queue_dir})")
+                warned = True
+            time.sleep(_settings["poll_interval"])
+
+    # Workers skip the job from now on; late writers of reassigned units hold their files open
+    shutil.rmtree(job_dir, ignore_errors=True)
+
+    suite_results["test_cases"] = store
+    suite_results = finalize_suite_results(suite_results)
+    close_result_stream(writer, suite_results, output_file)
+
+    return suite_results
+
+
+class LeaseHeartbeat:
+    """Worker-side context manager touching a lease file until the unit is done"""
+
+    def __init__(self, lease_path, interval):
+        self.lease_path = lease_path
+        self.interval = interval
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                os.utime(self.lease_path)
+            except FileNotFoundError:
+                # The coordinator reassigned the unit
+                self.lost = True
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+
+
+def lease_unit(queue_dir):
+    """
+    Lease the next pending unit of any unfinished job.
+
+    Returns:
+        tuple: (job_dir, job, unit, lease_path), or None if nothing is pending
+    """
+    for job_dir in sorted(glob.glob(os.path.join(queue_dir, "job-*"))):
+        try:
+            job = _read_json(os.path.join(job_dir, "job.json"))
+        except (FileNotFoundError, json.JSONDecodeError):
+            # Not fully written yet, or finished and removed
+            continue
+        for pending_path in sorted(glob.glob(os.path.join(job_dir, "pending", "*.json"))):
+            lease_path = os.path.join(job_dir, "leased", os.path.basename(pending_path))
+            try:
+                os.rename(pending_path, lease_path)
+                unit = _read_json(lease_path)
+            except (FileNotFoundError, json.JSONDecodeError):
+                # Another worker won the rename, or the job was removed
+                continue
+            return job_dir, job, unit, lease_path
+    return None
+
+
+def run_worker(queue_dir, worker_id=None, engine="threads", max_concurrency=None, poll_interval=0.5,
+               idle_timeout=None):
+    """
+    Pull work units from a queue directory and run them until told to stop.
+
+    The backend, rate limits and caches are the ones configured in this process.
+
+    Args:
+        queue_dir (str): Queue directory of the coordinator
+        worker_id (str, optional): Name of this worker; host name and process ID by default
+        engine (str): "threads" or "async", the engine running each unit
+        max_concurrency (int, optional): Worker threads or in-flight requests of this worker
+        poll_interval (float): Seconds between polls of an empty queue
+        idle_timeout (float, optional): Exit after this many seconds without work
+
+    Returns:
+        int: Number of units run
+    """
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    os.makedirs(queue_dir, exist_ok=True)
+    print(f"Worker {worker_id} pulling work units from {queue_dir}")
+    units_run = 0
+    idle_since = time.monotonic()
+    while True:
+        lease = lease_unit(queue_dir)
+        if lease is None:
+            if os.path.exists(os.path.join(queue_dir, STOP_FILE)):
+                break
+            if idle_timeout is not None and time.monotonic() - idle_since > idle_timeout:
+                break
+            time.sleep(poll_interval)
+            continue
+
+        job_dir, job, unit, lease_path = lease
+        output_file = os.path.join(job_dir, "results",
+                                   f"{unit['unit_id']}.{unit.get('attempt', 0)}.{worker_id}.jsonl")
+        print(f"Worker {worker_id} running {os.path.basename(job_dir)}/{unit['unit_id']} "
+              f"({len(unit['test_cases'])} cases)")
+        # Check the template's labels against the coordinator's suite, as the coordinator would
+        configure_known_labels(job.get("known_labels"))
+        with LeaseHeartbeat(lease_path, job.get("lease_timeout", 60.0) / 4) as heartbeat:
+            try:
+                execute_with_engine(
+                    {"prompt_template": job["prompt_template"], "test_cases": unit["test_cases"]},
+                    job["model_id"], output_file,
+                    engine=engine,
+                    max_concurrency=max_concurrency,
+                    case_indices=unit["case_indices"],
+                    dedup=False,
+                    request_batch_size=job.get("request_batch_size", 1),
+                )
+            except Exception:
+                # E.g. the job finished and was removed while a reassigned copy of the unit ran;
+                # the lease expires and the coordinator reassigns whatever is still missing
+                print(f"\nError in {unit['unit_id']}:")
+                print(traceback.format_exc())
+                continue
+        try:
+            os.rename(lease_path, os.path.join(job_dir, "done", os.path.basename(lease_path)))
+        except FileNotFoundError:
+            heartbeat.lost = True
+        if heartbeat.lost:
+            print(f"Worker {worker_id} lost the lease of {unit['unit_id']}; it was reassigned")
+        units_run += 1
+        idle_since = time.monotonic()
+    print(f"Worker {worker_id} stopping after {units_run} units")
+    return units_run
+
+
+def start_local_workers(queue_dir, count, worker_args, log_dir=None):
+    """
+    Start worker processes on this host.
+
+    Args:
+        queue_dir (str): Queue directory to serve
+        count (int): Number of worker processes
+        worker_args (list): Command line of a worker, e.g. [sys.executable, "main.py", "--worker", queue_dir, ...]
+        log_dir (str, optional): Directory of the worker logs; queue_dir by default
+
+    Returns:
+        list: The subprocess.Popen handles
+    """
+    stop_path = os.path.join(queue_dir, STOP_FILE)
+    if os.path.exists(stop_path):
+        os.remove(stop_path)
+    log_dir = log_dir or queue_dir
+    os.makedirs(log_dir, exist_ok=True)
+    processes = []
+    for index in range(count):
+        with open(os.path.join(log_dir, f"worker-{index}.log"), "w") as log:
+            processes.append(subprocess.Popen(worker_args, stdout=log, stderr=subprocess.STDOUT))
+    return processes
+
+
+def stop_workers(queue_dir, processes=(), timeout=30.0):
+    """Tell the workers of a queue to exit once it is empty and wait for the local ones"""
+    with open(os.path.join(queue_dir, STOP_FILE), "w") as f:
+        f.write(str(time.time()))
+    deadline = time.monotonic() + timeout
+    for process in processes:
+        try:
+            process.wait(timeout=max(0.0, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            process.terminate()
\ No newline at end of file
@@ -1,14 +1,221 @@
 import json
-import boto3
+import asyncio
 import traceback
 import os
+import time
 from datetime import datetime
 from tqdm import tqdm
 from string import Template
 import concurrent.futures
+from contextlib import nullcontext
 
-from src.utils.parsers import load_json_from_llm_result
+from src.evaluation.dedup import dedup_ratio, fan_out_result, plan_evaluation
+from src.utils.parsers import ParseResult, parse_llm_json
+from src.utils.prompt_layout import prompt_caching_enabled, prompt_layout, render_layout
+from src.utils.structured_output import classification_tool_config, extract_tool_input, structured_output_enabled
 from src.utils.evaluation import evaluate_test_results 
+from src.inference.backends import get_backend
+from src.utils.response_cache import get_response_cache
+from src.utils.rate_limit import call_with_rate_limit
+from src.utils.result_store import ResultStore, is_columnar_path
+from src.utils.result_writer import JsonlResultWriter, load_completed_cases, write_summary
+from src.utils.telemetry import CALL_METRIC_FIELDS, empty_call_metrics, response_metrics, summarize_case_metrics
+
+def render_prompt(prompt_template, user_question):
+    """Format the prompt template with the user question"""
+    template = Template(prompt_template)
+    return template.safe_substitute(user_question=user_question)
+
+
+def render_prompt_parts(prompt_template, user_question):
+    """
+    Render the prompt of one case for sending.
+
+    With prompt caching the template is split into its static prefix, sent
+    before a cachePoint, and the per-case part holding the question.
+
+    Returns:
+        tuple: (cache_prefix or None, prompt text following it)
+    """
+    if prompt_caching_enabled():
+        layout = prompt_layout(prompt_template)
+        if layout.prefix:
+            return render_layout(layout, user_question)
+    return None, render_prompt(prompt_template, user_question)
+
+
+def _parse_output(generated_text, tool_input=None):
+    if tool_input is not None:
+        return ParseResult(tool_input, "tool_use")
+    return parse_llm_json(generated_text)
+
+
+def parse_case_output(generated_text, tool_input=None):
+    """
+    Parse the model output of a test case.
+
+    Args:
+        generated_text (str): The raw model output
+        tool_input (dict, optional): Input of the toolUse block in structured-output mode,
+            used as is instead of parsing generated_text
+
+    Returns:
+        ParseResult: The parsed output, or None if it has no JSON object with a prediction
+    """
+    parsed = _parse_output(generated_text, tool_input)
+    if not isinstance(parsed.value, dict) or "prediction" not in parsed.value:
+        return None
+    return parsed
+
+
+def build_case_result(test_case, generated_text, tool_input=None, parsed=None):
+    """
+    Parse the model output of a test case into a result entry.
+    
+    Args:
+        test_case (dict): The test case that was run
+        generated_text (str): The raw model output
+        tool_input (dict, optional): Input of the toolUse block in structured-output mode,
+            used as is instead of parsing generated_text
+        parsed (ParseResult, optional): Output already parsed by parse_case_output, used instead
+            of parsing again
+        
+    Returns:
+        dict: The case result; an error result if the output has no JSON object with a prediction
+    """
+    if parsed is None:
+        parsed = _parse_output(generated_text, tool_input)
+    results_llm = parsed.value
+    
+    if not isinstance(results_llm, dict) or "prediction" not in results_llm:
+        case_result = build_error_result(test_case, generated_text or json.dumps(results_llm))
+    else:
+        case_result = {
+            "user_question": test_case.get("user_question", ""),
+            "ground_truth": test_case.get("ground_truth", ""),
+            "prediction": results_llm["prediction"],
+            "explanation": results_llm.get("explanation", ""),
+            "case_type": "llm_success" 
+        }
+    # Record which parser path produced the result
+    case_result["parse_method"] = parsed.method
+    return case_result
+
+
+def build_error_result(test_case, generated_text):
+    """Build the result entry of a test case whose call or parsing failed"""
+    return {
+        "user_question": test_case.get("user_question", ""),
+        "ground_truth": test_case.get("ground_truth", ""),
+        "prediction": "Error",
+        "explanation": "Original generated text: " +  generated_text,
+        "case_type": "llm_error"
+    }
+
+
+def build_executor_error_result(test_case, case_idx, exc):
+    """Build the result entry of a test case whose whole task failed"""
+    return {
+        "user_question": test_case.get("user_question", ""),
+        "ground_truth": test_case.get("ground_truth", ""),
+        "prediction": "Executor Error",
+        "explanation": f"Error in executor: {str(exc)}",
+        "case_type": "llm_error",
+        "case_idx": case_idx + 1
+    }
+
+
+def new_suite_results(prompt_template, total_cases):
+    """Create an empty suite results structure"""
+    return {
+        "prompt_template": prompt_template,
+        "test_cases": [],
+        "stats": {"total": total_cases, "llm_successful": 0, "llm_fail": 0, "task_succeed": 0,
+                  "cache_hits": 0, "cache_misses": 0, "deduplicated": 0},
+    }
+
+
+def record_case_stats(stats, case_result):
+    """Update the suite statistics with one completed case result"""
+    if case_result["case_type"] == "llm_success":
+        stats["llm_successful"] += 1
+    else:
+        stats["llm_fail"] += 1
+    if case_result.get("duplicate_of"):
+        # Copied from an identical question, no call was made
+        stats["deduplicated"] += 1
+    elif case_result.get("cache_hit"):
+        stats["cache_hits"] += 1
+    else:
+        stats["cache_misses"] += 1
+
+
+def finalize_suite_results(suite_results):
+    """Score the suite against ground truth and roll up per-call latency, token and retry metrics"""
+    suite_results = evaluate_test_results(suite_results)
+    suite_results["stats"].update(summarize_case_metrics(suite_results["test_cases"]))
+    suite_results["stats"]["dedup_ratio"] = dedup_ratio(suite_results["stats"])
+    return suite_results
+
+
+def save_suite_results(suite_results, output_file):
+    """
+    Save suite results to output_file, creating its directory if needed.
+    
+    A ".jsonl" path gets one line per case plus a summary file, an ".arrow",
+    ".feather" or ".parquet" path a columnar ResultStore file, any other path
+    gets a single JSON document.
+    """
+    if is_columnar_path(output_file):
+        ResultStore.from_suite_results(suite_results).save(output_file)
+        print(f"Results saved to {output_file}")
+        return
+
+    if output_file.endswith(".jsonl"):
+        with JsonlResultWriter(output_file, suite_results.get("prompt_template", "")) as writer:
+            for case_result in suite_results["test_cases"]:
+                writer.write(case_result)
+        summary_file = write_summary(suite_results, output_file)
+        print(f"Results saved to {output_file} (summary: {summary_file})")
+        return
+    
+    # Ensure directory exists
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    
+    with open(output_file, "w") as f:
+        json.dump(dict(suite_results, test_cases=list(suite_results["test_cases"])), f, indent=2)
+    print(f"Results saved to {output_file}")
+
+
+def open_result_stream(output_file, prompt_template, resume=False):
+    """
+    Open the streaming JSONL writer for a suite run.
+    
+    Args:
+        output_file (str, optional): Results path; only ".jsonl" paths are streamed
+        prompt_template (str): The template being evaluated
+        resume (bool): Continue a partial file and return the cases it already holds
+        
+    Returns:
+        tuple: (JsonlResultWriter or None, dict of completed case results by 1-based case_idx)
+    """
+    if not output_file or not output_file.endswith(".jsonl"):
+        return None, {}
+    completed_cases = load_completed_cases(output_file, prompt_template) if resume else {}
+    if completed_cases:
+        print(f"Resuming from {output_file}: {len(completed_cases)} cases already done")
+    return JsonlResultWriter(output_file, prompt_template, append=resume), completed_cases
+
+
+def close_result_stream(writer, suite_results, output_file):
+    """Close the streaming writer and write the summary, or save the whole suite if not streaming"""
+    if writer is not None:
+        writer.close()
+        summary_file = write_summary(suite_results, output_file)
+        print(f"Results saved to {output_file} (summary: {summary_file})")
+    elif output_file:
+        save_suite_results(suite_results, output_file)
+
 
 def process_single_test_case(test_case, prompt_template, target_model_id, case_idx, temperature=0.1, top_p=0.9, max_tokens=2000):
     """
@@ -26,64 +233,95 @@ def process_single_test_case(test_case, prompt_template, target_model_id, case_i
     Returns:
         dict: The processed test case result
     """
-    user_question = test_case.get("user_question", "")
-    groundtruth_result = test_case.get("ground_truth", "")
     generated_text = ""
+    cache_hit = False
+    endpoint = None
+    call_metrics = empty_call_metrics()
 
     try:
         # Format the prompt template with the user question        
-        template = Template(prompt_template)
-        formatted_prompt = template.safe_substitute(user_question=user_question)
+        cache_prefix, formatted_prompt = render_prompt_parts(prompt_template, test_case.get("user_question", ""))
 
         # Call the Bedrock Converse API
-        generated_text = call_bedrock_converse(
+        llm_response = invoke_converse(
             prompt=formatted_prompt,
+            cache_prefix=cache_prefix,
             model_id=target_model_id,
             temperature=temperature,
             top_p=top_p,
-            max_tokens=max_tokens
+            max_tokens=max_tokens,
+            tool_config=classification_tool_config(prompt_template) if structured_output_enabled() else None,
+            validate=parse_case_output,
         )
-        #print("############################")
-        #print("Prompt: ")
-        #print(formatted_prompt)
-        #print("Prediction: ")
-        #print(generated_text)
-        #print("############################")
-
-        results_llm = load_json_from_llm_result(generated_text)
-        
+        generated_text = llm_response["text"]
+        cache_hit = llm_response["cache_hit"]
+        endpoint = llm_response.get("endpoint")
+        call_metrics = {field: llm_response[field] for field in CALL_METRIC_FIELDS}
+
         # Create result entry
-        case_result = {
-            "user_question": user_question,
-            "ground_truth": groundtruth_result,
-            "prediction": results_llm["prediction"],
-            "explanation": results_llm["explanation"],
-            "case_type": "llm_success" 
-        }
+        case_result = build_case_result(test_case, generated_text, llm_response["tool_input"],
+                                        parsed=llm_response["parsed"])
         
     except Exception as e:
         # Handle errors
         error_trace = traceback.format_exc()
-        case_result = {
-            "user_question": user_question,
-            "ground_truth": groundtruth_result,
-            "prediction": "Error",
-            "explanation": "Original generated text: " +  generated_text,
-            "case_type": "llm_error"
-        }
+        case_result = build_error_result(test_case, generated_text)
         
         print(f"\nError in test case {case_idx+1}:")
         print(error_trace)
     
     # Add metadata for visualization
     case_result.update({
-        "case_idx": case_idx + 1
+        "case_idx": case_idx + 1,
+        "cache_hit": cache_hit
     })
+    case_result.update(call_metrics)
+    if endpoint is not None:
+        case_result["endpoint"] = endpoint
     
     return case_result
 
 
-def execute_test_cases(data, target_model_id, output_file=None, max_workers=8):
+# In-flight futures per worker thread kept by submit_windowed callers
+IN_FLIGHT_PER_WORKER = 2
+
+
+def submit_windowed(executor, submissions, max_in_flight):
+    """
+    Submit calls from an iterator while keeping at most max_in_flight futures pending.
+
+    Submissions are drawn lazily, so neither the inputs nor the futures of a
+    whole suite are held at once.
+
+    Args:
+        executor (Executor): Pool to submit to
+        submissions (iterable): (key, fn, *args) tuples; fn(*args) is submitted and key is
+            handed back with its future
+        max_in_flight (int): Maximum number of pending futures
+
+    Yields:
+        tuple: (key, future) of each finished call, in completion order
+    """
+    submissions = iter(submissions)
+    pending = {}
+    exhausted = False
+    while True:
+        while not exhausted and len(pending) < max_in_flight:
+            submission = next(submissions, None)
+            if submission is None:
+                exhausted = True
+                break
+            key, fn, *args = submission
+            pending[executor.submit(fn, *args)] = key
+        if not pending:
+            return
+        done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            yield pending.pop(future), future
+
+
+def execute_test_cases(data, target_model_id, output_file=None, max_workers=8, case_indices=None,
+                       resume=False, executor=None, dedup=True):
     """
     Execute all test cases in parallel and track results
     
@@ -91,97 +329,194 @@ def execute_test_cases(data, target_model_id, output_file=None, max_workers=8):
         data (dict): Data containing prompt template and test cases
         target_model_id (str): Model ID to use for inference
         output_file (str, optional): Path to save results. If None, results aren't saved.
-        max_workers (int): Maximum number of parallel workers to use
+            A ".jsonl" path is appended to as each case completes.
+        max_workers (int): Maximum number of parallel workers to use (the size of executor if
+            one is given); sizes the connection pool and the window of submitted cases
+        case_indices (list, optional): Original suite index of each entry in test_cases, used
+            when running a subset of a suite. Defaults to the position in test_cases.
+        resume (bool): Skip the cases already present in a partial ".jsonl" output_file
+        executor (ThreadPoolExecutor, optional): Shared worker pool to submit the cases to,
+            e.g. one pool evaluating several candidate templates; a pool of max_workers
+            threads is created for this call if None
+        dedup (bool): Run each group of identical (normalized) questions once and copy
+            the result to the other cases of the group
         
     Returns:
         dict: Results of all test cases with statistics
     """
+    # Warm up the backend with a connection pool sized to the worker count
+    get_backend().reserve_connections(max_workers)
+
     # Initialize counters and data structures
     prompt_template = data.get("prompt_template", "")
     test_cases = data.get("test_cases", [])
     total_cases = len(test_cases)
     
-    suite_results = {
-        "prompt_template": prompt_template,
-        "test_cases": [],
-        "stats": {"total": total_cases, "llm_successful": 0, "llm_fail": 0, "task_succeed": 0},
-    }
+    suite_results = new_suite_results(prompt_template, total_cases)
+    writer, completed_cases = open_result_stream(output_file, prompt_template, resume)
 
-    # Create a list to store completed results that might come back in any order
-    completed_results = [None] * total_cases
+    # Columnar store of the case results, appended in whatever order they complete
+    store = ResultStore(prompt_template, test_cases=test_cases)
     
     # Process test cases in parallel
     with tqdm(total=total_cases, desc="Processing Test Cases") as pbar:
-        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # Submit all tasks to the executor
-            future_to_idx = {
-                executor.submit(
-                    process_single_test_case,
-                    test_case,
-                    prompt_template,
-                    target_model_id,
-                    case_idx,
-                ): case_idx
-                for case_idx, test_case in enumerate(test_cases)
-            }
+        # Submit to the shared pool if one is given, otherwise to a pool owned by this call
+        if executor is not None:
+            pool_context = nullcontext(executor)
+        else:
+            pool_context = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        with pool_context as executor:
+            # Restore the cases completed by a previous run and copy them to their pending duplicates
+            plan = plan_evaluation(test_cases, case_indices, completed_cases, dedup)
+            for position, case_result in plan.restored + plan.fanned_out:
+                store.append(case_result, position)
+                record_case_stats(suite_results["stats"], case_result)
+                pbar.update(1)
+            if writer is not None:
+                for _, case_result in plan.fanned_out:
+                    writer.write(case_result)
+
+            # Submit one case per group of identical questions, a bounded window at a time
+            submissions = (
+                (group, process_single_test_case, test_cases[group[0]], prompt_template, target_model_id,
+                 case_indices[group[0]] if case_indices is not None else group[0])
+                for group in plan.groups
+            )
             
             # Process results as they complete
-            for future in concurrent.futures.as_completed(future_to_idx):
-                case_idx = future_to_idx[future]
+            for group, future in submit_windowed(executor, submissions, IN_FLIGHT_PER_WORKER * max_workers):
+                position = group[0]
+                case_idx = case_indices[position] if case_indices is not None else position
                 try:
                     case_result = future.result()
-                    completed_results[case_idx] = case_result
-                    
-                    # Update statistics
-                    if case_result["case_type"] == "llm_success":
-                        suite_results["stats"]["llm_successful"] += 1
-                    else:
-                        suite_results["stats"]["llm_fail"] += 1
                     
                 except Exception as exc:
                     print(f"\nError processing case {case_idx+1}: {exc}")
                     # Create an error result if the entire future fails
-                    completed_results[case_idx] = {
-                        "user_question": test_cases[case_idx].get("user_question", ""),
-                        "ground_truth": test_cases[case_idx].get("ground_truth", ""),
-                        "prediction": "Executor Error",
-                        "explanation": f"Error in executor: {str(exc)}",
-                        "case_type": "llm_error",
-                        "case_idx": case_idx + 1
-                    }
-                    suite_results["stats"]["llm_fail"] += 1
+                    case_result = build_executor_error_result(test_cases[position], case_idx, exc)
+                
+                # Fan the result out to the duplicates, update statistics and stream the results to disk
+                for duplicate_position in group:
+                    if duplicate_position != position:
+                        duplicate_idx = case_indices[duplicate_position] if case_indices is not None else duplicate_position
+                        case_result = fan_out_result(case_result, test_cases[duplicate_position], duplicate_idx)
+                    store.append(case_result, duplicate_position)
+                    record_case_stats(suite_results["stats"], case_result)
+                    if writer is not None:
+                        writer.write(case_result)
                 
                 # Update progress bar
-                pbar.update(1)
+                pbar.update(len(group))
                 pbar.set_postfix({
                     "Success": f"{suite_results['stats']['llm_successful']}/{total_cases}",
                 })
     
-    # Add all results in correct order
-    suite_results["test_cases"] = completed_results
+    suite_results["test_cases"] = store
     
-    # Evaluate task success (comparing predictions with ground truth)
-    suite_results = evaluate_test_results(suite_results)
+    # Evaluate task success (comparing predictions with ground truth) and roll up call metrics
+    suite_results = finalize_suite_results(suite_results)
     
-    # Save results if output file is specified
-    if output_file:
-        # Ensure directory exists
-        os.makedirs(os.path.dirname(output_file), exist_ok=True)
-        
-        with open(output_file, "w") as f:
-            json.dump(suite_results, f, indent=2)
-        print(f"Results saved to {output_file}")
+    # Finish the result stream, or save results if output file is specified
+    close_result_stream(writer, suite_results, output_file)
 
     return suite_results
 
-def run_evaluation(test_data, model_id, results_dir="results"):
+def execute_with_engine(data, target_model_id, output_file=None, engine="threads",
+                        max_concurrency=None, case_indices=None, resume=False, executor=None, dedup=True,
+                        request_batch_size=1):
+    """
+    Execute test cases with the selected engine
+    
+    Args:
+        data (dict): Data containing prompt template and test cases
+        target_model_id (str): Model ID to use for inference
+        output_file (str, optional): Path to save results. If None, results aren't saved.
+        engine (str): "threads" for the thread pool executor, "async" for the asyncio engine,
+            "distributed" for the workers of the queue set with configure_distributed
+        max_concurrency (int, optional): Worker threads or in-flight requests; engine default if None
+        case_indices (list, optional): Original suite index of each entry in test_cases
+        resume (bool): Skip the cases already present in a partial ".jsonl" output_file
+        executor (ThreadPoolExecutor, optional): Shared worker pool (threads engine only)
+        dedup (bool): Run each group of identical questions once
+        request_batch_size (int): Cases packed into one request; above 1 the batched
+            mode runs on a thread pool whatever the engine (on each worker when distributed)
+        
+    Returns:
+        dict: Results of all test cases with statistics
+    """
+    if engine == "distributed":
+        # Imported here because the distributed engine builds on this module
+        from src.evaluation.distributed import execute_test_cases_distributed
+        return execute_test_cases_distributed(
+            data, target_model_id, output_file,
+            case_indices=case_indices,
+            resume=resume,
+            dedup=dedup,
+            request_batch_size=request_batch_size,
+        )
+    if request_batch_size > 1:
+        # Imported here because the batched mode builds on this module
+        from src.evaluation.batching import execute_test_cases_batched
+        return execute_test_cases_batched(
+            data, target_model_id, output_file,
+            batch_size=request_batch_size,
+            max_workers=max_concurrency or 8,
+            case_indices=case_indices,
+            resume=resume,
+            executor=executor,
+            dedup=dedup,
+        )
+    if engine == "async":
+        # Imported here because the async engine builds on this module
+        from src.evaluation.async_executor import execute_test_cases_async
+        return asyncio.run(execute_test_cases_async(
+            data, target_model_id, output_file,
+            max_concurrency=max_concurrency or 64,
+            case_indices=case_indices,
+            resume=resume,
+            dedup=dedup,
+        ))
+    if engine != "threads":
+        raise ValueError(f"Unknown evaluation engine: {engine}")
+    return execute_test_cases(
+        data, target_model_id, output_file,
+        max_workers=max_concurrency or 8,
+        case_indices=case_indices,
+        resume=resume,
+        executor=executor,
+        dedup=dedup,
+    )
+
+
+def run_evaluation(test_data, model_id, results_dir="results", racing=False,
+                   baseline_success_rate=None, racing_batch_size=50, racing_confidence=0.95,
+                   racing_min_cases=100, engine="threads", max_concurrency=None, resume_file=None, executor=None,
+                   dedup=True, near_duplicate_threshold=None, request_batch_size=1, stream_sample_size=2000):
     """
     Run evaluation and save results with timestamp
     
     Args:
-        test_data (dict): Test data with prompt template and test cases
+        test_data (dict): Test data with prompt template and test cases, or with a
+            test_source iterable (e.g. a TestCaseSource) instead of test_cases to stream
+            the suite through a bounded window (see execute_test_case_stream)
         model_id (str): Model ID to run inference with
         results_dir (str): Directory to save results
+        racing (bool): Evaluate in stratified minibatches and stop early once the
+            template is clearly better or worse than baseline_success_rate
+        baseline_success_rate (float, optional): Success rate (0-1) to race against
+        racing_batch_size (int): Number of cases per racing minibatch
+        racing_confidence (float): Confidence level of the racing interval
+        racing_min_cases (int): Cases evaluated before racing may stop
+        engine (str): "threads" or "async" execution engine
+        max_concurrency (int, optional): Worker threads or in-flight requests; engine default if None
+        resume_file (str, optional): Partial JSONL results file of an interrupted run to
+            continue; cases already in it are not run again
+        executor (ThreadPoolExecutor, optional): Shared worker pool (threads engine only)
+        dedup (bool): Run each group of identical questions once
+        near_duplicate_threshold (float, optional): In racing mode, only run one representative
+            of each cluster of questions at least this similar (MinHash Jaccard estimate)
+        request_batch_size (int): Cases packed into one request (1 sends each case on its own)
+        stream_sample_size (int): Case results kept in the returned test_cases of a streamed suite
         
     Returns:
         dict: Evaluation results
@@ -189,40 +524,77 @@ def run_evaluation(test_data, model_id, results_dir="results"):
     # Create results directory if it doesn't exist
     os.makedirs(results_dir, exist_ok=True)
     
-    # Create output filename with timestamp
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    output_file = os.path.join(results_dir, f"test_results_{timestamp}.json")
+    # Create output filename with timestamp, results are streamed to it as JSONL
+    if resume_file:
+        output_file = resume_file
+    else:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_file = os.path.join(results_dir, f"test_results_{timestamp}.jsonl")
+    
+    if test_data.get("test_source") is not None:
+        # Imported here because the streamed evaluation builds on this module
+        from src.evaluation.stream_evaluation import execute_test_case_stream
+        source = test_data["test_source"]
+        return execute_test_case_stream(
+            source, test_data.get("prompt_template", ""), model_id, output_file,
+            max_workers=max_concurrency or (64 if engine == "async" and request_batch_size == 1 else 8),
+            resume=bool(resume_file),
+            sample_size=stream_sample_size,
+            total=source.count() if hasattr(source, "count") else None,
+            engine=engine,
+            request_batch_size=request_batch_size,
+        )
+
+    if racing:
+        # Imported here because the racing module builds on execute_test_cases
+        from src.evaluation.racing import run_racing_evaluation
+        return run_racing_evaluation(
+            test_data, model_id,
+            baseline_success_rate=baseline_success_rate,
+            batch_size=racing_batch_size,
+            confidence=racing_confidence,
+            min_cases=racing_min_cases,
+            output_file=output_file,
+            engine=engine,
+            max_concurrency=max_concurrency,
+            executor=executor,
+            dedup=dedup,
+            near_duplicate_threshold=near_duplicate_threshold,
+            request_batch_size=request_batch_size,
+            resume=bool(resume_file),
+        )
     
     # Execute test cases and get results
-    results = execute_test_cases(test_data, model_id, output_file)
+    results = execute_with_engine(
+        test_data, model_id, output_file,
+        engine=engine,
+        max_concurrency=max_concurrency,
+        resume=bool(resume_file),
+        executor=executor,
+        dedup=dedup,
+        request_batch_size=request_batch_size,
+    )
     
     return results
 
 
 
-def call_bedrock_converse(prompt, model_id, temperature=0.7, top_p=250, max_tokens=4096):
+def build_converse_request(prompt, model_id, temperature=0.7, max_tokens=4096, tool_config=None,
+                           cache_prefix=None):
     """
-    Call Amazon Bedrock using the Converse API to generate a response.
+    Build the Converse API request for a single-turn prompt.
     
     Args:
-        prompt (str): The prompt to send to the model
-        model_id (str): The model ID (e.g., "anthropic.claude-3-sonnet-20240229-v1:0")
-        temperature (float): Controls randomness (0-1)
-        top_k (int): Limits token selection to top K options
-        max_tokens (int): Maximum tokens to generate
-        
+        tool_config (dict, optional): Converse toolConfig for structured output
+        cache_prefix (str, optional): Static text sent before the prompt and followed by a
+            cachePoint, so the model can reuse its processing across requests
+    
     Returns:
-        dict: The model's response
+        dict: Keyword arguments for the converse call
     """
-    # Initialize Bedrock client
-    bedrock_runtime = boto3.client(
-        service_name="bedrock-runtime",
-    )
-    
-    # Make the API call
-    response = bedrock_runtime.converse(
-        modelId=model_id,
-        messages= [
+    request = {
+        "modelId": model_id,
+        "messages": [
             {
                 "role": "user",
                 "content": [
@@ -230,12 +602,106 @@ def call_bedrock_converse(prompt, model_id, temperature=0.7, top_p=250, max_toke
                 ]
             }
         ],
-        inferenceConfig= {
+        "inferenceConfig": {
             "temperature": temperature,
             "maxTokens": max_tokens
         }
+    }
+    if cache_prefix:
+        request["messages"][0]["content"][:0] = [{"text": cache_prefix}, {"cachePoint": {"type": "default"}}]
+    if tool_config is not None:
+        request["toolConfig"] = tool_config
+    return request
+
+
+def extract_response_text(response):
+    """Join the text blocks of a Converse API response"""
+    output_message = response['output']['message']
+    return "\n".join(x["text"] for x in output_message["content"] if "text" in x)
+
+
+def request_cache_key(cache, request):
+    """Compute the response cache key of a Converse request"""
+    if "toolConfig" in request:
+        # A structured-output answer must not be served to a text request, or the reverse
+        return cache.make_key(
+            request["modelId"],
+            request["messages"],
+            request["inferenceConfig"],
+            tool_config=request["toolConfig"],
+        )
+    return cache.make_key(
+        request["modelId"],
+        request["messages"],
+        request["inferenceConfig"],
     )
+
+
+def invoke_converse(prompt, model_id, temperature=0.7, top_p=250, max_tokens=4096, tool_config=None,
+                    cache_prefix=None, validate=None):
+    """
+    Call the Converse API through the response cache.
     
-    output_message = response['output']['message']
+    Args:
+        prompt (str): The prompt to send to the model
+        model_id (str): The model ID
+        temperature (float): Controls randomness (0-1)
+        top_p (float): Unused, kept for signature compatibility
+        max_tokens (int): Maximum tokens to generate
+        tool_config (dict, optional): Converse toolConfig for structured output
+        cache_prefix (str, optional): Static prompt prefix to send before a cachePoint
+        validate (callable, optional): Parser called with (text, tool_input) on a fresh response,
+            returning None for an unusable output; only parsed responses are cached, so unusable
+            outputs are requested again next time
+        
+    Returns:
+        dict: "text" with the response text, "tool_input" with the input of the toolUse
+            block (None without one), "parsed" with what validate returned (None on a cache hit
+            or without validate), "cache_hit" telling whether it came from the cache,
+            plus the call metrics: wall_time_ms (including rate-limit waits and retries),
+            server_latency_ms, input_tokens, output_tokens, cache_read_tokens, cache_write_tokens
+            and retries, and "endpoint" naming the routed endpoint that served the call (None
+            without routing or on a cache hit)
+    """
+    start_time = time.perf_counter()
+    request = build_converse_request(prompt, model_id, temperature, max_tokens, tool_config, cache_prefix)
+    
+    cache = get_response_cache()
+    cache_key = None
+    if cache is not None:
+        cache_key = request_cache_key(cache, request)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return dict(empty_call_metrics(), text=cached["text"], tool_input=cached.get("tool_input"),
+                        parsed=None, cache_hit=True, wall_time_ms=(time.perf_counter() - start_time) * 1000)
+    
+    # Make the API call through the configured backend within the model's rate limits,
+    # retrying throttled calls
+    response, retries = call_with_rate_limit(get_backend().converse, request)
+    text = extract_response_text(response)
+    tool_input = extract_tool_input(response) if tool_config is not None else None
+    
+    parsed = validate(text, tool_input) if validate is not None else None
+    if cache is not None and (validate is None or parsed is not None):
+        cache.put(cache_key, {"text": text, "tool_input": tool_input})
+    
+    return dict(response_metrics(response), text=text, tool_input=tool_input, parsed=parsed, cache_hit=False,
+                endpoint=response.get("endpoint"), retries=retries,
+                wall_time_ms=(time.perf_counter() - start_time) * 1000)
 
-    return "\n".join(x["text"] for x in output_message["content"])
\ No newline at end of file
+
+def call_bedrock_converse(prompt, model_id, temperature=0.7, top_p=250, max_tokens=4096):
+    """
+    Call Amazon Bedrock using the Converse API to generate a response.
+    
+    Args:
+        prompt (str): The prompt to send to the model
+        model_id (str): The model ID (e.g., "anthropic.claude-3-sonnet-20240229-v1:0")
+        temperature (float): Controls randomness (0-1)
+        top_k (int): Limits token selection to top K options
+        max_tokens (int): Maximum tokens to generate
+        
+    Returns:
+        dict: The model's response
+    """
+    return invoke_converse(prompt, model_id, temperature, top_p, max_tokens)["text"]
@@ -0,0 +1,100 @@
+import concurrent.futures
+import os
+from contextlib import nullcontext
+from datetime import datetime
+
+from src.evaluation.executor import run_evaluation
+
+
+def evaluate_candidates(test_data, candidate_templates, model_id, results_dir, output_files=None,
+                        max_workers=8, racing=False, baseline_success_rate=None,
+                        racing_batch_size=50, racing_confidence=0.95, racing_min_cases=100, dedup=True,
+                        near_duplicate_threshold=None, request_batch_size=1, engine="threads"):
+    """
+    Evaluate several candidate templates together through one shared worker pool.
+
+    All candidates submit their test cases to the same pool of max_workers
+    threads, so the pool stays busy while individual candidates finish or
+    stop early (racing) and the total concurrency stays within the rate limits
+    sized for max_workers. With the "async" or "distributed" engine each
+    candidate runs on that engine instead (max_workers is then the concurrency
+    of each candidate's evaluation).
+
+    Args:
+        test_data (dict): Test data; its prompt_template is replaced by each candidate
+        candidate_templates (list): Prompt templates to evaluate
+        model_id (str): Model ID to run inference with
+        results_dir (str): Directory to save results
+        output_files (list, optional): JSONL results file per candidate; resumed if partially written
+        max_workers (int): Size of the shared worker pool
+        racing (bool): Race every candidate against baseline_success_rate
+        baseline_success_rate (float, optional): Success rate (0-1) to race against
+        racing_batch_size (int): Number of cases per racing minibatch
+        racing_confidence (float): Confidence level of the racing interval
+        racing_min_cases (int): Cases evaluated before racing may stop
+        dedup (bool): Run each group of identical questions once
+        near_duplicate_threshold (float, optional): Race one representative per near-duplicate cluster
+        request_batch_size (int): Cases packed into one request
+        engine (str): "threads", "async" or "distributed" execution engine
+
+    Returns:
+        list: Evaluation results per candidate, in candidate order (None if a candidate failed)
+    """
+    results = [None] * len(candidate_templates)
+    if not candidate_templates:
+        return results
+
+    if output_files is None:
+        # Candidates run at the same time, so each needs its own results file
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_files = [os.path.join(results_dir, f"test_results_{timestamp}_candidate_{position}.jsonl")
+                        for position in range(len(candidate_templates))]
+
+    # Only the threads engine submits to a shared pool
+    if engine == "threads":
+        pool_context = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    else:
+        pool_context = nullcontext()
+    with pool_context as shared_pool:
+        # One coordinating thread per candidate; the cases themselves run on the shared pool
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(candidate_templates)) as coordinators:
+            future_to_position = {}
+            for position, candidate_template in enumerate(candidate_templates):
+                future = coordinators.submit(
+                    run_evaluation,
+                    dict(test_data, prompt_template=candidate_template),
+                    model_id,
+                    results_dir,
+                    racing=racing,
+                    baseline_success_rate=baseline_success_rate,
+                    racing_batch_size=racing_batch_size,
+                    racing_confidence=racing_confidence,
+                    racing_min_cases=racing_min_cases,
+                    engine=engine,
+                    max_concurrency=max_workers,
+                    resume_file=output_files[position],
+                    executor=shared_pool,
+                    dedup=dedup,
+                    near_duplicate_threshold=near_duplicate_threshold,
+                    request_batch_size=request_batch_size,
+                )
+                future_to_position[future] = position
+
+            for future in concurrent.futures.as_completed(future_to_position):
+                position = future_to_position[future]
+                try:
+                    results[position] = future.result()
+                except Exception as exc:
+                    print(f"\nError evaluating candidate {position+1}: {exc}")
+
+    return results
+
+
+def suite_success_rate(results):
+    """Task success rate (%) of evaluation results, None if unavailable"""
+    if results and results['stats'].get('racing', {}).get('success_rate') is not None:
+        # Cluster-weighted estimate of a race over near-duplicate representatives
+        return results['stats']['racing']['success_rate'] * 100
+    if not results or not results['stats'].get('total') or 'task_succeed' not in results['stats']:
+        return None
+    return results['stats']['task_succeed'] / results['stats']['total'] * 100
\ No newline at end of file
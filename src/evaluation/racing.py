@@ -0,0 +1,228 @@
+import math
+import random
+from collections import defaultdict
+from statistics import NormalDist
+
+from src.evaluation.dedup import near_duplicate_clusters
+from src.evaluation.executor import (
+    close_result_stream,
+    execute_with_engine,
+    finalize_suite_results,
+    new_suite_results,
+    open_result_stream,
+    record_case_stats,
+)
+from src.utils.result_store import ResultStore
+from src.utils.scoring import ScoringEngine
+
+# Minibatch stats that add up across minibatches; rates and roll-ups are recomputed at the end
+RACING_COUNT_STATS = ("total", "llm_successful", "llm_fail", "task_succeed", "cache_hits", "cache_misses",
+                      "deduplicated", "batch_requests", "batch_retries")
+
+# Cases evaluated before the first stopping check
+DEFAULT_MIN_CASES = 100
+
+
+def wilson_interval(successes, total, confidence=0.95):
+    """
+    Wilson score interval for a binomial success rate.
+
+    Args:
+        successes (int): Number of successful cases
+        total (int): Number of cases evaluated
+        confidence (float): Two-sided confidence level
+
+    Returns:
+        tuple: (lower, upper) bounds of the success rate, in [0, 1]
+    """
+    if total == 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(1 - (1 - confidence) / 2)
+    p = successes / total
+    denominator = 1 + z * z / total
+    centre = (p + z * z / (2 * total)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / total + z * z / (4 * total * total)) / denominator
+    return max(0.0, centre - margin), min(1.0, centre + margin)
+
+
+def stratified_order(test_cases, seed=0):
+    """
+    Shuffle case indices so that every prefix is stratified by ground truth.
+
+    Each class is shuffled on its own and its cases are spread evenly over the
+    whole ordering, so any minibatch taken from the front has roughly the same
+    class mix as the full suite.
+
+    Args:
+        test_cases (list): Test cases with a ground_truth field
+        seed (int): Random seed for the shuffle
+
+    Returns:
+        list: Case indices in evaluation order
+    """
+    rng = random.Random(seed)
+    by_class = defaultdict(list)
+    for case_idx, test_case in enumerate(test_cases):
+        by_class[str(test_case.get("ground_truth", ""))].append(case_idx)
+
+    keyed = []
+    for indices in by_class.values():
+        rng.shuffle(indices)
+        count = len(indices)
+        for rank, case_idx in enumerate(indices):
+            keyed.append(((rank + rng.random()) / count, case_idx))
+    keyed.sort()
+    return [case_idx for _, case_idx in keyed]
+
+
+def planned_looks(suite_size, batch_size, min_cases):
+    """Number of minibatch ends at which a race of suite_size cases checks its stopping rule"""
+    ends = range(batch_size, suite_size + batch_size, batch_size)
+    return max(1, sum(1 for end in ends if min(end, suite_size) >= min_cases))
+
+
+def run_racing_evaluation(data, target_model_id, baseline_success_rate=None, batch_size=50,
+                          confidence=0.95, min_cases=DEFAULT_MIN_CASES, seed=0, output_file=None,
+                          engine="threads", max_concurrency=None, executor=None, dedup=True,
+                          near_duplicate_threshold=None, request_batch_size=1, resume=False):
+    """
+    Evaluate a template in stratified minibatches and stop once the outcome is clear.
+
+    After each minibatch (once min_cases are done) the Wilson interval of the task
+    success rate is compared with the baseline (usually the best success rate so
+    far). Evaluation stops when the upper bound falls below the baseline (candidate
+    beaten) or the lower bound rises above it (candidate wins). The error rate
+    1 - confidence is split evenly over the planned checks (Bonferroni), so the
+    chance of a wrong early stop over the whole race stays within it. Without a
+    baseline every case is run. With near-duplicate clusters, each representative
+    counts for its cluster size, so the estimate is of the full suite's success
+    rate (the interval then uses the effective sample size of the weights).
+    Each minibatch is appended to a ".jsonl" output_file as soon as it is done,
+    and a resumed race takes the cases already in the file instead of running
+    them again.
+
+    Args:
+        data (dict): Data containing prompt template and test cases
+        target_model_id (str): Model ID to use for inference
+        baseline_success_rate (float, optional): Success rate to race against, in [0, 1]
+        batch_size (int): Number of cases per minibatch
+        confidence (float): Confidence level of the interval
+        min_cases (int): Minimum number of cases to evaluate before the first stopping check
+        seed (int): Random seed for the stratified shuffle
+        output_file (str, optional): Path to save results. If None, results aren't saved.
+        engine (str): "threads" or "async" execution engine
+        max_concurrency (int, optional): Worker threads or in-flight requests; engine default if None
+        executor (ThreadPoolExecutor, optional): Shared worker pool (threads engine only)
+        dedup (bool): Run each group of identical questions in a minibatch once
+        near_duplicate_threshold (float, optional): Cluster near-duplicate questions (estimated
+            Jaccard similarity of word shingles at least this value) and only race one
+            representative per cluster, so minibatches are not spent on near-identical cases
+        request_batch_size (int): Cases packed into one request within a minibatch
+        resume (bool): Continue the race recorded in a partial ".jsonl" output_file
+
+    Returns:
+        dict: Results of the evaluated cases, with a "racing" entry in stats holding the decision
+            and the (cluster-weighted) success_rate estimate
+    """
+    prompt_template = data.get("prompt_template", "")
+    test_cases = data.get("test_cases", [])
+    order = stratified_order(test_cases, seed=seed)
+    clusters = None
+    weights = {}
+    if near_duplicate_threshold is not None:
+        clusters = near_duplicate_clusters(test_cases, threshold=near_duplicate_threshold, seed=seed)
+        weights = {cluster[0]: len(cluster) for cluster in clusters}
+        order = [case_idx for case_idx in order if case_idx in weights]
+    look_confidence = 1 - (1 - confidence) / planned_looks(len(order), batch_size, min_cases)
+
+    suite_results = new_suite_results(prompt_template, 0)
+    stats = suite_results["stats"]
+    # Results of every minibatch, with questions referring to the suite's test cases
+    store = suite_results["test_cases"] = ResultStore(prompt_template, test_cases=test_cases)
+    writer, completed_cases = open_result_stream(output_file, prompt_template, resume)
+    decision = "exhausted"
+    lower, upper = 0.0, 1.0
+    # Weighted successes, weight and squared weight of the evaluated cases
+    weighted = [0.0, 0.0, 0.0]
+
+    def add_weights(case_results):
+        for case_result in case_results:
+            weight = weights.get(case_result["case_idx"] - 1, 1)
+            weighted[0] += weight * bool(case_result.get("task_succeed"))
+            weighted[1] += weight
+            weighted[2] += weight * weight
+
+    for start in range(0, len(order), batch_size):
+        batch_indices = order[start:start + batch_size]
+
+        # Cases of this minibatch a previous run of the race already finished
+        restored = [completed_cases[case_idx + 1] for case_idx in batch_indices if case_idx + 1 in completed_cases]
+        if restored:
+            for case_result in restored:
+                store.append(case_result, case_result["case_idx"] - 1)
+            stats["task_succeed"] += ScoringEngine().add_cases(restored)
+            stats["total"] += len(restored)
+            for case_result in restored:
+                record_case_stats(stats, case_result)
+            add_weights(restored)
+
+        pending_indices = [case_idx for case_idx in batch_indices if case_idx + 1 not in completed_cases]
+        if pending_indices:
+            batch_results = execute_with_engine(
+                {"prompt_template": prompt_template,
+                 "test_cases": [test_cases[case_idx] for case_idx in pending_indices]},
+                target_model_id,
+                engine=engine,
+                max_concurrency=max_concurrency,
+                case_indices=pending_indices,
+                executor=executor,
+                dedup=dedup,
+                request_batch_size=request_batch_size,
+            )
+
+            # Merge minibatch results into the running totals and stream them to disk
+            batch_cases = list(batch_results["test_cases"])
+            for case_result in batch_cases:
+                store.append(case_result, case_result["case_idx"] - 1)
+            for key in RACING_COUNT_STATS:
+                if key in batch_results["stats"]:
+                    stats[key] = stats.get(key, 0) + batch_results["stats"][key]
+            add_weights(batch_cases)
+            if writer is not None:
+                for case_result in batch_cases:
+                    writer.write(case_result)
+
+        evaluated = suite_results["stats"]["total"]
+        successes, weight, weight_squares = weighted
+        effective = weight * weight / weight_squares if weight_squares else 0
+        lower, upper = wilson_interval(successes / weight * effective if weight else 0, effective, look_confidence)
+        print(f"Racing: {evaluated}/{len(order)} cases, "
+              f"success rate CI [{lower * 100:.1f}%, {upper * 100:.1f}%]")
+
+        if baseline_success_rate is None or evaluated < min_cases:
+            continue
+        if upper < baseline_success_rate:
+            decision = "beaten"
+            break
+        if lower > baseline_success_rate:
+            decision = "wins"
+            break
+
+    suite_results = finalize_suite_results(suite_results)
+    suite_results["stats"]["racing"] = {
+        "decision": decision,
+        "cases_evaluated": suite_results["stats"]["total"],
+        "suite_size": len(test_cases),
+        "clusters": len(clusters) if clusters is not None else None,
+        "baseline_success_rate": baseline_success_rate,
+        "success_rate": weighted[0] / weighted[1] if weighted[1] else None,
+        "ci_lower": lower,
+        "ci_upper": upper,
+        "confidence": confidence,
+        "look_confidence": look_confidence,
+        "min_cases": min_cases,
+    }
+
+    close_result_stream(writer, suite_results, output_file)
+
+    return suite_results
@@ -0,0 +1,255 @@
+"""
+Evaluation of suites streamed from disk.
+
+execute_test_cases holds the whole suite and one result slot per case. Here
+test cases are drawn from an iterable (e.g. a TestCaseSource reading JSONL
+shards line by line), at most max_in_flight of them are submitted at a time,
+and each result is handed to the consumers as it completes: the confusion
+matrix scoring, the call metrics roll-up, the JSONL writer and a bounded
+uniform sample of case results kept for the critique. Memory is independent
+of the suite size. Cases run on a thread pool, on an event loop (async
+engine) or packed several to a request (batched mode, on a thread pool).
+
+Identical questions are not grouped (that needs the whole suite); repeated
+questions are served by the response cache instead.
+"""
+import asyncio
+import concurrent.futures
+import json
+import os
+from itertools import islice
+
+from tqdm import tqdm
+
+from src.evaluation.async_executor import process_single_test_case_async
+from src.evaluation.batching import process_batch
+from src.evaluation.dedup import dedup_ratio
+from src.evaluation.executor import (
+    IN_FLIGHT_PER_WORKER,
+    build_executor_error_result,
+    close_result_stream,
+    new_suite_results,
+    process_single_test_case,
+    record_case_stats,
+    submit_windowed,
+)
+from src.inference.backends import get_backend
+from src.utils.result_writer import JsonlResultWriter, iter_result_records, read_results_header, summary_path
+from src.utils.scoring import ScoringEngine
+from src.utils.telemetry import CaseMetricsAccumulator, ReservoirSample
+
+# Case results kept for the critique of a streamed suite
+DEFAULT_SAMPLE_SIZE = 2000
+
+
+class CompletedCases:
+    """Set of completed 0-based case indices, one byte per case up to the highest index"""
+
+    def __init__(self):
+        self._flags = bytearray()
+
+    def add(self, case_idx):
+        if case_idx >= len(self._flags):
+            self._flags.extend(bytes(max(case_idx + 1 - len(self._flags), len(self._flags))))
+        self._flags[case_idx] = 1
+
+    def __contains__(self, case_idx):
+        return case_idx < len(self._flags) and self._flags[case_idx] == 1
+
+
+def _chunks(items, size):
+    """Lists of up to size consecutive items, drawn lazily from an iterable"""
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _run_threads(pending, prompt_template, target_model_id, max_workers, max_in_flight, finish):
+    """Run one case per request on a thread pool and pass each result to finish as it completes"""
+    submissions = (
+        ((case_idx, test_case), process_single_test_case, test_case, prompt_template, target_model_id, case_idx)
+        for case_idx, test_case in pending
+    )
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for (case_idx, test_case), future in submit_windowed(executor, submissions, max_in_flight):
+            try:
+                case_result = future.result()
+            except Exception as exc:
+                print(f"\nError processing case {case_idx+1}: {exc}")
+                case_result = build_executor_error_result(test_case, case_idx, exc)
+            finish([case_result])
+
+
+def _run_batched(pending, prompt_template, target_model_id, max_workers, max_in_flight, batch_size, finish,
+                 stats):
+    """Run batch_size cases per request on a thread pool and pass each batch's results to finish"""
+    submissions = (
+        (None, process_batch, [test_case for _, test_case in batch], prompt_template, target_model_id,
+         [case_idx for case_idx, _ in batch])
+        for batch in _chunks(pending, batch_size)
+    )
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for _, future in submit_windowed(executor, submissions, max(1, max_in_flight // batch_size)):
+            case_results = future.result()
+            stats["batch_requests"] += 1
+            stats["batch_retries"] += sum(1 for case_result in case_results if case_result.get("batch_retry"))
+            finish(case_results)
+
+
+async def _run_async(pending, prompt_template, target_model_id, max_concurrency, max_in_flight, finish):
+    """
+    Run one case per request on the event loop and pass each round of finished
+    results to finish, which runs off the loop like the async engine's file I/O
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    # asyncio.to_thread fallbacks would otherwise be capped by the default pool size
+    asyncio.get_running_loop().set_default_executor(
+        concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrency))
+
+    async with get_backend().async_client(max_pool_connections=max_concurrency) as client:
+
+        async def run_case(case_idx, test_case):
+            async with semaphore:
+                try:
+                    return await process_single_test_case_async(
+                        client, test_case, prompt_template, target_model_id, case_idx
+                    )
+                except Exception as exc:
+                    print(f"\nError processing case {case_idx+1}: {exc}")
+                    return build_executor_error_result(test_case, case_idx, exc)
+
+        in_flight = set()
+        while True:
+            for case_idx, test_case in pending:
+                in_flight.add(asyncio.ensure_future(run_case(case_idx, test_case)))
+                if len(in_flight) >= max_in_flight:
+                    break
+            if not in_flight:
+                break
+            done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            await asyncio.to_thread(finish, [task.result() for task in done])
+
+
+def execute_test_case_stream(test_cases, prompt_template, target_model_id, output_file=None, max_workers=8,
+                             max_in_flight=None, resume=False, sample_size=DEFAULT_SAMPLE_SIZE, consumers=(),
+                             total=None, seed=0, engine="threads", request_batch_size=1):
+    """
+    Execute a stream of test cases with a bounded window of in-flight requests
+
+    Args:
+        test_cases (iterable): Test cases in suite order; the position in the stream is the case index
+        prompt_template (str): Template to evaluate
+        target_model_id (str): Model ID to use for inference
+        output_file (str, optional): ".jsonl" path each case result is appended to as it completes
+        max_workers (int): Maximum number of parallel workers to use (in-flight requests
+            with the async engine)
+        max_in_flight (int, optional): Maximum number of submitted, unfinished cases;
+            IN_FLIGHT_PER_WORKER per worker (times request_batch_size) if None
+        resume (bool): Skip the cases already present in a partial output_file
+        sample_size (int): Case results kept (uniformly sampled) in the returned test_cases
+        consumers (iterable): Extra callables each scored case result is passed to, in completion order
+        total (int, optional): Number of test cases, for the progress bar
+        seed (int): Seed of the case result and latency samples
+        engine (str): "threads" for a thread pool, "async" for the asyncio engine
+        request_batch_size (int): Cases packed into one request; above 1 the batched
+            mode runs on a thread pool whatever the engine
+
+    Returns:
+        dict: Suite results whose stats cover every case and whose test_cases are the sample
+    """
+    if output_file and not output_file.endswith(".jsonl"):
+        raise ValueError(f"Streamed evaluation writes JSONL results, got '{output_file}'")
+    if engine not in ("threads", "async"):
+        raise ValueError(f"Streamed evaluation runs on the threads or async engine, got '{engine}'")
+    max_in_flight = max_in_flight or IN_FLIGHT_PER_WORKER * max_workers * request_batch_size
+    use_async = engine == "async" and request_batch_size == 1
+    if not use_async:
+        get_backend().reserve_connections(max_workers)
+
+    suite_results = new_suite_results(prompt_template, 0)
+    stats = suite_results["stats"]
+    if request_batch_size > 1:
+        stats.update({"batch_requests": 0, "batch_retries": 0})
+    engine = ScoringEngine()
+    metrics = CaseMetricsAccumulator(max_latency_samples=sample_size, seed=seed)
+    sample = ReservoirSample(sample_size, seed)
+
+    def consume(case_result):
+        case_result["task_succeed"] = engine.add(case_result.get("ground_truth", ""),
+                                                 case_result.get("prediction", ""))
+        record_case_stats(stats, case_result)
+        metrics.add(case_result)
+        sample.add(case_result)
+        for consumer in consumers:
+            consumer(case_result)
+
+    # Fold in the cases a previous run completed and remember them so they are not run again
+    completed = CompletedCases()
+    resuming = bool(resume and output_file and os.path.exists(output_file) and os.path.getsize(output_file) > 0)
+    if resuming:
+        header = read_results_header(output_file)
+        if header is not None and header.get("prompt_template") != prompt_template:
+            raise ValueError(f"Results file '{output_file}' was written for a different prompt template")
+        for case_result in iter_result_records(output_file):
+            if "case_idx" in case_result and case_result["case_idx"] - 1 not in completed:
+                completed.add(case_result["case_idx"] - 1)
+                consume(case_result)
+        print(f"Resuming from {output_file}: {stats['llm_successful'] + stats['llm_fail']} cases already done")
+    writer = JsonlResultWriter(output_file, prompt_template, append=resuming) if output_file else None
+
+    pending = ((case_idx, test_case) for case_idx, test_case in enumerate(test_cases) if case_idx not in completed)
+
+    with tqdm(total=total, initial=stats["llm_successful"] + stats["llm_fail"],
+              desc="Processing Test Cases") as pbar:
+
+        def finish(case_results):
+            for case_result in case_results:
+                consume(case_result)
+                if writer is not None:
+                    writer.write(case_result)
+            pbar.update(len(case_results))
+            pbar.set_postfix({"Success": f"{stats['llm_successful']}/{total or '?'}"})
+
+        if request_batch_size > 1:
+            _run_batched(pending, prompt_template, target_model_id, max_workers, max_in_flight,
+                         request_batch_size, finish, stats)
+        elif use_async:
+            asyncio.run(_run_async(pending, prompt_template, target_model_id, max_workers, max_in_flight, finish))
+        else:
+            _run_threads(pending, prompt_template, target_model_id, max_workers, max_in_flight, finish)
+
+    stats["total"] = stats["llm_successful"] + stats["llm_fail"]
+    stats["task_succeed"] = int(engine.confusion_matrix.trace())
+    stats["scores"] = engine.to_dict()
+    stats.update(metrics.summary())
+    stats["dedup_ratio"] = dedup_ratio(stats)
+    stats["sampled_cases"] = len(sample.items)
+    suite_results["test_cases"] = sorted(sample.items, key=lambda case: case.get("case_idx", 0))
+
+    close_result_stream(writer, suite_results, output_file)
+    return suite_results
+
+
+def load_sampled_results(results_file, sample_size=DEFAULT_SAMPLE_SIZE, seed=0):
+    """
+    Rebuild the suite results of a streamed evaluation from its JSONL file and summary.
+
+    The file is read one line at a time and only a uniform sample of sample_size
+    case results is kept, as execute_test_case_stream returns them.
+    """
+    header = read_results_header(results_file) or {}
+    sample = ReservoirSample(sample_size, seed)
+    for case_result in iter_result_records(results_file):
+        sample.add(case_result)
+    stats = {}
+    if os.path.exists(summary_path(results_file)):
+        with open(summary_path(results_file), "r", encoding="utf-8") as f:
+            stats = json.load(f).get("stats", {})
+    return {
+        "prompt_template": header.get("prompt_template", ""),
+        "test_cases": sorted(sample.items, key=lambda case: case.get("case_idx", 0)),
+        "stats": stats,
+    }
\ No newline at end of file
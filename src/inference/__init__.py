@@ -0,0 +1,22 @@
+"""
+Inference backends speaking the Bedrock Converse API shape.
+"""
+from src.inference.backends import ConverseBackend, BedrockConverseBackend, get_backend, set_backend
+from src.inference.mock_server import MockConverseBackend, serve_mock_converse
+from src.inference.routing import RoutedEndpoint, RoutingConverseBackend, load_endpoints
+from src.inference.streaming import converse_via_stream, SuggestionComplete, JsonFenceComplete
+
+__all__ = [
+    'ConverseBackend',
+    'BedrockConverseBackend',
+    'MockConverseBackend',
+    'RoutedEndpoint',
+    'RoutingConverseBackend',
+    'load_endpoints',
+    'get_backend',
+    'set_backend',
+    'serve_mock_converse',
+    'converse_via_stream',
+    'SuggestionComplete',
+    'JsonFenceComplete',
+]
\ No newline at end of file
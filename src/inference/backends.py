@@ -0,0 +1,195 @@
+import asyncio
+import json
+
+from src.utils.bedrock_client import get_bedrock_runtime_client
+
+try:
+    from aiobotocore.session import get_session as get_aiobotocore_session
+    from aiobotocore.config import AioConfig
+except ImportError:  # aiobotocore is optional
+    get_aiobotocore_session = None
+    AioConfig = None
+
+
+class ConverseBackend:
+    """
+    Interface of an inference backend speaking the Bedrock Converse API shape.
+
+    converse takes the same keyword arguments as bedrock-runtime converse
+    (modelId, messages, system, inferenceConfig, ...) and returns a response
+    dict with output.message.content, usage and metrics.
+    """
+
+    name = "base"
+
+    def converse(self, **request):
+        """Run a Converse call and return the raw response"""
+        raise NotImplementedError
+
+    async def converse_async(self, **request):
+        """Await a Converse call; runs converse in a worker thread unless overridden"""
+        return await asyncio.to_thread(self.converse, **request)
+
+    def converse_stream(self, **request):
+        """
+        Run a ConverseStream call and return an iterable of stream events.
+
+        Events follow the ConverseStream shape (messageStart, contentBlockDelta,
+        contentBlockStop, messageStop, metadata). Unless overridden, the events
+        are replayed from a blocking converse call.
+        """
+        response = self.converse(**request)
+        events = [{"messageStart": {"role": "assistant"}}]
+        for index, block in enumerate(response["output"]["message"]["content"]):
+            if "reasoningContent" in block:
+                events.append({"contentBlockDelta": {"contentBlockIndex": index, "delta": {
+                    "reasoningContent": dict(block["reasoningContent"]["reasoningText"])}}})
+            elif "toolUse" in block:
+                events.append({"contentBlockStart": {"contentBlockIndex": index, "start": {"toolUse": {
+                    "toolUseId": block["toolUse"]["toolUseId"], "name": block["toolUse"]["name"]}}}})
+                events.append({"contentBlockDelta": {"contentBlockIndex": index, "delta": {
+                    "toolUse": {"input": json.dumps(block["toolUse"]["input"])}}}})
+            elif "text" in block:
+                events.append({"contentBlockDelta": {"contentBlockIndex": index, "delta": {"text": block["text"]}}})
+            events.append({"contentBlockStop": {"contentBlockIndex": index}})
+        events.append({"messageStop": {"stopReason": response.get("stopReason", "end_turn")}})
+        events.append({"metadata": {key: response[key] for key in ("usage", "metrics") if key in response}})
+        return iter(events)
+
+    def reserve_connections(self, count):
+        """Make sure the backend can serve count concurrent calls (e.g. size a connection pool)"""
+
+    def async_client(self, max_pool_connections=64):
+        """Return an async context manager yielding an object with an async converse method"""
+        return _BackendAsyncClient(self)
+
+
+class _BackendAsyncClient:
+    """Async client adapter that delegates to a backend's converse_async"""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return None
+
+    async def converse(self, **request):
+        return await self.backend.converse_async(**request)
+
+
+class BedrockConverseBackend(ConverseBackend):
+    """Backend calling Amazon Bedrock through the shared, pooled runtime client"""
+
+    name = "bedrock"
+
+    def __init__(self, region_name=None, endpoint_url=None, connect_timeout=300, read_timeout=300,
+                 max_attempts=None):
+        """
+        Args:
+            region_name (str, optional): AWS region, defaults to the session region
+            endpoint_url (str, optional): Override the endpoint, e.g. a local mock Converse server
+            connect_timeout (int): Connection timeout in seconds
+            read_timeout (int): Read timeout in seconds
+            max_attempts (int, optional): Attempts botocore makes per call; 1 leaves every retry
+                to the caller (e.g. a router failing over to another endpoint)
+        """
+        self.region_name = region_name
+        self.endpoint_url = endpoint_url
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_attempts = max_attempts
+
+    def client(self, max_pool_connections=None):
+        """Return the shared boto3 client for this backend's configuration"""
+        return get_bedrock_runtime_client(
+            max_pool_connections=max_pool_connections,
+            connect_timeout=self.connect_timeout,
+            read_timeout=self.read_timeout,
+            region_name=self.region_name,
+            endpoint_url=self.endpoint_url,
+            max_attempts=self.max_attempts,
+        )
+
+    def converse(self, **request):
+        return self.client().converse(**request)
+
+    def converse_stream(self, **request):
+        # The EventStream yields events as they arrive; closing it drops the connection
+        return self.client().converse_stream(**request)["stream"]
+
+    def reserve_connections(self, count):
+        self.client(max_pool_connections=count)
+
+    def async_client(self, max_pool_connections=64):
+        return AsyncBedrockClient(self, max_pool_connections)
+
+
+class AsyncBedrockClient:
+    """
+    Async Bedrock runtime client used by the asyncio evaluation engine.
+
+    Uses aiobotocore when it is installed (it is optional, see
+    requirements.txt), so thousands of requests can be in flight from a single
+    thread. Without it, calls fall back to the shared boto3 client run through
+    asyncio.to_thread: every in-flight call then holds a thread of the loop's
+    default pool (sized to max_concurrency by execute_test_cases_async), so the
+    async engine is no lighter than the thread engine.
+    """
+
+    def __init__(self, backend, max_pool_connections=64):
+        self.backend = backend
+        self.max_pool_connections = max_pool_connections
+        self._client = None
+        self._client_context = None
+
+    async def __aenter__(self):
+        if get_aiobotocore_session is not None:
+            config = AioConfig(
+                connect_timeout=self.backend.connect_timeout,
+                read_timeout=self.backend.read_timeout,
+                max_pool_connections=self.max_pool_connections,
+                retries={"mode": "standard", "total_max_attempts": self.backend.max_attempts}
+                if self.backend.max_attempts else None,
+            )
+            self._client_context = get_aiobotocore_session().create_client(
+                "bedrock-runtime",
+                region_name=self.backend.region_name,
+                endpoint_url=self.backend.endpoint_url,
+                config=config,
+            )
+            self._client = await self._client_context.__aenter__()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self._client_context is not None:
+            await self._client_context.__aexit__(exc_type, exc, tb)
+            self._client_context = None
+            self._client = None
+
+    async def converse(self, **request):
+        """Run a Converse API call and return the raw response"""
+        if self._client is not None:
+            return await self._client.converse(**request)
+        client = self.backend.client(max_pool_connections=self.max_pool_connections)
+        return await asyncio.to_thread(client.converse, **request)
+
+
+_backend = None
+
+
+def set_backend(backend):
+    """Set the process-wide inference backend used by all Converse call sites"""
+    global _backend
+    _backend = backend
+    return backend
+
+
+def get_backend():
+    """Return the process-wide inference backend, defaulting to Amazon Bedrock"""
+    global _backend
+    if _backend is None:
+        _backend = BedrockConverseBackend()
+    return _backend
@@ -0,0 +1,428 @@
+"""
+Local stand-in for the Bedrock Converse API.
+
+MockConverseBackend is an in-process fake with configurable latency, throttle
+and error injection, reasoning content blocks, toolUse answers for requests
+with a toolConfig and usage reporting, including prompt cache reads and writes
+for requests with cachePoint blocks. The same
+fake can be served over HTTP (POST /model/<modelId>/converse) so that a real
+boto3 client pointed at it with endpoint_url exercises the full network path:
+
+    python -m src.inference.mock_server --port 8088 --latency-ms 300
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+from botocore.exceptions import ClientError
+
+from src.inference.backends import ConverseBackend
+from src.utils.parsers import parse_llm_json
+from src.utils.structured_output import LABEL_PATTERN
+
+INQUIRY_PATTERN = re.compile(r'<inquiry id="(\d+)">(.*?)</inquiry>', re.DOTALL)
+
+REWRITE_HINTS = [
+    "If several categories apply, pick the most specific one.",
+    "Base the category on the customer's main request, not on incidental details.",
+    "Prefer ESCALATION whenever the customer reports fraud or demands a supervisor.",
+    "Treat greetings and thanks without a request as ACKNOWLEDGMENT.",
+]
+
+
+def _request_text(request):
+    parts = []
+    for block in request.get("system", []) or []:
+        parts.append(block.get("text", ""))
+    for message in request.get("messages", []):
+        for block in message.get("content", []):
+            if "text" in block:
+                parts.append(block["text"])
+    return "\n".join(parts)
+
+
+def _cached_prefix(request):
+    """Text of a request up to its last cachePoint block, "" without one"""
+    parts = []
+    prefix = ""
+    blocks = list(request.get("system", []) or [])
+    for message in request.get("messages", []):
+        blocks.extend(message.get("content", []))
+    for block in blocks:
+        if "cachePoint" in block:
+            prefix = "\n".join(parts)
+        elif "text" in block:
+            parts.append(block["text"])
+    return prefix
+
+
+def _between(text, start_tag, end_tag):
+    start = text.find(start_tag)
+    end = text.find(end_tag, start + len(start_tag))
+    if start < 0 or end < 0:
+        return ""
+    return text[start + len(start_tag):end].strip()
+
+
+def default_responder(request, rng):
+    """
+    Produce a plausible response text for the prompts used by this repo.
+
+    Critique and critique-merge prompts get a <suggestion> block, rewrite prompts get the JSON
+    root_cause/improved_template answer, batched prompts (an <inquiries> block)
+    get a ```json array with one id/prediction/explanation object per inquiry,
+    leaving out about one inquiry in sixteen as a real model occasionally does,
+    and every other prompt is treated as a
+    classification and gets a ```json prediction/explanation answer. The
+    predicted label is a stable hash of the prompt over the labels listed in it.
+    """
+    text = _request_text(request)
+
+    if "<critique_feedbacks>" in text:
+        current_template = _between(text, "<current_template>", "</current_template>")
+        # Vary the rewrite with the sampling temperature so candidate templates differ
+        temperature = (request.get("inferenceConfig") or {}).get("temperature", 0)
+        hints = REWRITE_HINTS if temperature > 0.3 else REWRITE_HINTS[:1]
+        answer = {
+            "root_cause": "Categories with overlapping definitions are confused with each other.",
+            "improved_template": current_template + "\n" + rng.choice(hints),
+        }
+        return ("```json\n" + json.dumps(answer, indent=2) + "\n```\n\n"
+                "The improved template keeps the user_question placeholder and the original category list.")
+
+    if "<shard_suggestions>" in text:
+        return ("The shard suggestions agree on tightening category boundaries.\n"
+                "<suggestion>Define each category by what distinguishes it from its closest neighbour and "
+                "state which category wins when an inquiry mentions several issues.</suggestion>")
+
+    if "<evaluation_results>" in text:
+        return ("Error patterns were found between overlapping categories.\n"
+                "<suggestion>Clarify the boundaries between overlapping categories and add "
+                "priority rules for inquiries that mention several issues.</suggestion>\n"
+                "These changes target the most frequent confusions first.")
+
+    labels = LABEL_PATTERN.findall(text) or ["UNKNOWN"]
+    if "<inquiries>" in text:
+        answers = []
+        for item_id, question in INQUIRY_PATTERN.findall(_between(text, "<inquiries>", "</inquiries>")):
+            digest = int(hashlib.md5((" ".join(labels) + question).encode("utf-8")).hexdigest(), 16)
+            if digest % 16 == 0:
+                continue
+            prediction = labels[digest % len(labels)]
+            answers.append({
+                "id": int(item_id),
+                "prediction": prediction,
+                "explanation": f"The inquiry matches the {prediction} category.",
+            })
+        return "```json\n" + json.dumps(answers, indent=1) + "\n```"
+
+    digest = int(hashlib.md5(text.encode("utf-8")).hexdigest(), 16)
+    prediction = labels[digest % len(labels)]
+    answer = {
+        "prediction": prediction,
+        "explanation": f"The inquiry matches the {prediction} category.",
+    }
+    return "```json\n" + json.dumps(answer) + "\n```"
+
+
+class MockConverseBackend(ConverseBackend):
+    """
+    In-process fake of the Converse API for offline load tests and benchmarks.
+
+    Latency is drawn from a fixed, uniform or lognormal distribution around
+    latency_ms. A throttle_rate fraction of calls raise ThrottlingException and
+    an error_rate fraction raise ModelErrorException, both as botocore
+    ClientError so retry logic sees exactly what Bedrock would raise.
+    """
+
+    name = "mock"
+
+    def __init__(self, latency_ms=200.0, latency_distribution="lognormal", latency_sigma=0.5,
+                 throttle_rate=0.0, error_rate=0.0, reasoning=True, responder=None, seed=None,
+                 prompt_cache_ttl=300.0):
+        """
+        Args:
+            latency_ms (float): Median latency of a call in milliseconds
+            latency_distribution (str): "fixed", "uniform" (0 to 2x latency_ms) or "lognormal"
+            latency_sigma (float): Shape of the lognormal distribution
+            throttle_rate (float): Fraction of calls that are throttled
+            error_rate (float): Fraction of calls that fail with a model error
+            reasoning (bool): Add a reasoningContent block when thinking is requested
+            responder (callable, optional): responder(request, rng) -> response text
+            seed (int, optional): Seed for reproducible latency and fault injection
+            prompt_cache_ttl (float): Seconds a cached prompt prefix stays readable after its last use
+        """
+        self.latency_ms = latency_ms
+        self.latency_distribution = latency_distribution
+        self.latency_sigma = latency_sigma
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.reasoning = reasoning
+        self.responder = responder or default_responder
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.call_count = 0
+        self.prompt_cache_ttl = prompt_cache_ttl
+        # (model, prefix digest) -> expiry time of the simulated prompt cache
+        self._prompt_cache = {}
+
+    def sample_latency(self):
+        """Draw one call latency in seconds"""
+        with self._lock:
+            if self.latency_distribution == "fixed":
+                latency_ms = self.latency_ms
+            elif self.latency_distribution == "uniform":
+                latency_ms = self._rng.uniform(0, 2 * self.latency_ms)
+            else:
+                latency_ms = self.latency_ms * self._rng.lognormvariate(0, self.latency_sigma)
+        return latency_ms / 1000.0
+
+    def _draw_fault(self):
+        with self._lock:
+            self.call_count += 1
+            draw = self._rng.random()
+        if draw < self.throttle_rate:
+            return "ThrottlingException", "Too many requests, please wait before trying again."
+        if draw < self.throttle_rate + self.error_rate:
+            return "ModelErrorException", "The model returned an error."
+        return None
+
+    def build_response(self, request, latency_seconds):
+        """Build the Converse response for a request"""
+        with self._lock:
+            text = self.responder(request, self._rng)
+
+        content = []
+        thinking = (request.get("additionalModelRequestFields") or {}).get("thinking", {})
+        if self.reasoning and thinking.get("type") == "enabled":
+            content.append({"reasoningContent": {"reasoningText": {
+                "text": "Looking at the misclassified cases to find shared error patterns.",
+                "signature": "mock",
+            }}})
+        stop_reason = "end_turn"
+        tool_config = request.get("toolConfig")
+        if tool_config:
+            # Structured output: answer through the (first) declared tool
+            content.append({"toolUse": self._tool_use(tool_config, text)})
+            stop_reason = "tool_use"
+        else:
+            content.append({"text": text})
+
+        input_tokens = max(1, len(_request_text(request)) // 4)
+        output_tokens = max(1, len(text) // 4)
+        usage = {}
+        prefix = _cached_prefix(request)
+        if prefix:
+            # Like Bedrock, inputTokens only counts the tokens after the cache checkpoint
+            cached_tokens = len(prefix) // 4
+            input_tokens = max(1, input_tokens - cached_tokens)
+            if self._prompt_cache_hit(request.get("modelId"), prefix):
+                usage = {"cacheReadInputTokens": cached_tokens, "cacheWriteInputTokens": 0}
+            else:
+                usage = {"cacheReadInputTokens": 0, "cacheWriteInputTokens": cached_tokens}
+        usage.update({
+            "inputTokens": input_tokens,
+            "outputTokens": output_tokens,
+            "totalTokens": input_tokens + output_tokens + sum(usage.values()),
+        })
+        return {
+            "output": {"message": {"role": "assistant", "content": content}},
+            "stopReason": stop_reason,
+            "usage": usage,
+            "metrics": {"latencyMs": int(latency_seconds * 1000)},
+        }
+
+    def _prompt_cache_hit(self, model_id, prefix):
+        """Look a prefix up in the simulated prompt cache, writing it on a miss; each use refreshes the TTL"""
+        key = (model_id, hashlib.sha256(prefix.encode("utf-8")).hexdigest())
+        now = time.monotonic()
+        with self._lock:
+            hit = self._prompt_cache.get(key, 0) > now
+            self._prompt_cache[key] = now + self.prompt_cache_ttl
+        return hit
+
+    def _tool_use(self, tool_config, text):
+        """Turn the responder's JSON answer into a toolUse block of the declared tool"""
+        tool_spec = tool_config["tools"][0]["toolSpec"]
+        schema = tool_spec["inputSchema"]["json"]
+        tool_input = parse_llm_json(text).value
+        if isinstance(tool_input, list):
+            # A batched answer goes into the tool's array property
+            arrays = [key for key, spec in schema.get("properties", {}).items() if spec.get("type") == "array"]
+            tool_input = {arrays[0]: tool_input} if arrays else {}
+        if not isinstance(tool_input, dict):
+            tool_input = {}
+        tool_input = {key: tool_input.get(key, "") for key in schema.get("properties", {})}
+        # Respect enum restrictions, as constrained decoding would
+        for key, spec in schema.get("properties", {}).items():
+            if spec.get("enum") and tool_input[key] not in spec["enum"]:
+                digest = int(hashlib.md5(text.encode("utf-8")).hexdigest(), 16)
+                tool_input[key] = spec["enum"][digest % len(spec["enum"])]
+        with self._lock:
+            tool_use_id = f"tooluse_mock_{self.call_count}"
+        return {"toolUseId": tool_use_id, "name": tool_spec["name"], "input": tool_input}
+
+    def _fault_error(self, fault):
+        code, message = fault
+        return ClientError({"Error": {"Code": code, "Message": message},
+                            "ResponseMetadata": {"HTTPStatusCode": 429 if code == "ThrottlingException" else 424}},
+                           "Converse")
+
+    def converse(self, **request):
+        latency = self.sample_latency()
+        fault = self._draw_fault()
+        if fault:
+            time.sleep(latency / 10)
+            raise self._fault_error(fault)
+        time.sleep(latency)
+        return self.build_response(request, latency)
+
+    async def converse_async(self, **request):
+        latency = self.sample_latency()
+        fault = self._draw_fault()
+        if fault:
+            await asyncio.sleep(latency / 10)
+            raise self._fault_error(fault)
+        await asyncio.sleep(latency)
+        return self.build_response(request, latency)
+
+
+    def converse_stream(self, **request):
+        """
+        Stream the mock response in small chunks.
+
+        A fifth of the call latency passes before the first chunk and the rest
+        is spread over the chunks. Closing the generator early stops it, like
+        closing a Bedrock event stream.
+        """
+        latency = self.sample_latency()
+        fault = self._draw_fault()
+        if fault:
+            time.sleep(latency / 10)
+            raise self._fault_error(fault)
+        response = self.build_response(request, latency)
+        return self._stream_events(response, latency)
+
+    def _stream_events(self, response, latency, chunk_chars=16):
+        blocks = response["output"]["message"]["content"]
+        chunk_count = sum(max(1, -(-len(self._block_text(block)) // chunk_chars)) for block in blocks)
+        chunk_delay = latency * 0.8 / max(1, chunk_count)
+        time.sleep(latency * 0.2)
+        yield {"messageStart": {"role": "assistant"}}
+        for index, block in enumerate(blocks):
+            block_text = self._block_text(block)
+            if "toolUse" in block:
+                yield {"contentBlockStart": {"contentBlockIndex": index, "start": {"toolUse": {
+                    "toolUseId": block["toolUse"]["toolUseId"], "name": block["toolUse"]["name"]}}}}
+            for start in range(0, max(1, len(block_text)), chunk_chars):
+                time.sleep(chunk_delay)
+                chunk = block_text[start:start + chunk_chars]
+                if "reasoningContent" in block:
+                    delta = {"reasoningContent": {"text": chunk}}
+                elif "toolUse" in block:
+                    delta = {"toolUse": {"input": chunk}}
+                else:
+                    delta = {"text": chunk}
+                yield {"contentBlockDelta": {"contentBlockIndex": index, "delta": delta}}
+            yield {"contentBlockStop": {"contentBlockIndex": index}}
+        yield {"messageStop": {"stopReason": response["stopReason"]}}
+        yield {"metadata": {"usage": response["usage"], "metrics": response["metrics"]}}
+
+    @staticmethod
+    def _block_text(block):
+        if "reasoningContent" in block:
+            return block["reasoningContent"]["reasoningText"]["text"]
+        if "toolUse" in block:
+            return json.dumps(block["toolUse"]["input"])
+        return block.get("text", "")
+
+
+def make_handler(backend):
+    """Build an HTTP handler class serving backend over the Converse REST shape"""
+
+    class ConverseHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            match = re.match(r"^/model/(.+)/converse$", self.path)
+            if not match:
+                self._send(404, {"message": f"Unknown path {self.path}"}, "ResourceNotFoundException")
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            request["modelId"] = unquote(match.group(1))
+            try:
+                response = backend.converse(**request)
+            except ClientError as exc:
+                error = exc.response["Error"]
+                status = exc.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 500)
+                self._send(status, {"message": error["Message"]}, error["Code"])
+                return
+            self._send(200, response)
+
+        def _send(self, status, body, error_type=None):
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            if error_type:
+                self.send_header("x-amzn-ErrorType", error_type)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ConverseHandler
+
+
+def serve_mock_converse(backend=None, host="127.0.0.1", port=8088, block=True):
+    """
+    Serve a MockConverseBackend over HTTP.
+
+    Args:
+        backend (MockConverseBackend, optional): The fake to serve; a default one if None
+        host (str): Interface to bind
+        port (int): Port to bind (0 picks a free port)
+        block (bool): Serve forever in this thread; otherwise serve from a daemon thread
+
+    Returns:
+        ThreadingHTTPServer: The server (its server_address holds the bound port)
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(backend or MockConverseBackend()))
+    server.daemon_threads = True
+    if block:
+        server.serve_forever()
+    else:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local mock Converse server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8088)
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--latency-distribution", choices=["fixed", "uniform", "lognormal"], default="lognormal")
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    print(f"Mock Converse server listening on http://{args.host}:{args.port}")
+    serve_mock_converse(
+        MockConverseBackend(
+            latency_ms=args.latency_ms,
+            latency_distribution=args.latency_distribution,
+            throttle_rate=args.throttle_rate,
+            error_rate=args.error_rate,
+            seed=args.seed,
+        ),
+        host=args.host,
+        port=args.port,
+    )
@@ -0,0 +1,349 @@
+"""
+Routing of Converse calls across several endpoints.
+
+A RoutingConverseBackend sits under the executor in place of a single backend
+and spreads calls over a weighted list of endpoints, each a (region, model ID
+or inference profile) pair served by its own backend. Every endpoint keeps a
+live latency EWMA, throttle and error rate EWMAs and its in-flight count; a
+call goes to the endpoint with the lowest expected wait, i.e. latency times
+queue length, divided by weight and by the share of calls that succeed there.
+Endpoints without a measurement are probed first and a small share of calls
+goes to a random endpoint, so the readings of idle endpoints stay current.
+A throttled or failing call moves on to the next best endpoint, and an
+endpoint whose throttle or error rate crosses the degradation threshold is
+taken out of rotation for a cooldown. Responses carry the name of the endpoint
+that served them under "endpoint".
+
+Endpoints can be read from a JSON file (see load_endpoints):
+
+    [{"region": "us-east-1", "model_id": "us.anthropic.claude-3-5-haiku-20241022-v1:0", "weight": 2},
+     {"region": "us-west-2", "model_id": "anthropic.claude-3-5-haiku-20241022-v1:0"},
+     {"name": "local", "endpoint_url": "http://127.0.0.1:8088", "latency_ms": 800, "throttle_rate": 0.2}]
+"""
+import json
+import random
+import threading
+import time
+
+from botocore.exceptions import ConnectionError as BotoConnectionError, HTTPClientError
+
+from src.inference.backends import BedrockConverseBackend, ConverseBackend
+from src.inference.mock_server import MockConverseBackend
+from src.utils.rate_limit import is_throttling_error
+
+# Errors caused by the request itself fail the same way everywhere, so they are not retried elsewhere
+REQUEST_ERROR_CODES = {"ValidationException"}
+
+# Mock profile keys an endpoint entry may set (see MockConverseBackend)
+MOCK_PROFILE_KEYS = ("latency_ms", "latency_distribution", "latency_sigma", "throttle_rate", "error_rate", "seed")
+
+
+def _error_code(exc):
+    response = getattr(exc, "response", None)
+    if not isinstance(response, dict):
+        return None
+    return response.get("Error", {}).get("Code")
+
+
+def is_endpoint_failure(exc):
+    """Return True if exc is an endpoint-side failure worth retrying on another endpoint"""
+    if isinstance(exc, (BotoConnectionError, HTTPClientError)):
+        return True
+    code = _error_code(exc)
+    return code is not None and code not in REQUEST_ERROR_CODES
+
+
+class RoutedEndpoint:
+    """One endpoint of a router: a backend, the model ID to call on it and its live health"""
+
+    def __init__(self, backend, model_id=None, region=None, weight=1.0, name=None):
+        """
+        Args:
+            backend (ConverseBackend): Backend serving this endpoint
+            model_id (str, optional): Model ID or inference profile to call here; the
+                request's own modelId if None
+            region (str, optional): AWS region of the endpoint, for display
+            weight (float): Relative share of the traffic at equal latency
+            name (str, optional): Name recorded on the responses; region/model_id by default
+        """
+        if weight <= 0:
+            raise ValueError(f"Endpoint weight must be positive, got {weight}")
+        self.backend = backend
+        self.model_id = model_id
+        self.region = region
+        self.weight = float(weight)
+        self.name = name or "/".join(part for part in (region, model_id) if part) or backend.name
+        self.in_flight = 0
+        self.latency_ms = None
+        self.throttle_rate = 0.0
+        self.error_rate = 0.0
+        self.cooldown_until = 0.0
+        self.calls = 0
+        self.throttles = 0
+        self.errors = 0
+
+    def to_dict(self):
+        """Health and counters of the endpoint, JSON serializable"""
+        return {
+            "name": self.name,
+            "region": self.region,
+            "model_id": self.model_id,
+            "weight": self.weight,
+            "in_flight": self.in_flight,
+            "latency_ewma_ms": round(self.latency_ms, 1) if self.latency_ms is not None else None,
+            "throttle_rate": round(self.throttle_rate, 4),
+            "error_rate": round(self.error_rate, 4),
+            "calls": self.calls,
+            "throttles": self.throttles,
+            "errors": self.errors,
+            "cooling_down": self.cooldown_until > time.monotonic(),
+        }
+
+
+class RoutingConverseBackend(ConverseBackend):
+    """
+    Backend balancing Converse calls over weighted endpoints by live latency and throttle rate.
+
+    The rate limits and throttle retries of call_with_rate_limit stay keyed by
+    the logical model ID of the request; a call is only raised to them as
+    throttled when every endpoint throttled or failed it. Only the calls of
+    the routed model are balanced; calls for other models (e.g. the critique
+    and rewrite models) are passed to the fallback backend unchanged.
+    """
+
+    name = "routing"
+
+    def __init__(self, endpoints, model_id=None, fallback=None, smoothing=0.2, degrade_threshold=0.5,
+                 cooldown_seconds=30.0, explore_rate=0.05, seed=None):
+        """
+        Args:
+            endpoints (list): RoutedEndpoint instances
+            model_id (str, optional): Logical model ID whose calls are routed; every call is
+                routed if None
+            fallback (ConverseBackend, optional): Backend of the calls for other models;
+                a BedrockConverseBackend if None
+            smoothing (float): Weight of the newest observation in the EWMAs
+            degrade_threshold (float): Throttle or error rate at which an endpoint is taken
+                out of rotation
+            cooldown_seconds (float): How long a degraded endpoint stays out of rotation
+            explore_rate (float): Share of calls sent to a random endpoint in rotation
+            seed (int, optional): Seed of the exploration and of breaking ties between equally
+                good endpoints
+        """
+        if not endpoints:
+            raise ValueError("A routing backend needs at least one endpoint")
+        self.endpoints = list(endpoints)
+        self.model_id = model_id
+        self._fallback = fallback
+        self.smoothing = smoothing
+        self.degrade_threshold = degrade_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.explore_rate = explore_rate
+        self.failovers = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _expected_wait(self, endpoint, default_latency_ms):
+        latency_ms = endpoint.latency_ms if endpoint.latency_ms is not None else default_latency_ms
+        success_rate = max(0.05, 1.0 - endpoint.throttle_rate - endpoint.error_rate)
+        return latency_ms * (endpoint.in_flight + 1) / endpoint.weight / success_rate
+
+    def _acquire(self, exclude):
+        """Pick the endpoint with the lowest expected wait and count the call in flight on it"""
+        with self._lock:
+            now = time.monotonic()
+            candidates = [endpoint for endpoint in self.endpoints if endpoint not in exclude]
+            if not candidates:
+                return None
+            # Degraded endpoints only serve when nothing else is left
+            healthy = [endpoint for endpoint in candidates if endpoint.cooldown_until <= now]
+            candidates = healthy or sorted(candidates, key=lambda endpoint: endpoint.cooldown_until)[:1]
+            unprobed = [endpoint for endpoint in candidates if endpoint.latency_ms is None and not endpoint.in_flight]
+            if unprobed:
+                endpoint = unprobed[0]
+            elif self._rng.random() < self.explore_rate:
+                endpoint = self._rng.choice(candidates)
+            else:
+                # Endpoints still waiting for their first measurement count as fast as the fastest known one
+                known = [endpoint.latency_ms for endpoint in self.endpoints if endpoint.latency_ms is not None]
+                default_latency_ms = min(known) if known else 1.0
+                waits = [self._expected_wait(endpoint, default_latency_ms) for endpoint in candidates]
+                best = min(waits)
+                endpoint = self._rng.choice([endpoint for endpoint, wait in zip(candidates, waits) if wait == best])
+            endpoint.in_flight += 1
+            endpoint.calls += 1
+            return endpoint
+
+    def _release(self, endpoint, latency_ms=None, throttled=False, failed=False):
+        """Take a finished call off its endpoint and fold its outcome into the EWMAs"""
+        alpha = self.smoothing
+        with self._lock:
+            endpoint.in_flight -= 1
+            if latency_ms is not None:
+                endpoint.latency_ms = (latency_ms if endpoint.latency_ms is None
+                                       else (1 - alpha) * endpoint.latency_ms + alpha * latency_ms)
+            endpoint.throttle_rate = (1 - alpha) * endpoint.throttle_rate + alpha * throttled
+            endpoint.error_rate = (1 - alpha) * endpoint.error_rate + alpha * failed
+            endpoint.throttles += throttled
+            endpoint.errors += failed
+            if max(endpoint.throttle_rate, endpoint.error_rate) >= self.degrade_threshold:
+                endpoint.cooldown_until = time.monotonic() + self.cooldown_seconds
+                # Come back on probation, so a single failure after the cooldown does not trip it again
+                endpoint.throttle_rate = min(endpoint.throttle_rate, self.degrade_threshold / 2)
+                endpoint.error_rate = min(endpoint.error_rate, self.degrade_threshold / 2)
+                print(f"Endpoint {endpoint.name} degraded; out of rotation for {self.cooldown_seconds:g}s")
+
+    def _routes(self, request):
+        return self.model_id is None or request.get("modelId") == self.model_id
+
+    @property
+    def fallback(self):
+        """Backend of the calls that are not routed"""
+        if self._fallback is None:
+            self._fallback = BedrockConverseBackend()
+        return self._fallback
+
+    def _endpoint_request(self, endpoint, request):
+        if endpoint.model_id is None:
+            return request
+        return dict(request, modelId=endpoint.model_id)
+
+    def _failed(self, endpoint, exc, tried):
+        """Record a failed call; return whether to fail over instead of raising exc"""
+        throttled = is_throttling_error(exc)
+        failure = is_endpoint_failure(exc)
+        self._release(endpoint, throttled=throttled, failed=failure and not throttled)
+        tried.append(endpoint)
+        if failure:
+            with self._lock:
+                self.failovers += 1
+        return failure
+
+    def converse(self, **request):
+        """Run the call on the best endpoint, failing over to the others; the response names the endpoint"""
+        if not self._routes(request):
+            return self.fallback.converse(**request)
+        tried = []
+        while True:
+            endpoint = self._acquire(tried)
+            if endpoint is None:
+                raise last_error
+            start_time = time.perf_counter()
+            try:
+                response = endpoint.backend.converse(**self._endpoint_request(endpoint, request))
+            except Exception as exc:
+                if not self._failed(endpoint, exc, tried):
+                    raise
+                last_error = exc
+                continue
+            self._release(endpoint, latency_ms=(time.perf_counter() - start_time) * 1000)
+            return dict(response, endpoint=endpoint.name)
+
+    async def converse_async(self, **request):
+        if not self._routes(request):
+            return await self.fallback.converse_async(**request)
+        tried = []
+        while True:
+            endpoint = self._acquire(tried)
+            if endpoint is None:
+                raise last_error
+            start_time = time.perf_counter()
+            try:
+                response = await endpoint.backend.converse_async(**self._endpoint_request(endpoint, request))
+            except Exception as exc:
+                if not self._failed(endpoint, exc, tried):
+                    raise
+                last_error = exc
+                continue
+            self._release(endpoint, latency_ms=(time.perf_counter() - start_time) * 1000)
+            return dict(response, endpoint=endpoint.name)
+
+    def converse_stream(self, **request):
+        """Open the stream on the best endpoint, failing over while opening; the endpoint stays busy until it ends"""
+        if not self._routes(request):
+            return self.fallback.converse_stream(**request)
+        tried = []
+        while True:
+            endpoint = self._acquire(tried)
+            if endpoint is None:
+                raise last_error
+            start_time = time.perf_counter()
+            try:
+                events = endpoint.backend.converse_stream(**self._endpoint_request(endpoint, request))
+            except Exception as exc:
+                if not self._failed(endpoint, exc, tried):
+                    raise
+                last_error = exc
+                continue
+            return self._tracked_stream(endpoint, events, start_time)
+
+    def _tracked_stream(self, endpoint, events, start_time):
+        completed = False
+        try:
+            yield from events
+            completed = True
+        finally:
+            close = getattr(events, "close", None)
+            if close is not None:
+                close()
+            # Streams stopped early say nothing about the full latency
+            self._release(endpoint, latency_ms=(time.perf_counter() - start_time) * 1000 if completed else None)
+
+    def reserve_connections(self, count):
+        # Any endpoint may end up serving every call
+        for endpoint in self.endpoints:
+            endpoint.backend.reserve_connections(count)
+
+    def snapshot(self):
+        """
+        Health of the endpoints.
+
+        Returns:
+            dict: failovers and endpoints, a list of per-endpoint health and counters
+        """
+        with self._lock:
+            return {"failovers": self.failovers, "endpoints": [endpoint.to_dict() for endpoint in self.endpoints]}
+
+
+def load_endpoints(path, mock=False, **mock_defaults):
+    """
+    Build the endpoints listed in a JSON file.
+
+    Each entry may set name, region, model_id, weight and endpoint_url. With
+    mock=True every endpoint gets its own in-process MockConverseBackend whose
+    profile is mock_defaults overridden by the entry's latency_ms,
+    latency_distribution, latency_sigma, throttle_rate, error_rate and seed.
+    Otherwise each endpoint is a Bedrock client for its region (or endpoint_url,
+    e.g. a local mock server) that leaves retries to the router.
+
+    Args:
+        path (str): JSON file holding a list of endpoint entries, or {"endpoints": [...]}
+        mock (bool): Serve the endpoints with in-process mock backends
+        **mock_defaults: Default MockConverseBackend arguments of mock endpoints
+
+    Returns:
+        list: RoutedEndpoint instances
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+    if isinstance(entries, dict):
+        entries = entries.get("endpoints", [])
+
+    endpoints = []
+    for entry in entries:
+        if mock:
+            profile = dict(mock_defaults)
+            profile.update({key: entry[key] for key in MOCK_PROFILE_KEYS if key in entry})
+            backend = MockConverseBackend(**profile)
+        else:
+            # Throttles must reach the router to fail over, so botocore does not retry them itself
+            backend = BedrockConverseBackend(region_name=entry.get("region"), endpoint_url=entry.get("endpoint_url"),
+                                             max_attempts=1)
+        endpoints.append(RoutedEndpoint(
+            backend,
+            model_id=entry.get("model_id"),
+            region=entry.get("region"),
+            weight=entry.get("weight", 1.0),
+            name=entry.get("name"),
+        ))
+    return endpoints
\ No newline at end of file
@@ -0,0 +1,140 @@
+"""
+Incremental consumption of Converse streams with early cut-off.
+
+converse_via_stream runs a backend's converse_stream call, passes reasoning
+and text deltas to a callback as they arrive and closes the stream as soon as
+a stop condition on the text so far is met (e.g. the closing </suggestion>
+tag or the closing fence of a ```json block), so the model stops generating
+tokens nobody reads. The result is assembled into the same response shape as
+a blocking converse call.
+"""
+import json
+import sys
+
+
+class SuggestionComplete:
+    """Stop condition: the text contains a closing </suggestion> tag (returns the end of the tag)"""
+
+    marker = "</suggestion>"
+
+    def __init__(self):
+        self._scanned = 0
+
+    def __call__(self, text):
+        # Only rescan the tail that could hold a marker split across deltas
+        start = max(0, self._scanned - len(self.marker) + 1)
+        self._scanned = len(text)
+        position = text.find(self.marker, start)
+        return position + len(self.marker) if position >= 0 else 0
+
+
+class JsonFenceComplete:
+    """Stop condition: a ```json fenced block has been opened and closed (returns the end of the block)"""
+
+    opening = "```json"
+    # The closing fence starts a line; newlines inside JSON strings are escaped,
+    # so fences quoted inside the JSON values do not match
+    closing = "\n```"
+
+    def __init__(self):
+        self._scanned = 0
+        self._body_start = None
+
+    def __call__(self, text):
+        if self._body_start is None:
+            start = max(0, self._scanned - len(self.opening) + 1)
+            position = text.find(self.opening, start)
+            self._scanned = len(text)
+            if position < 0:
+                return 0
+            self._body_start = position + len(self.opening)
+            self._scanned = self._body_start
+        start = max(self._body_start, self._scanned - len(self.closing) + 1)
+        self._scanned = len(text)
+        position = text.find(self.closing, start)
+        return position + len(self.closing) if position >= 0 else 0
+
+
+def print_delta(kind, text):
+    """on_delta callback writing the generated text live to stderr"""
+    if kind == "text":
+        sys.stderr.write(text)
+        sys.stderr.flush()
+
+
+def converse_via_stream(backend, stop_when=None, on_delta=None, **request):
+    """
+    Run a Converse request as a stream and assemble the response.
+
+    Args:
+        backend (ConverseBackend): Backend providing converse_stream
+        stop_when (callable, optional): stop_when(text_so_far) -> True, or the end position
+            of the wanted text, to stop the stream (the text is cut at that position);
+            a fresh stop condition instance must be used per call
+        on_delta (callable, optional): on_delta(kind, text) with kind "reasoning" or "text"
+        **request: Keyword arguments of the Converse call
+
+    Returns:
+        dict: Converse-shaped response (output.message.content, usage, metrics, stopReason);
+            usage and metrics are missing if the stream was stopped before its metadata event
+    """
+    events = backend.converse_stream(**request)
+    reasoning_parts = []
+    signature = None
+    text = ""
+    tool_uses = {}
+    response = {}
+    try:
+        for event in events:
+            if "contentBlockStart" in event:
+                start = event["contentBlockStart"].get("start", {})
+                if "toolUse" in start:
+                    tool_uses[event["contentBlockStart"].get("contentBlockIndex", 0)] = dict(start["toolUse"], input="")
+            elif "contentBlockDelta" in event:
+                delta = event["contentBlockDelta"]["delta"]
+                if "toolUse" in delta:
+                    # Tool input arrives as JSON string fragments
+                    tool_uses[event["contentBlockDelta"].get("contentBlockIndex", 0)]["input"] += delta["toolUse"]["input"]
+                elif "reasoningContent" in delta:
+                    reasoning_delta = delta["reasoningContent"]
+                    if "text" in reasoning_delta:
+                        reasoning_parts.append(reasoning_delta["text"])
+                        if on_delta is not None:
+                            on_delta("reasoning", reasoning_delta["text"])
+                    signature = reasoning_delta.get("signature", signature)
+                elif "text" in delta:
+                    text += delta["text"]
+                    if on_delta is not None:
+                        on_delta("text", delta["text"])
+                    if stop_when is not None:
+                        end = stop_when(text)
+                        if end:
+                            if not isinstance(end, bool):
+                                text = text[:end]
+                            response["stopReason"] = "stop_sequence"
+                            response["stoppedEarly"] = True
+                            break
+            elif "messageStop" in event:
+                response["stopReason"] = event["messageStop"].get("stopReason")
+            elif "metadata" in event:
+                response.update({key: value for key, value in event["metadata"].items()
+                                 if key in ("usage", "metrics")})
+    finally:
+        # Closing the stream ends the generation on the server side
+        close = getattr(events, "close", None)
+        if close is not None:
+            close()
+
+    content = []
+    if reasoning_parts:
+        reasoning_text = {"text": "".join(reasoning_parts)}
+        if signature:
+            reasoning_text["signature"] = signature
+        content.append({"reasoningContent": {"reasoningText": reasoning_text}})
+    if text or not tool_uses:
+        content.append({"text": text})
+    for index in sorted(tool_uses):
+        tool_use = tool_uses[index]
+        content.append({"toolUse": dict(tool_use, input=json.loads(tool_use["input"] or "{}"))})
+    response["output"] = {"message": {"role": "assistant", "content": content}}
+    return response
\ No newline at end of file
@@ -0,0 +1,224 @@
+import json
+import random
+from collections import defaultdict, OrderedDict
+
+from src.utils.result_store import ResultRows, ResultStore
+
+# Case fields shown to the critique model
+CASE_FIELDS = ("case_idx", "user_question", "ground_truth", "prediction", "explanation")
+
+# (explanation, user_question) lengths tried, longest first, until the payload fits the budget;
+# an explanation limit of 0 drops the explanation and None keeps the question whole
+TRUNCATION_LIMITS = ((400, None), (200, 1000), (100, 400), (0, 200))
+
+
+def estimate_tokens(text):
+    """Rough token count of a text (4 characters per token)"""
+    return len(text) // 4 + 1
+
+
+def _label(value):
+    """Hashable label of a ground truth or prediction (predictions can be lists)"""
+    if isinstance(value, list):
+        return value[0] if len(value) == 1 else "|".join(str(item) for item in value)
+    return value
+
+
+def _outcomes(test_cases):
+    """
+    (handle, ground_truth, prediction, task_succeed) per case. Columnar results
+    give row numbers as handles, so only the cases that make it into the payload
+    are built as dicts; for a list the handle is the case dict itself.
+    """
+    if isinstance(test_cases, (ResultStore, ResultRows)):
+        return test_cases.outcomes()
+    return ((test_case, test_case.get("ground_truth", ""), test_case.get("prediction", ""),
+             test_case.get("task_succeed"))
+            for test_case in test_cases if test_case is not None)
+
+
+def _case(test_cases, handle):
+    """The case dict behind a handle from _outcomes"""
+    return test_cases.case(handle) if isinstance(test_cases, (ResultStore, ResultRows)) else handle
+
+
+def _compact_case(test_case, limits):
+    explanation_limit, question_limit = limits
+    case = {field: test_case.get(field) for field in CASE_FIELDS if field in test_case}
+    explanation = case.get("explanation") or ""
+    if explanation_limit == 0:
+        case.pop("explanation", None)
+    elif len(explanation) > explanation_limit:
+        case["explanation"] = explanation[:explanation_limit] + "..."
+    question = case.get("user_question")
+    if question_limit is not None and isinstance(question, str) and len(question) > question_limit:
+        case["user_question"] = question[:question_limit] + "..."
+    return case
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def per_class_accuracy(test_cases):
+    """
+    Accuracy per ground-truth class.
+
+    Returns:
+        OrderedDict: label -> {"total", "correct", "accuracy"}, sorted by label
+    """
+    totals = defaultdict(int)
+    correct = defaultdict(int)
+    for _, ground_truth, _, task_succeed in _outcomes(test_cases):
+        label = _label(ground_truth)
+        totals[label] += 1
+        if task_succeed:
+            correct[label] += 1
+    table = OrderedDict()
+    for label in sorted(totals, key=str):
+        table[label] = {
+            "total": totals[label],
+            "correct": correct[label],
+            "accuracy": round(correct[label] / totals[label], 3),
+        }
+    return table
+
+
+def build_critique_payload(test_cases, token_budget=8000, max_successes_per_class=2, seed=0):
+    """
+    Build a bounded evaluation summary for the critique prompt.
+
+    Failures are grouped by (ground_truth, prediction) confusion cell. Every cell
+    is represented by at least one example, then more failure examples are added
+    round-robin across cells and finally a stratified sample of successes, as
+    long as the payload stays within token_budget. Explanations and questions are
+    shortened (explanations dropped as a last resort) so that all failure patterns
+    fit; if they still do not, the cells with the fewest failures are left out and
+    counted in the summary. A compact per-class accuracy table is always included.
+
+    Args:
+        test_cases (list or ResultStore): Scored case results (with task_succeed)
+        token_budget (int): Approximate token budget of the payload
+        max_successes_per_class (int): Maximum successful examples per class
+        seed (int): Random seed for the success sample
+
+    Returns:
+        str: JSON payload for the ${evaluation_results} placeholder
+    """
+    rng = random.Random(seed)
+    failure_cells = defaultdict(list)
+    successes_by_class = defaultdict(list)
+    total = 0
+    for handle, ground_truth, prediction, task_succeed in _outcomes(test_cases):
+        total += 1
+        if task_succeed:
+            successes_by_class[_label(ground_truth)].append(handle)
+        else:
+            failure_cells[(_label(ground_truth), _label(prediction))].append(handle)
+
+    # Largest confusion cells first
+    ordered_cells = sorted(failure_cells.items(), key=lambda item: (-len(item[1]), str(item[0])))
+    total_succeeded = sum(len(cases) for cases in successes_by_class.values())
+
+    base = {
+        "summary": {
+            "total_cases": total,
+            "task_succeed": total_succeeded,
+            "failures": total - total_succeeded,
+            "distinct_failure_patterns": len(ordered_cells),
+            "omitted_failure_patterns": 0,
+            "omitted_failures": 0,
+        },
+        "per_class_accuracy": per_class_accuracy(test_cases),
+    }
+
+    payload = None
+    for limits in TRUNCATION_LIMITS:
+        patterns = [
+            {"ground_truth": cell[0], "prediction": cell[1], "count": len(cases),
+             "examples": [_compact_case(_case(test_cases, cases[0]), limits)]}
+            for cell, cases in ordered_cells
+        ]
+        payload = dict(base, failure_patterns=patterns, success_samples=[])
+        used_tokens = estimate_tokens(_dumps(payload))
+        if used_tokens <= token_budget:
+            break
+
+    # Still over budget: cut the cells with the fewest failures
+    if used_tokens > token_budget:
+        while patterns and used_tokens > token_budget:
+            pattern = patterns.pop()
+            ordered_cells.pop()
+            base["summary"]["omitted_failure_patterns"] += 1
+            base["summary"]["omitted_failures"] += pattern["count"]
+            used_tokens -= estimate_tokens(_dumps(pattern)) + 1
+        used_tokens = estimate_tokens(_dumps(payload))
+
+    # Add more failure examples round-robin across cells while the budget allows
+    next_example = [1] * len(ordered_cells)
+    added = True
+    while added:
+        added = False
+        for position, (cell, cases) in enumerate(ordered_cells):
+            if next_example[position] >= len(cases):
+                continue
+            example = _compact_case(_case(test_cases, cases[next_example[position]]), limits)
+            cost = estimate_tokens(_dumps(example)) + 1
+            if used_tokens + cost > token_budget:
+                continue
+            payload["failure_patterns"][position]["examples"].append(example)
+            next_example[position] += 1
+            used_tokens += cost
+            added = True
+
+    # Add a stratified sample of successes
+    for label in sorted(successes_by_class, key=str):
+        cases = successes_by_class[label]
+        for handle in rng.sample(cases, min(max_successes_per_class, len(cases))):
+            example = _compact_case(_case(test_cases, handle), limits)
+            cost = estimate_tokens(_dumps(example)) + 1
+            if used_tokens + cost > token_budget:
+                break
+            payload["success_samples"].append(example)
+            used_tokens += cost
+
+    # Serialized as measured, so the budget holds for the returned text
+    return _dumps(payload)
+
+
+def shard_test_cases(test_cases, max_shards=16):
+    """
+    Split test cases into critique shards by ground-truth class.
+
+    Every shard holds all cases (failures and successes) of its classes, so
+    each shard's critique sees what the prompt gets right as well as wrong.
+    Classes without failures are left out. When there are more failing classes
+    than max_shards, the classes with the fewest failures are merged into the
+    remaining shards, smallest shard first.
+
+    Returns:
+        list: [{"labels": [...], "failures": int, "test_cases": [...]}, ...], largest first;
+            the test_cases of a shard of a ResultStore are a lazy view of its rows
+    """
+    cases_by_class = defaultdict(list)
+    failures_by_class = defaultdict(int)
+    for handle, ground_truth, _, task_succeed in _outcomes(test_cases):
+        label = _label(ground_truth)
+        cases_by_class[label].append(handle)
+        if not task_succeed:
+            failures_by_class[label] += 1
+
+    failing = sorted(failures_by_class, key=lambda label: (-failures_by_class[label], str(label)))
+    shards = [{"labels": [label], "failures": failures_by_class[label], "test_cases": list(cases_by_class[label])}
+              for label in failing[:max(1, max_shards)]]
+    for label in failing[max(1, max_shards):]:
+        smallest = min(shards, key=lambda shard: shard["failures"])
+        smallest["labels"].append(label)
+        smallest["failures"] += failures_by_class[label]
+        smallest["test_cases"].extend(cases_by_class[label])
+    shards.sort(key=lambda shard: -shard["failures"])
+    if isinstance(test_cases, (ResultStore, ResultRows)):
+        store = test_cases.store if isinstance(test_cases, ResultRows) else test_cases
+        for shard in shards:
+            shard["test_cases"] = store.select(shard["test_cases"])
+    return shards
\ No newline at end of file
@@ -1,17 +1,41 @@
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 from string import Template
-import boto3
-from botocore.config import Config
+from src.inference.backends import get_backend
+from src.inference.streaming import SuggestionComplete, converse_via_stream
+from src.utils.rate_limit import call_with_rate_limit
+from src.utils.telemetry import response_metrics
+from src.prompt_optimization.critique_payload import build_critique_payload, shard_test_cases
+from src.prompt_optimization.suggestion_history import SuggestionHistory, extract_suggestion
 
 class PromptOptimizer:
     """Class for optimizing prompts based on error analysis"""
     
-    def __init__(self, model_id=""):
+    def __init__(self, model_id="", backend=None, critique_token_budget=8000,
+                 history_keep_recent=3, history_max_tokens=4000, history_summarizer=None,
+                 critique_mode="single", max_shards=16, max_shard_workers=8,
+                 shard_max_tokens=2048, shard_thinking_budget=1024, stream=False, on_delta=None):
         # "us.deepseek.r1-v1:0" deepseek reasoning 
         # us.anthropic.claude-3-7-sonnet-20250219-v1:0 sonnet 3.7 reasoning
         #self.model_id = "us.deepseek.r1-v1:0"
         self.model_id = "us.anthropic.claude-3-7-sonnet-20250219-v1:0"
-        self.suggestion_history = ""  # Initialize empty suggestion history
+        # Bounded suggestion history: recent critiques verbatim, older ones summarized
+        self.history = SuggestionHistory(
+            keep_recent=history_keep_recent,
+            max_tokens=history_max_tokens,
+            summarizer=history_summarizer
+        )
+        # Approximate token budget of the evaluation results in the critique prompt;
+        # None sends every test case verbatim
+        self.critique_token_budget = critique_token_budget
+        # "single" critiques all failures in one call; "sharded" runs a map-reduce
+        # critique with one parallel call per ground-truth class shard
+        self.critique_mode = critique_mode
+        self.max_shards = max_shards
+        self.max_shard_workers = max_shard_workers
+        self.shard_max_tokens = shard_max_tokens
+        self.shard_thinking_budget = shard_thinking_budget
         self.critique_prompt_template = """
         Analyze the classification performance and provide detailed reasoning for prompt improvements:
 
@@ -75,16 +99,61 @@ class PromptOptimizer:
 
         """
         
-        # Initialize Bedrock client
-        config = Config(
-            connect_timeout=300,
-            read_timeout=300
-        )
-        self.bedrock_runtime = boto3.client(service_name='bedrock-runtime', config=config)
+        self.reduce_prompt_template = """
+        You are merging prompt improvement suggestions. The failures of the current prompt template were split by ground-truth class and each shard was analyzed separately.
+
+        Current Template:
+        <current_template>
+        ${input_current_template}
+        </current_template>
+
+        Suggestions per shard (classes, number of failures, suggestion):
+        <shard_suggestions>
+        ${shard_suggestions}
+        </shard_suggestions>
+
+        Previous Iterative Suggestions:
+        <suggestion_history>
+        ${suggestion_history}
+        </suggestion_history>
+
+        Merge the shard suggestions into one consistent set of changes to the prompt instructions and structure:
+           - Resolve conflicts between shards, e.g. two classes claiming the same kind of inquiry
+           - Prioritize suggestions by the number of failures they address
+           - Drop duplicates and suggestions that previous iterations showed to be ineffective
+           - Only suggest changes to the prompt, never add the evaluation samples to it
+
+        Output your final improvement suggestions between <suggestion> </suggestion>
+        """
+        # Inference backend; None uses the process-wide backend (Bedrock by default)
+        self._backend = backend
+        
+        # Latency, token and retry metrics of the last critique call
+        self.last_call_metrics = {}
+        
+        # Stream critiques and stop once </suggestion> has arrived; on_delta(kind, text)
+        # receives reasoning and text deltas for live progress
+        self.stream = stream
+        self.on_delta = on_delta
+
+    @property
+    def backend(self):
+        """The inference backend used for Converse calls"""
+        return self._backend or get_backend()
+    
+    @property
+    def suggestion_history(self):
+        """The rendered suggestion history inserted into the critique prompt"""
+        return self.history.render()
+
+    @suggestion_history.setter
+    def suggestion_history(self, value):
+        # Accepts SuggestionHistory.to_dict() state or a plain history string
+        self.history.load(value)
     
     def reset_suggestion_history(self):
         """Reset the suggestion history to empty"""
-        self.suggestion_history = ""
+        self.history.clear()
         
     def error_analysis_with_reasoning(self, prompt, temperature=1, max_tokens=8192, 
                                      thinking_budget=4096, system_prompt=""):
@@ -101,6 +170,14 @@ class PromptOptimizer:
         Returns:
             dict: The model's response with thinking and other content
         """
+        result = self._reasoning_call(prompt, temperature, max_tokens, thinking_budget, system_prompt)
+        self.last_call_metrics = result['call_metrics']
+        return result
+
+    def _reasoning_call(self, prompt, temperature=1, max_tokens=8192, thinking_budget=4096, system_prompt=""):
+        """Reasoning call of error_analysis_with_reasoning; leaves last_call_metrics alone, so it is thread safe"""
+        start_time = time.perf_counter()
+        
         # Format system prompt as required by Converse API
         formatted_system_prompt = [{"text": system_prompt}] if system_prompt else []
         
@@ -118,6 +195,12 @@ class PromptOptimizer:
             "maxTokens": max_tokens
         }
         
+        converse = self.backend.converse
+        if self.stream:
+            def converse(**request):
+                return converse_via_stream(self.backend, stop_when=SuggestionComplete(),
+                                           on_delta=self.on_delta, **request)
+        
         if "sonnet" in self.model_id:
             # Configure reasoning parameters
             reasoning_config = {
@@ -127,25 +210,30 @@ class PromptOptimizer:
                 },
             }
 
-            # Make the API call
-            response = self.bedrock_runtime.converse(
+            # Make the API call within the model's rate limits
+            response, retries = call_with_rate_limit(converse, dict(
                 modelId=self.model_id,
                 messages=messages,
                 system=formatted_system_prompt,
                 inferenceConfig=inference_config,
                 additionalModelRequestFields=reasoning_config
-            )
+            ))
         elif "deepseek" in self.model_id: 
-            # Make the API call
-            response = self.bedrock_runtime.converse(
+            # Make the API call within the model's rate limits
+            response, retries = call_with_rate_limit(converse, dict(
                 modelId=self.model_id,
                 messages=messages,
                 inferenceConfig=inference_config,
                 system=formatted_system_prompt,
-            )
+            ))
         
         # Initialize result dictionary
         result = {}
+        result['call_metrics'] = dict(
+            response_metrics(response),
+            wall_time_ms=(time.perf_counter() - start_time) * 1000,
+            retries=retries,
+        )
         
         # Extract content blocks using the exact pattern provided
         content_blocks = response["output"]["message"]["content"]
@@ -181,14 +269,110 @@ class PromptOptimizer:
     
     def generate_critique_prompt(self, baseline_result):
         """Generate a critique prompt based on baseline results and the current suggestion history"""
+        if self.critique_token_budget:
+            # Confusion-cell summary that stays within the token budget whatever the suite size
+            evaluation_results = build_critique_payload(
+                baseline_result['test_cases'],
+                token_budget=self.critique_token_budget
+            )
+        else:
+            evaluation_results = json.dumps(list(baseline_result['test_cases']))
+        
         template = Template(self.critique_prompt_template)
         current_critique_prompt = template.safe_substitute(
             input_current_template=baseline_result['prompt_template'],
-            evaluation_results=json.dumps(baseline_result['test_cases']),
+            evaluation_results=evaluation_results,
             suggestion_history=self.suggestion_history
         )
         return current_critique_prompt
     
+    def critique_shard(self, shard, prompt_template):
+        """Run the critique prompt on one shard of test cases and return the result dict, with its call_metrics"""
+        template = Template(self.critique_prompt_template)
+        shard_prompt = template.safe_substitute(
+            input_current_template=prompt_template,
+            evaluation_results=build_critique_payload(
+                shard['test_cases'],
+                token_budget=self.critique_token_budget or 8000
+            ),
+            suggestion_history=""
+        )
+        return self._reasoning_call(
+            shard_prompt,
+            # maxTokens must exceed the thinking budget
+            max_tokens=max(self.shard_max_tokens, self.shard_thinking_budget + 1024),
+            thinking_budget=self.shard_thinking_budget
+        )
+
+    def sharded_error_analysis(self, baseline_result, max_tokens=4096, thinking_budget=2048):
+        """
+        Map-reduce critique of a large failure set.
+
+        Failures are sharded by ground-truth class, each shard is critiqued by
+        its own reasoning call (run in parallel with a bounded thinking budget)
+        and a final reduce call merges the per-shard <suggestion> outputs.
+
+        Returns:
+            dict: The reduce call's result, with call_metrics summed over all calls
+        """
+        start_time = time.perf_counter()
+        shards = shard_test_cases(baseline_result['test_cases'], max_shards=self.max_shards)
+        if not shards:
+            return self.error_analysis_with_reasoning(
+                self.generate_critique_prompt(baseline_result),
+                max_tokens=max_tokens,
+                thinking_budget=thinking_budget
+            )
+        print(f"Critiquing {sum(shard['failures'] for shard in shards)} failures in {len(shards)} shards")
+
+        def run_shard(shard):
+            try:
+                return self.critique_shard(shard, baseline_result['prompt_template'])
+            except Exception as e:
+                print(f"Error critiquing shard {shard['labels']}: {str(e)}")
+                return {}
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_shard_workers, len(shards)))) as executor:
+            shard_results = list(executor.map(run_shard, shards))
+
+        shard_suggestions = []
+        for shard, shard_result in zip(shards, shard_results):
+            if shard_result.get('text'):
+                shard_suggestions.append(
+                    f"[{', '.join(str(label) for label in shard['labels'])}] ({shard['failures']} failures)\n"
+                    f"{extract_suggestion(shard_result['text'])}"
+                )
+        if not shard_suggestions:
+            raise RuntimeError("All critique shards failed")
+
+        reduce_prompt = Template(self.reduce_prompt_template).safe_substitute(
+            input_current_template=baseline_result['prompt_template'],
+            shard_suggestions="\n\n".join(shard_suggestions),
+            suggestion_history=self.suggestion_history
+        )
+        result = self._reasoning_call(
+            reduce_prompt,
+            max_tokens=max_tokens,
+            thinking_budget=thinking_budget
+        )
+
+        # Sum the metrics each map call returned and the reduce call's
+        all_metrics = [shard_result['call_metrics'] for shard_result in shard_results if 'call_metrics' in shard_result]
+        all_metrics.append(result['call_metrics'])
+        self.last_call_metrics = {
+            "wall_time_ms": (time.perf_counter() - start_time) * 1000,
+            "server_latency_ms": sum(metrics.get('server_latency_ms') or 0 for metrics in all_metrics),
+            "input_tokens": sum(metrics.get('input_tokens') or 0 for metrics in all_metrics),
+            "output_tokens": sum(metrics.get('output_tokens') or 0 for metrics in all_metrics),
+            "cache_read_tokens": sum(metrics.get('cache_read_tokens') or 0 for metrics in all_metrics),
+            "cache_write_tokens": sum(metrics.get('cache_write_tokens') or 0 for metrics in all_metrics),
+            "retries": sum(metrics.get('retries') or 0 for metrics in all_metrics),
+            "calls": len(all_metrics),
+            "shards": len(shards),
+        }
+        result['call_metrics'] = self.last_call_metrics
+        return result
+
     def get_prompt_feedback(self, baseline_result, max_tokens=4096, thinking_budget=2048, iteration=1):
         """
         Get feedback on a prompt using error analysis
@@ -202,21 +386,30 @@ class PromptOptimizer:
         Returns:
             dict: Feedback with reasoning and suggestions
         """
-        critique_prompt = self.generate_critique_prompt(baseline_result)
-        
         print(f"Current suggestion history length: {len(self.suggestion_history)} characters")
         
-        feedbacks = self.error_analysis_with_reasoning(
-            critique_prompt, 
-            max_tokens=max_tokens,
-            thinking_budget=thinking_budget
-        )
+        if self.critique_mode == "sharded":
+            feedbacks = self.sharded_error_analysis(
+                baseline_result,
+                max_tokens=max_tokens,
+                thinking_budget=thinking_budget
+            )
+        else:
+            critique_prompt = self.generate_critique_prompt(baseline_result)
+            feedbacks = self.error_analysis_with_reasoning(
+                critique_prompt, 
+                max_tokens=max_tokens,
+                thinking_budget=thinking_budget
+            )
         
         # Update suggestion history with the new feedback
         if 'text' in feedbacks:
-            # Add a timestamp or iteration marker to the history
-            history_entry = f"\n--- Iteration {iteration} Feedback ---\n{feedbacks['text']}\n"
-            self.suggestion_history += history_entry
+            # Record the feedback with the success rate of the template it critiques
+            stats = baseline_result.get('stats', {})
+            success_rate = None
+            if stats.get('total') and 'task_succeed' in stats:
+                success_rate = stats['task_succeed'] / stats['total'] * 100
+            self.history.add(iteration, feedbacks['text'], success_rate=success_rate)
             print(f"Updated suggestion history (now {len(self.suggestion_history)} characters)")
         
         return feedbacks['text']
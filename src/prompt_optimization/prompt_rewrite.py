@@ -1,15 +1,30 @@
 # prompt_rewrite.py
 
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 from string import Template
-import boto3
-from botocore.config import Config
+from src.inference.backends import get_backend
+from src.inference.streaming import JsonFenceComplete, converse_via_stream
+from src.utils.response_cache import get_response_cache
+from src.utils.rate_limit import call_with_rate_limit
 from src.utils.parsers import load_json_from_llm_result
+from src.utils.prompt_layout import cache_friendly_template
+from src.utils.structured_output import REWRITE_TOOL_NAME, extract_tool_input, rewrite_tool_config
+from src.utils.telemetry import empty_call_metrics, response_metrics
+
+
+def is_rewrite_output(text):
+    """Whether a rewrite response parses into a JSON object with an improved_template"""
+    results_llm = load_json_from_llm_result(text)
+    return isinstance(results_llm, dict) and bool(results_llm.get("improved_template"))
+
 
 class PromptRewriter:
     """Class for rewriting prompts based on feedback analysis"""
     
-    def __init__(self, model_id="us.amazon.nova-pro-v1:0"):
+    def __init__(self, model_id="us.amazon.nova-pro-v1:0", backend=None, stream=False, on_delta=None,
+                 structured_output=False, cache_friendly=False):
         self.model_id = model_id
         self.guidance_prompt_improvement_template = """
         You need to improve the Current Template following the Critique Analysis.  
@@ -43,12 +58,32 @@ class PromptRewriter:
         IMPORTANT: The improved_template must be improved veresion o fCurrent Template by incorperating the recommended changes. PLEASE KEEP THE improved_template CONCISE AND EFFECTIVE.
         """
         
-        # Initialize Bedrock client
-        config = Config(
-            connect_timeout=300,
-            read_timeout=300
+        # Inference backend; None uses the process-wide backend (Bedrock by default)
+        self._backend = backend
+        
+        # Latency, token and retry metrics of the last rewrite call
+        self.last_call_metrics = {}
+        
+        # Stream rewrites and stop once the ```json block is closed; on_delta(kind, text)
+        # receives the text deltas for live progress
+        self.stream = stream
+        self.on_delta = on_delta
+        
+        # Force a root_cause / improved_template toolUse answer instead of parsing ```json text
+        self.structured_output = structured_output
+        
+        # Keep improved templates in the prompt-caching layout: every instruction before
+        # the question placeholder, so the static prefix is shared by all test cases
+        self.cache_friendly = cache_friendly
+        self.layout_instruction = (
+            "5. Put all instructions, including the output format, BEFORE the user_question placeholder "
+            "and end the template with the question, so the instructions are identical for every question"
         )
-        self.bedrock_runtime = boto3.client(service_name='bedrock-runtime', config=config)
+
+    @property
+    def backend(self):
+        """The inference backend used for Converse calls"""
+        return self._backend or get_backend()
         
     def call_bedrock_converse(self, prompt, temperature=0.1, top_p=0.9, max_tokens=2048):
         """
@@ -63,6 +98,22 @@ class PromptRewriter:
         Returns:
             str: The model's response text
         """
+        text, self.last_call_metrics = self.invoke_converse(prompt, temperature, top_p, max_tokens)
+        return text
+    
+    def invoke_converse(self, prompt, temperature=0.1, top_p=0.9, max_tokens=2048):
+        """
+        Call the Converse API and return the response text with its call metrics
+        
+        Unlike call_bedrock_converse this does not touch last_call_metrics, so it
+        can run concurrently for several candidates.
+        
+        Returns:
+            tuple: (response text, call metrics dict); in structured-output mode the
+                text is the toolUse input as JSON
+        """
+        start_time = time.perf_counter()
+        
         # Format the message for Converse API
         messages = [
             {
@@ -78,20 +129,55 @@ class PromptRewriter:
             "maxTokens": max_tokens
         }
         
-        # Make the API call
-        response = self.bedrock_runtime.converse(
-            modelId=self.model_id,
-            messages=messages,
-            inferenceConfig=inference_config
-        )
+        request = dict(modelId=self.model_id, messages=messages, inferenceConfig=inference_config)
+        if self.structured_output:
+            request["toolConfig"] = rewrite_tool_config()
+        
+        # Serve repeated rewrite requests from the response cache
+        cache = get_response_cache()
+        cache_key = None
+        if cache is not None:
+            if self.structured_output:
+                cache_key = cache.make_key(self.model_id, prompt, inference_config,
+                                           tool_config=request["toolConfig"])
+            else:
+                cache_key = cache.make_key(self.model_id, prompt, inference_config)
+            cached = cache.get(cache_key)
+            if cached is not None:
+                return cached["text"], dict(empty_call_metrics(), cache_hit=True)
+        
+        # Make the API call within the model's rate limits
+        converse = self.backend.converse
+        if self.stream:
+            def converse(**request):
+                return converse_via_stream(self.backend, stop_when=JsonFenceComplete(),
+                                           on_delta=self.on_delta, **request)
+        
+        response, retries = call_with_rate_limit(converse, request)
         
         # Extract the generated text from the response
+        text = ""
         content_blocks = response["output"]["message"]["content"]
         for block in content_blocks:
             if "text" in block:
-                return block["text"]
+                text = block["text"]
+                break
+        
+        if self.structured_output:
+            tool_input = extract_tool_input(response, REWRITE_TOOL_NAME)
+            text = json.dumps(tool_input) if tool_input is not None else text
         
-        return ""
+        # Unparseable rewrites are not cached, so they are requested again next time
+        if cache is not None and is_rewrite_output(text):
+            cache.put(cache_key, {"text": text})
+        
+        call_metrics = dict(
+            response_metrics(response),
+            wall_time_ms=(time.perf_counter() - start_time) * 1000,
+            retries=retries,
+            cache_hit=False,
+        )
+        return text, call_metrics
     
     def generate_improvement_prompt(self, current_template, critique_feedbacks):
         """
@@ -109,6 +195,11 @@ class PromptRewriter:
             input_current_template=current_template,
             critique_feedbacks=critique_feedbacks
         )
+        if self.cache_friendly:
+            anchor = "4. The improved template should be a complete, ready-to-use prompt"
+            improvement_prompt = improvement_prompt.replace(
+                anchor, anchor + "\n        " + self.layout_instruction, 1
+            )
         return improvement_prompt
     
     def improving_prompt_with_feedback(self, current_template, critique_feedbacks, 
@@ -127,20 +218,29 @@ class PromptRewriter:
             dict: The improvement results with analysis, recommendations, and improved template
         """
         
+        improvement_results, self.last_call_metrics = self._improve(
+            current_template, critique_feedbacks, temperature, top_p, max_tokens
+        )
+        return improvement_results
+    
+    def _improve(self, current_template, critique_feedbacks, temperature, top_p, max_tokens):
+        """Run one rewrite call; returns (improvement results, call metrics)"""
         improvement_prompt = self.generate_improvement_prompt(current_template, critique_feedbacks)
         
         improvement_results = {}
+        call_metrics = {}
         
         try:
             # Call the Bedrock Converse API
-            generated_text = self.call_bedrock_converse(
+            generated_text, call_metrics = self.invoke_converse(
                 prompt=improvement_prompt,
                 temperature=temperature,
                 top_p=top_p,
                 max_tokens=max_tokens
             )
                         
-            # Use the imported function to parse the JSON result
+            # Use the imported function to parse the JSON result (in structured-output
+            # mode the text is plain JSON and takes the strict fast path)
             results_llm = load_json_from_llm_result(generated_text)
             
             # Create result entry
@@ -149,10 +249,54 @@ class PromptRewriter:
                     "root_cause": results_llm.get("root_cause", ""),
                     "improved_template": results_llm.get("improved_template", "")
                 }
+                if self.cache_friendly and improvement_results["improved_template"]:
+                    # Move instructions the model still placed after the question, if that is safe
+                    improvement_results["improved_template"] = cache_friendly_template(
+                        improvement_results["improved_template"]
+                    )
             else:
                 print("Failed to parse improvement results from model response")
                 
         except Exception as e:
             print(f"Error in improving prompt: {e}")
         
-        return improvement_results
+        return improvement_results, call_metrics
+    
+    def generate_candidates(self, current_template, critique_feedbacks, num_candidates=4,
+                            temperatures=None, top_p=0.9, max_tokens=2048):
+        """
+        Generate several candidate templates from the same critique in parallel
+        
+        Candidates differ by sampling temperature, spread evenly over 0.1-1.0
+        unless temperatures are given.
+        
+        Args:
+            current_template (str): The current prompt template
+            critique_feedbacks (str): Feedback from the critique
+            num_candidates (int): Number of candidates to generate
+            temperatures (list, optional): Temperature of each candidate
+            top_p (float): Limits token selection to top P options
+            max_tokens (int): Maximum tokens to generate
+            
+        Returns:
+            list: Improvement results per candidate that parsed, each with its temperature and call_metrics
+        """
+        if temperatures is None:
+            if num_candidates == 1:
+                temperatures = [0.1]
+            else:
+                temperatures = [round(0.1 + 0.9 * position / (num_candidates - 1), 2)
+                                for position in range(num_candidates)]
+        
+        def improve(temperature):
+            improvement_results, call_metrics = self._improve(
+                current_template, critique_feedbacks, temperature, top_p, max_tokens
+            )
+            if improvement_results:
+                improvement_results.update(temperature=temperature, call_metrics=call_metrics)
+            return improvement_results
+        
+        with ThreadPoolExecutor(max_workers=max(1, len(temperatures))) as executor:
+            candidates = list(executor.map(improve, temperatures))
+        
+        return [candidate for candidate in candidates if candidate.get("improved_template")]
@@ -0,0 +1,196 @@
+import re
+
+from src.prompt_optimization.critique_payload import estimate_tokens
+
+SUGGESTION_PATTERN = re.compile(r"<suggestion>(.*?)</suggestion>", re.DOTALL)
+
+
+def extract_suggestion(feedback_text):
+    """Return the <suggestion> part of a critique (the whole text if there is none)"""
+    match = SUGGESTION_PATTERN.search(feedback_text or "")
+    return (match.group(1) if match else feedback_text or "").strip()
+
+
+def local_summary(entry, max_chars=400):
+    """Compress a history entry without a model call: its suggestion, whitespace-collapsed and truncated"""
+    suggestion = " ".join(extract_suggestion(entry["text"]).split())
+    if len(suggestion) > max_chars:
+        suggestion = suggestion[:max_chars].rsplit(" ", 1)[0] + " ..."
+    return suggestion
+
+
+def _iteration_order(item):
+    # Entries restored from a plain-string history have no iteration and sort first
+    return -1 if item["iteration"] is None else item["iteration"]
+
+
+def _format_rate(rate):
+    return "n/a" if rate is None else f"{rate:.1f}%"
+
+
+class SuggestionHistory:
+    """
+    Bounded history of critique feedback for the critique prompt.
+
+    The last keep_recent entries are kept verbatim. Older entries are folded
+    into a summary of one line each, produced by summarizer(entry) (e.g. a
+    cheap model call) or locally from the entry's <suggestion> block. Each
+    entry records the success rate of the template it critiqued and, once the
+    next evaluation has run, the success rate of the template it produced, so
+    the summary can be pruned by relevance: when the rendered history exceeds
+    max_tokens, the folded entries whose suggestion moved the success rate the
+    least are dropped first.
+    """
+
+    def __init__(self, keep_recent=3, max_tokens=4000, summarizer=None):
+        """
+        Args:
+            keep_recent (int): Number of most recent entries kept verbatim
+            max_tokens (int): Hard ceiling on the approximate tokens of the rendered history
+            summarizer (callable, optional): summarizer(entry) -> one-line summary of a folded entry
+        """
+        self.keep_recent = max(1, keep_recent)
+        self.max_tokens = max_tokens
+        self.summarizer = summarizer
+        self.entries = []
+        self.folded = []
+
+    def clear(self):
+        self.entries = []
+        self.folded = []
+
+    def add(self, iteration, feedback_text, success_rate=None):
+        """
+        Record the critique of one iteration.
+
+        Args:
+            iteration (int): Iteration number
+            feedback_text (str): Full critique text
+            success_rate (float, optional): Success rate (%) of the critiqued template
+        """
+        self.entries.append({
+            "iteration": iteration,
+            "text": feedback_text,
+            "success_rate": success_rate,
+            "outcome_success_rate": None,
+        })
+        self._compact()
+
+    def record_outcome(self, iteration, success_rate):
+        """Record the success rate (%) of the template produced from the critiques of iteration"""
+        recorded = False
+        for entry in self.entries + self.folded:
+            if entry["iteration"] == iteration:
+                entry["outcome_success_rate"] = success_rate
+                recorded = True
+        return recorded
+
+    @staticmethod
+    def relevance(entry):
+        """How much the entry's suggestion moved the success rate, either way (0 if unknown)"""
+        if entry.get("success_rate") is None or entry.get("outcome_success_rate") is None:
+            return 0.0
+        return abs(entry["outcome_success_rate"] - entry["success_rate"])
+
+    def _fold(self, entry):
+        summary = self.summarizer(entry) if self.summarizer else local_summary(entry)
+        self.folded.append({
+            "iteration": entry["iteration"],
+            "summary": " ".join((summary or "").split()),
+            "success_rate": entry["success_rate"],
+            "outcome_success_rate": entry["outcome_success_rate"],
+        })
+
+    def _compact(self):
+        while len(self.entries) > self.keep_recent:
+            self._fold(self.entries.pop(0))
+
+        # Enforce the token ceiling: drop the least relevant folded entries,
+        # then fold verbatim entries, then truncate the last one
+        while self.max_tokens and estimate_tokens(self.render()) > self.max_tokens:
+            if self.folded:
+                least_relevant = min(self.folded, key=lambda item: (self.relevance(item), _iteration_order(item)))
+                self.folded.remove(least_relevant)
+            elif len(self.entries) > 1:
+                self._fold(self.entries.pop(0))
+            elif self.entries[0]["text"] != extract_suggestion(self.entries[0]["text"]):
+                # Keep only the suggestion of the remaining entry, dropping its analysis
+                self.entries[0]["text"] = extract_suggestion(self.entries[0]["text"])
+            else:
+                entry = self.entries[0]
+                overflow_chars = (estimate_tokens(self.render()) - self.max_tokens) * 4 + 16
+                entry["text"] = entry["text"][:max(0, len(entry["text"]) - overflow_chars)] + " ..."
+                if len(entry["text"]) <= 4:
+                    break
+
+    def render(self):
+        """The history text for the ${suggestion_history} placeholder"""
+        parts = []
+        if self.folded:
+            parts.append("--- Summary of earlier iterations (success rate before -> after the suggestion) ---")
+            for item in sorted(self.folded, key=_iteration_order):
+                label = "Earlier" if item["iteration"] is None else f"Iteration {item['iteration']}"
+                parts.append(f"{label} ({_format_rate(item['success_rate'])} -> "
+                             f"{_format_rate(item['outcome_success_rate'])}): {item['summary']}")
+        for entry in self.entries:
+            header = ("--- Earlier Feedback" if entry["iteration"] is None
+                      else f"--- Iteration {entry['iteration']} Feedback")
+            if entry["success_rate"] is not None:
+                header += (f" (success rate {_format_rate(entry['success_rate'])} -> "
+                           f"{_format_rate(entry['outcome_success_rate'])})")
+            parts.append(f"{header} ---\n{entry['text']}")
+        return "\n".join(parts)
+
+    def __len__(self):
+        return len(self.render())
+
+    def __str__(self):
+        return self.render()
+
+    def to_dict(self):
+        return {"entries": self.entries, "folded": self.folded}
+
+    def load(self, state):
+        """
+        Restore entries saved with to_dict.
+
+        A plain string (the history format of older checkpoints) is kept as a
+        single verbatim entry.
+        """
+        self.clear()
+        if isinstance(state, str):
+            if state.strip():
+                self.entries.append({"iteration": None, "text": state.strip(),
+                                     "success_rate": None, "outcome_success_rate": None})
+        elif state:
+            self.entries = [dict(entry) for entry in state.get("entries", [])]
+            self.folded = [dict(item) for item in state.get("folded", [])]
+        self._compact()
+        return self
+
+
+def make_model_summarizer(model_id, backend=None, max_tokens=200):
+    """
+    Build a summarizer that compresses history entries with a (cheap) model call.
+
+    Falls back to the local summary when the call fails.
+    """
+    from src.inference.backends import get_backend
+    from src.utils.rate_limit import call_with_rate_limit
+
+    def summarize(entry):
+        prompt = ("Summarize the following prompt improvement suggestion in one or two sentences, "
+                  "keeping the concrete instruction changes it proposes:\n\n" + extract_suggestion(entry["text"]))
+        try:
+            response, _ = call_with_rate_limit((backend or get_backend()).converse, dict(
+                modelId=model_id,
+                messages=[{"role": "user", "content": [{"text": prompt}]}],
+                inferenceConfig={"temperature": 0, "maxTokens": max_tokens},
+            ))
+            blocks = response["output"]["message"]["content"]
+            return "".join(block.get("text", "") for block in blocks).strip() or local_summary(entry)
+        except Exception as e:
+            print(f"History summarizer failed, using local summary: {str(e)}")
+            return local_summary(entry)
+
+    return summarize
\ No newline at end of file
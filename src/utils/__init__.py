@@ -2,11 +2,13 @@
 Utility functions for parsing and evaluating LLM outputs.
 """
 # Import commonly used functions to make them available directly
-from src.utils.parsers import load_json_from_llm_result
+from src.utils.parsers import load_json_from_llm_result, parse_llm_json, ParseResult
 from src.utils.evaluation import evaluate_test_results
 
 # Define what gets imported with "from utils import *"
 __all__ = [
     'load_json_from_llm_result', 
+    'parse_llm_json',
+    'ParseResult',
     'evaluate_test_results'
 ]
\ No newline at end of file
@@ -0,0 +1,87 @@
+import threading
+import boto3
+from botocore.config import Config
+
+# Default HTTP connection pool size, matching the default executor worker count
+DEFAULT_MAX_POOL_CONNECTIONS = 8
+
+_client_lock = threading.RLock()
+_session = None
+_clients = {}
+
+
+def get_boto3_session():
+    """
+    Return the process-wide boto3 session, creating it on first use.
+
+    Credential resolution happens once per session, so sharing it avoids
+    re-resolving credentials for every call.
+    """
+    global _session
+    if _session is None:
+        with _client_lock:
+            if _session is None:
+                _session = boto3.session.Session()
+    return _session
+
+
+def get_bedrock_runtime_client(max_pool_connections=None,
+                               connect_timeout=300, read_timeout=300, region_name=None,
+                               endpoint_url=None, max_attempts=None):
+    """
+    Return a shared, thread-safe Bedrock runtime client.
+
+    One client is created per process for each distinct configuration and then
+    reused by every caller, so endpoint setup and TLS handshakes are paid once
+    and the HTTP connections are kept alive in the client's pool. A request for
+    a larger pool than an existing client has replaces that client.
+
+    Args:
+        max_pool_connections (int, optional): Minimum HTTP connection pool size, usually the
+            worker count. If None, any existing client is reused.
+        connect_timeout (int): Connection timeout in seconds
+        read_timeout (int): Read timeout in seconds
+        region_name (str, optional): AWS region, defaults to the session region
+        endpoint_url (str, optional): Override the service endpoint (e.g. a local mock server)
+        max_attempts (int, optional): Total attempts botocore makes per call, including its own
+            retries; the botocore default if None
+
+    Returns:
+        botocore.client.BedrockRuntime: The shared client
+    """
+    if max_pool_connections is None:
+        max_pool_connections = 0
+    key = (region_name, connect_timeout, read_timeout, endpoint_url, max_attempts)
+    client_entry = _clients.get(key)
+    if client_entry is not None and client_entry[0] >= max_pool_connections:
+        return client_entry[1]
+
+    with _client_lock:
+        client_entry = _clients.get(key)
+        if client_entry is not None and client_entry[0] >= max_pool_connections:
+            return client_entry[1]
+
+        pool_size = max(max_pool_connections or DEFAULT_MAX_POOL_CONNECTIONS,
+                        client_entry[0] if client_entry else 0)
+        config = Config(
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            max_pool_connections=pool_size,
+            retries={"mode": "standard", "total_max_attempts": max_attempts} if max_attempts else None,
+        )
+        client = get_boto3_session().client(
+            service_name="bedrock-runtime",
+            region_name=region_name,
+            endpoint_url=endpoint_url,
+            config=config,
+        )
+        _clients[key] = (pool_size, client)
+        return client
+
+
+def reset_bedrock_clients():
+    """Drop all cached clients and the shared session (e.g. after a fork or credential change)"""
+    global _session
+    with _client_lock:
+        _clients.clear()
+        _session = None
@@ -0,0 +1,94 @@
+import json
+import os
+from datetime import datetime
+
+# Stages of one optimization iteration, in order
+STAGES = ("evaluation", "feedback", "rewrite")
+
+STATE_FILE = "state.json"
+
+
+def atomic_write_json(path, data):
+    """Write JSON to path so that readers only ever see the old or the new content"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class RunCheckpoint:
+    """
+    Write-ahead checkpoint of an optimization run.
+
+    The run state (current template, suggestion history, finished iterations and
+    the next stage to run) lives in <run_dir>/state.json and is rewritten
+    atomically after every stage, so an interrupted run can continue from the
+    exact stage where it stopped.
+    """
+
+    def __init__(self, run_dir):
+        self.run_dir = run_dir
+        self.path = os.path.join(run_dir, STATE_FILE)
+        self.state = {}
+
+    @classmethod
+    def create(cls, results_dir, initial_state):
+        """
+        Start a new run directory under results_dir.
+
+        Args:
+            results_dir (str): Parent directory for run directories
+            initial_state (dict): State of the run before its first stage
+
+        Returns:
+            RunCheckpoint: The checkpoint of the new run
+        """
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        run_dir = os.path.join(results_dir, f"run_{timestamp}")
+        os.makedirs(run_dir, exist_ok=True)
+        checkpoint = cls(run_dir)
+        checkpoint.state = {
+            "iteration": 0,
+            "stage": STAGES[0],
+            "pending": {},
+            "iterations_data": [],
+        }
+        checkpoint.state.update(initial_state)
+        checkpoint.save()
+        return checkpoint
+
+    @classmethod
+    def load(cls, run_dir):
+        """Load the checkpoint of an existing run directory"""
+        checkpoint = cls(run_dir)
+        if not os.path.exists(checkpoint.path):
+            raise FileNotFoundError(f"No checkpoint found in '{run_dir}'")
+        with open(checkpoint.path, "r", encoding="utf-8") as f:
+            checkpoint.state = json.load(f)
+        return checkpoint
+
+    def save(self, **updates):
+        """Apply updates to the state and persist it atomically"""
+        self.state.update(updates)
+        self.state["updated_at"] = datetime.now().isoformat()
+        atomic_write_json(self.path, self.state)
+
+    def advance(self, stage, **updates):
+        """Record that the next stage to run is stage, together with its inputs"""
+        self.save(stage=stage, **updates)
+
+    def complete_iteration(self, iteration_data, **updates):
+        """Append a finished iteration and move to the evaluation stage of the next one"""
+        self.state["iterations_data"].append(iteration_data)
+        self.save(
+            iteration=self.state["iteration"] + 1,
+            stage=STAGES[0],
+            pending={},
+            **updates
+        )
+
+    def path_for(self, name):
+        """Path of a file inside the run directory"""
+        return os.path.join(self.run_dir, name)
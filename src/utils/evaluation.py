@@ -1,23 +1,26 @@
+from src.utils.result_store import ResultStore
+from src.utils.scoring import ScoringEngine
+
+
 def evaluate_test_results(result_data):
     """
     Evaluate test results by comparing predictions with ground truth.
     
+    Predictions are compared after label normalization (list predictions use
+    their first element). Besides the task_succeed count, stats["scores"]
+    holds the confusion matrix, per-class precision/recall/F1 and macro/micro
+    averages. A ResultStore of test cases is scored from its label codes.
+    
     Args:
         result_data (dict): Dictionary containing test cases and their results
         
     Returns:
         dict: Updated result_data with evaluation metrics
     """
-    task_success = 0
-    for index, test_case in enumerate(result_data['test_cases']):
-        expected_output = test_case.get("ground_truth", "")
-        llm_output = test_case.get("prediction", "")
-        
-        if expected_output == llm_output:
-            task_success += 1
-            result_data['test_cases'][index]['task_succeed'] = True
-        else:
-            result_data['test_cases'][index]['task_succeed'] = False
-            
-    result_data['stats']['task_succeed'] = task_success
+    engine = ScoringEngine()
+    if isinstance(result_data['test_cases'], ResultStore):
+        result_data['stats']['task_succeed'] = result_data['test_cases'].score(engine)
+    else:
+        result_data['stats']['task_succeed'] = engine.add_cases(result_data['test_cases'])
+    result_data['stats']['scores'] = engine.to_dict()
     return result_data
\ No newline at end of file
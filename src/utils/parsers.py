@@ -1,26 +1,110 @@
 import json
 import re
+from typing import Any, NamedTuple, Optional
+
 from json_repair import repair_json
 
+FENCE = "```"
+JSON_START_PATTERN = re.compile(r"[\[{]")
 
-def load_json_from_llm_result(text):
+# Maximum number of "{" / "[" positions tried when looking for bare JSON
+MAX_BARE_CANDIDATES = 8
+
+_decoder = json.JSONDecoder()
+
+
+class ParseResult(NamedTuple):
+    """Outcome of parsing JSON out of a model response"""
+
+    value: Any
+    # "fenced", "bare", "repaired" or "failed"
+    method: str
+    error: Optional[str] = None
+
+    @property
+    def ok(self):
+        return self.method != "failed"
+
+
+def _skip_whitespace(text, position):
+    while position < len(text) and text[position] in " \t\r\n":
+        position += 1
+    return position
+
+
+def _fenced_start(text):
+    """Position right after the first opening fence (and its json tag), or -1"""
+    fence = text.find(FENCE)
+    if fence < 0:
+        return -1
+    position = fence + len(FENCE)
+    if text.startswith("json", position):
+        position += len("json")
+    return position
+
+
+def parse_llm_json(text):
     """
-    Extract and clean JSON from markdown code blocks.
-    Returns the first valid JSON found or None if no valid JSON is found.
+    Extract JSON from a model response, cheapest strategy first.
+
+    1. fenced: strict decode of the value starting right after the first
+       ```json fence. The decoder stops at the end of the value, so trailing
+       text, closing fences and fences quoted inside JSON strings are ignored.
+    2. bare: strict decode of an object or array starting at one of the first
+       "{" / "[" positions of the text, for responses without a fence.
+    3. repaired: json_repair on the fenced block (up to the last fence) or the
+       whole text, for malformed JSON.
+
+    Args:
+        text (str): Raw model response
+
+    Returns:
+        ParseResult: The parsed value and the strategy that produced it
     """
-    # First, try to find JSON blocks
-    pattern = r"```(?:json)?\s*([\s\S]*)```"
-    matches = re.findall(pattern, text, re.DOTALL)
-    if not matches:
-        return None
-    # Process each potential JSON block
-    for json_text in matches:
-    
-        good_json_string = repair_json(json_text)
-        # Try to parse the JSON to verify it's valid
+    if not text:
+        return ParseResult(None, "failed", "empty response")
+
+    start = _fenced_start(text)
+    if start >= 0:
+        try:
+            value, _ = _decoder.raw_decode(text, _skip_whitespace(text, start))
+            return ParseResult(value, "fenced")
+        except json.JSONDecodeError:
+            pass
+
+    has_json_start = False
+    for attempt, match in enumerate(JSON_START_PATTERN.finditer(text)):
+        has_json_start = True
+        if attempt >= MAX_BARE_CANDIDATES:
+            break
         try:
-            return json.loads(good_json_string)
+            value, _ = _decoder.raw_decode(text, match.start())
         except json.JSONDecodeError:
             continue
-    # If we've tried all matches and none are valid JSON, return None
-    return None
\ No newline at end of file
+        if isinstance(value, (dict, list)) and value:
+            return ParseResult(value, "bare")
+
+    if not has_json_start:
+        # Nothing json_repair could turn into an object or array
+        return ParseResult(None, "failed", "no JSON found")
+
+    if start >= 0:
+        end = text.rfind(FENCE)
+        candidate = text[start:end] if end >= start else text[start:]
+    else:
+        candidate = text
+    try:
+        value = json.loads(repair_json(candidate))
+    except (json.JSONDecodeError, TypeError, ValueError) as e:
+        return ParseResult(None, "failed", str(e))
+    if isinstance(value, (dict, list)) and value:
+        return ParseResult(value, "repaired")
+    return ParseResult(None, "failed", "no JSON found")
+
+
+def load_json_from_llm_result(text):
+    """
+    Extract and clean JSON from markdown code blocks.
+    Returns the first valid JSON found or None if no valid JSON is found.
+    """
+    return parse_llm_json(text).value
\ No newline at end of file
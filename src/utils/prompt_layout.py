@@ -0,0 +1,120 @@
+import re
+from functools import lru_cache
+from string import Template
+from typing import NamedTuple
+
+# ${user_question} or $user_question, as string.Template substitutes both
+QUESTION_PLACEHOLDER = re.compile(r"\$(?:\{user_question\}|user_question\b)")
+# Instructions referring to the question by position cannot be moved in front of it
+POSITIONAL_REFERENCE = re.compile(r"\b(above|preceding|previous)\b", re.IGNORECASE)
+# Punctuation closing the question sentence stays with the question
+LEADING_PUNCTUATION = re.compile(r"[ \t]*[.,;:!?]*")
+# Shorter trailing text (e.g. "Answer:") is a cue for the answer, not instructions to move
+MIN_MOVED_CHARS = 40
+
+_prompt_caching = False
+_move_instructions = True
+
+
+def configure_prompt_caching(enabled=True, move_instructions=True):
+    """
+    Send evaluation prompts as a static, cacheable prefix and a per-case suffix.
+
+    Args:
+        enabled (bool): Insert a Converse cachePoint after the case-independent prefix
+        move_instructions (bool): Move instructions that follow the question placeholder
+            into the prefix when that is safe (see split_template)
+    """
+    global _prompt_caching, _move_instructions
+    _prompt_caching = enabled
+    _move_instructions = move_instructions
+
+
+def prompt_caching_enabled():
+    return _prompt_caching
+
+
+class PromptLayout(NamedTuple):
+    """A template split into a case-independent prefix and a per-case suffix template"""
+
+    prefix: str
+    # Template text holding the question placeholder
+    suffix: str
+    # Whether instructions were moved from after the placeholder into the prefix
+    moved: bool = False
+
+    @property
+    def template(self):
+        """The template in this layout"""
+        return self.prefix + self.suffix
+
+
+def _movable(instructions):
+    return len(instructions) >= MIN_MOVED_CHARS and not POSITIONAL_REFERENCE.search(instructions)
+
+
+@lru_cache(maxsize=64)
+def split_template(prompt_template, move_instructions=True):
+    """
+    Split a template at its question placeholder.
+
+    Everything before the placeholder is the static prefix. Instructions after
+    it (typically the output format) are moved in front of the block that
+    introduces the question, e.g. "### User Inquiry:", when that is safe:
+    the placeholder occurs exactly once and the trailing text is long enough
+    to be instructions rather than an answer cue and does not refer to the
+    question by position ("above"). Punctuation closing the question sentence
+    stays with the question.
+
+    Args:
+        prompt_template (str): Template with one question placeholder
+        move_instructions (bool): Move trailing instructions into the prefix if safe
+
+    Returns:
+        PromptLayout: prefix and suffix; the prefix is empty (nothing to cache) when the
+            template does not have exactly one placeholder
+    """
+    matches = list(QUESTION_PLACEHOLDER.finditer(prompt_template or ""))
+    if len(matches) != 1:
+        return PromptLayout("", prompt_template or "")
+    match = matches[0]
+    before, placeholder, after = (prompt_template[:match.start()], match.group(),
+                                  prompt_template[match.end():])
+
+    punctuation = LEADING_PUNCTUATION.match(after).group()
+    instructions = after[len(punctuation):].strip()
+    if not move_instructions or not _movable(instructions):
+        return PromptLayout(before, placeholder + after)
+
+    # Keep the block introducing the question (its last paragraph or line) right before it
+    split = before.rfind("\n\n")
+    if split < 0:
+        split = before.rfind("\n")
+    head, introduction = before[:max(split, 0)].rstrip(), before[max(split, 0):].lstrip("\n")
+    prefix = (head + "\n\n" if head else "") + instructions + "\n\n" + introduction
+    return PromptLayout(prefix, placeholder + punctuation.strip(), moved=True)
+
+
+def prompt_layout(prompt_template):
+    """Layout of a template under the configured prompt caching options"""
+    return split_template(prompt_template, _move_instructions)
+
+
+@lru_cache(maxsize=64)
+def _render_prefix(prefix):
+    return Template(prefix).safe_substitute()
+
+
+def render_layout(layout, user_question):
+    """
+    Fill a layout in for one question.
+
+    Returns:
+        tuple: (prefix, suffix) texts, rendered like string.Template.safe_substitute
+    """
+    return _render_prefix(layout.prefix), Template(layout.suffix).safe_substitute(user_question=user_question)
+
+
+def cache_friendly_template(prompt_template):
+    """The template rearranged so that all instructions precede the question, if that is safe"""
+    return split_template(prompt_template, move_instructions=True).template
\ No newline at end of file
@@ -0,0 +1,336 @@
+import asyncio
+import collections
+import random
+import threading
+import time
+
+# Error codes that mean "slow down and try again"
+THROTTLING_ERROR_CODES = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceUnavailableException",
+    "ModelNotReadyException",
+}
+
+
+def is_throttling_error(exc):
+    """Return True if exc is a botocore error signalling throttling or transient overload"""
+    response = getattr(exc, "response", None)
+    if not isinstance(response, dict):
+        return False
+    return response.get("Error", {}).get("Code") in THROTTLING_ERROR_CODES
+
+
+def estimate_request_tokens(request):
+    """
+    Estimate the tokens a Converse request will consume against the TPM quota.
+
+    Input tokens are approximated from the text length (4 characters per token)
+    and the full maxTokens output allowance is reserved, as Bedrock does.
+    """
+    characters = 0
+    for message in request.get("messages", []):
+        for block in message.get("content", []):
+            characters += len(block.get("text", ""))
+    for block in request.get("system", []) or []:
+        characters += len(block.get("text", ""))
+    max_tokens = request.get("inferenceConfig", {}).get("maxTokens", 0)
+    return characters // 4 + max_tokens
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at capacity per minute"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = float(per_minute)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount):
+        """
+        Take amount tokens from the bucket, going into debt if needed.
+
+        Returns:
+            float: Seconds the caller must wait before its request fits the budget
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.tokens -= min(amount, self.capacity)
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def refund(self, amount):
+        """Give back tokens that were reserved but not used (negative amount charges more)"""
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class AIMDLimiter:
+    """
+    Concurrency limit adjusted with additive increase / multiplicative decrease.
+
+    The limit grows by roughly one slot per limit-many successful calls and is
+    cut by decrease_factor on every throttle, never leaving [min_limit, max_limit].
+    Threads wait on a condition; coroutines wait on a future of their own event
+    loop, which release resolves when a slot frees up.
+    """
+
+    def __init__(self, max_limit, min_limit=1, decrease_factor=0.5):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.decrease_factor = decrease_factor
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self._condition = threading.Condition()
+        # (event loop, future) of each coroutine waiting for a slot, oldest first
+        self._waiters = collections.deque()
+
+    def try_acquire(self):
+        """Take a slot if one is free; return whether it was taken"""
+        with self._condition:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            return False
+
+    def acquire(self):
+        """Block until a slot is free and take it"""
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    async def acquire_async(self):
+        """Wait on the event loop until a slot is free and take it"""
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._condition:
+                if self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                waiter = loop.create_future()
+                self._waiters.append((loop, waiter))
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                with self._condition:
+                    try:
+                        self._waiters.remove((loop, waiter))
+                    except ValueError:
+                        # Woken for a slot it will not take; pass the wake-up on
+                        self._wake_waiters()
+                raise
+
+    def _wake_waiters(self):
+        """Wake one waiting coroutine per free slot (called with the condition held)"""
+        free = int(self.limit) - self.in_flight
+        while free > 0 and self._waiters:
+            loop, waiter = self._waiters.popleft()
+            loop.call_soon_threadsafe(_resolve_waiter, waiter)
+            free -= 1
+
+    def release(self, throttled=False):
+        """Free a slot and adjust the limit from the call outcome"""
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1.0 / max(self.limit, 1.0))
+            self._condition.notify_all()
+            self._wake_waiters()
+
+
+def _resolve_waiter(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class RateLimitController:
+    """
+    Per-model request/token budgets, adaptive concurrency and throttle retries.
+
+    Every call reserves one request from the RPM bucket and its estimated tokens
+    from the TPM bucket, then takes an AIMD concurrency slot. Throttled calls
+    are retried with full-jitter exponential backoff, so they cost time instead
+    of turning into failed cases.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, max_concurrency=None,
+                 max_retries=6, base_delay=1.0, max_delay=60.0):
+        """
+        Args:
+            requests_per_minute (int, optional): RPM budget; unlimited if None
+            tokens_per_minute (int, optional): TPM budget; unlimited if None
+            max_concurrency (int, optional): Ceiling of the AIMD concurrency limit; unlimited if None
+            max_retries (int): Maximum retries of a throttled call
+            base_delay (float): Base backoff delay in seconds
+            max_delay (float): Maximum backoff delay in seconds
+        """
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.concurrency = AIMDLimiter(max_concurrency) if max_concurrency else None
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.throttle_count = 0
+
+    def _reserve(self, estimated_tokens):
+        wait = 0.0
+        if self.request_bucket is not None:
+            wait = max(wait, self.request_bucket.reserve(1))
+        if self.token_bucket is not None:
+            wait = max(wait, self.token_bucket.reserve(estimated_tokens))
+        return wait
+
+    def acquire(self, estimated_tokens=0):
+        """Block until the call fits the budgets and a concurrency slot is free"""
+        wait = self._reserve(estimated_tokens)
+        if wait > 0:
+            time.sleep(wait)
+        if self.concurrency is not None:
+            self.concurrency.acquire()
+
+    async def acquire_async(self, estimated_tokens=0):
+        """Event-loop counterpart of acquire"""
+        wait = self._reserve(estimated_tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        if self.concurrency is not None:
+            await self.concurrency.acquire_async()
+
+    def release(self, throttled=False, estimated_tokens=0, actual_tokens=None):
+        """
+        Release the concurrency slot and settle the token reservation.
+
+        Args:
+            throttled (bool): Whether the call was throttled
+            estimated_tokens (int): Tokens reserved in acquire
+            actual_tokens (int, optional): Tokens the call really used, if known
+        """
+        if throttled:
+            self.throttle_count += 1
+        if self.concurrency is not None:
+            self.concurrency.release(throttled=throttled)
+        if self.token_bucket is not None:
+            used = estimated_tokens if actual_tokens is None else actual_tokens
+            self.token_bucket.refund(estimated_tokens - used)
+
+    def backoff_delay(self, attempt):
+        """Full-jitter exponential backoff delay for the given retry attempt"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+_controllers = {}
+_controllers_lock = threading.Lock()
+_controller_settings = {}
+
+
+def configure_rate_limits(requests_per_minute=None, tokens_per_minute=None, max_concurrency=None,
+                          max_retries=6, base_delay=1.0, max_delay=60.0):
+    """
+    Set the budgets used for every model ID and drop existing controllers.
+
+    Args:
+        requests_per_minute (int, optional): RPM budget per model ID
+        tokens_per_minute (int, optional): TPM budget per model ID
+        max_concurrency (int, optional): Ceiling of the adaptive concurrency limit per model ID
+        max_retries (int): Maximum retries of a throttled call
+        base_delay (float): Base backoff delay in seconds
+        max_delay (float): Maximum backoff delay in seconds
+    """
+    with _controllers_lock:
+        _controller_settings.clear()
+        _controller_settings.update(
+            requests_per_minute=requests_per_minute,
+            tokens_per_minute=tokens_per_minute,
+            max_concurrency=max_concurrency,
+            max_retries=max_retries,
+            base_delay=base_delay,
+            max_delay=max_delay,
+        )
+        _controllers.clear()
+
+
+def get_rate_limiter(model_id):
+    """Return the rate-limit controller of a model ID, creating it on first use"""
+    controller = _controllers.get(model_id)
+    if controller is None:
+        with _controllers_lock:
+            controller = _controllers.get(model_id)
+            if controller is None:
+                controller = RateLimitController(**_controller_settings)
+                _controllers[model_id] = controller
+    return controller
+
+
+def _usage_tokens(response):
+    usage = response.get("usage") if isinstance(response, dict) else None
+    if not usage:
+        return None
+    return usage.get("totalTokens", usage.get("inputTokens", 0) + usage.get("outputTokens", 0))
+
+
+def call_with_rate_limit(converse, request):
+    """
+    Run converse(**request) under the rate limits of request["modelId"].
+
+    Args:
+        converse (callable): The blocking Converse function (e.g. client.converse)
+        request (dict): Keyword arguments of the Converse call
+
+    Returns:
+        tuple: (response, number of throttle retries)
+    """
+    controller = get_rate_limiter(request["modelId"])
+    estimated_tokens = estimate_request_tokens(request)
+    attempt = 0
+    while True:
+        controller.acquire(estimated_tokens)
+        try:
+            response = converse(**request)
+        except Exception as exc:
+            throttled = is_throttling_error(exc)
+            controller.release(throttled=throttled, estimated_tokens=estimated_tokens, actual_tokens=0)
+            if not throttled or attempt >= controller.max_retries:
+                raise
+            time.sleep(controller.backoff_delay(attempt))
+            attempt += 1
+            continue
+        controller.release(estimated_tokens=estimated_tokens, actual_tokens=_usage_tokens(response))
+        return response, attempt
+
+
+async def call_with_rate_limit_async(converse, request):
+    """
+    Await converse(**request) under the rate limits of request["modelId"].
+
+    Args:
+        converse (callable): The async Converse function
+        request (dict): Keyword arguments of the Converse call
+
+    Returns:
+        tuple: (response, number of throttle retries)
+    """
+    controller = get_rate_limiter(request["modelId"])
+    estimated_tokens = estimate_request_tokens(request)
+    attempt = 0
+    while True:
+        await controller.acquire_async(estimated_tokens)
+        try:
+            response = await converse(**request)
+        except Exception as exc:
+            throttled = is_throttling_error(exc)
+            controller.release(throttled=throttled, estimated_tokens=estimated_tokens, actual_tokens=0)
+            if not throttled or attempt >= controller.max_retries:
+                raise
+            await asyncio.sleep(controller.backoff_delay(attempt))
+            attempt += 1
+            continue
+        controller.release(estimated_tokens=estimated_tokens, actual_tokens=_usage_tokens(response))
+        return response, attempt
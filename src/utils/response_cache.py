@@ -0,0 +1,254 @@
+import atexit
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class ResponseCache:
+    """
+    Content-addressed cache for model responses.
+
+    Entries are keyed by a hash of the model ID, the fully rendered request and
+    the inference configuration. Lookups hit an in-memory LRU first and fall
+    back to an optional SQLite store, so results survive across runs. Access
+    times of disk hits are kept in memory and written in batches of
+    access_flush_entries (and on prune and close); new entries are committed
+    right away, without an fsync (WAL with synchronous=NORMAL), so no write
+    transaction is held open between calls. The SQLite
+    file can be shared by several processes; when it is locked or otherwise
+    unavailable, lookups fall back to misses and entries stay in memory only,
+    so a cache failure never fails the call it serves.
+    """
+
+    def __init__(self, db_path=None, max_memory_entries=4096, max_disk_entries=200000,
+                 max_age_seconds=30 * 24 * 3600, access_flush_entries=512):
+        """
+        Args:
+            db_path (str, optional): Path of the SQLite file. If None, the cache is memory-only.
+            max_memory_entries (int): Maximum number of entries kept in the in-memory LRU
+            max_disk_entries (int): Maximum number of entries kept on disk
+            max_age_seconds (float): Entries older than this are treated as expired
+            access_flush_entries (int): Number of pending disk-hit access times written in one batch
+        """
+        self.db_path = db_path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.max_age_seconds = max_age_seconds
+        self.access_flush_entries = access_flush_entries
+        self.hits = 0
+        self.misses = 0
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._puts_since_prune = 0
+        self._pending_access = {}
+        self._disk_errors = 0
+        self._conn = None
+
+        if db_path:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # Commits are not fsynced (the WAL is at checkpoints), so committing every put is cheap
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+            try:
+                self._prune_disk()
+            except sqlite3.OperationalError as exc:
+                self._disk_error(exc)
+            # Write the last access times when the process exits
+            atexit.register(self.close)
+
+    @staticmethod
+    def make_key(model_id, prompt, inference_config, **extra):
+        """
+        Build the cache key for a request.
+
+        Args:
+            model_id (str): The model ID
+            prompt: The fully rendered prompt (string or message content)
+            inference_config (dict): The inference configuration sent with the request
+            **extra: Any other request fields that change the response (system prompt, tools...)
+
+        Returns:
+            str: Hex digest identifying the request
+        """
+        payload = {
+            "model_id": model_id,
+            "prompt": prompt,
+            "inference_config": inference_config,
+        }
+        payload.update(extra)
+        encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created_at, value = entry
+                if now - created_at <= self.max_age_seconds:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._memory[key]
+
+            if self._conn is not None:
+                try:
+                    row = self._conn.execute(
+                        "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+                    ).fetchone()
+                except sqlite3.OperationalError as exc:
+                    self._disk_error(exc)
+                    row = None
+                if row is not None and now - row[1] <= self.max_age_seconds:
+                    value = json.loads(row[0])
+                    self._pending_access[key] = now
+                    if len(self._pending_access) >= self.access_flush_entries:
+                        try:
+                            self._flush_access()
+                        except sqlite3.OperationalError as exc:
+                            self._disk_error(exc)
+                    self._remember(key, row[1], value)
+                    self.hits += 1
+                    return value
+
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        """Store a JSON-serializable value under key"""
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+            if self._conn is not None:
+                try:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at) "
+                        "VALUES (?, ?, ?, ?)",
+                        (key, json.dumps(value, ensure_ascii=False), now, now),
+                    )
+                    self._conn.commit()
+                    self._pending_access.pop(key, None)
+                    self._puts_since_prune += 1
+                    if self._puts_since_prune >= 1000:
+                        self._prune_disk()
+                except sqlite3.OperationalError as exc:
+                    # Do not keep a failed write transaction open
+                    self._conn.rollback()
+                    self._disk_error(exc)
+
+    def stats(self):
+        """Return hit and miss counters"""
+        return {"hits": self.hits, "misses": self.misses}
+
+    def clear(self):
+        """Remove every entry from memory and disk"""
+        with self._lock:
+            self._memory.clear()
+            self._pending_access.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM responses")
+                self._conn.commit()
+
+    def close(self):
+        """Write pending access times, commit and close the underlying SQLite connection"""
+        with self._lock:
+            if self._conn is not None:
+                try:
+                    self._flush_access()
+                except sqlite3.OperationalError as exc:
+                    self._disk_error(exc)
+                self._conn.close()
+                self._conn = None
+
+    def _remember(self, key, created_at, value):
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_error(self, exc):
+        """Report a failed SQLite operation (e.g. "database is locked"); the first few are printed"""
+        self._disk_errors += 1
+        if self._disk_errors <= 3:
+            print(f"Response cache: {self.db_path} unavailable ({exc}), continuing without it for this call")
+
+    def _flush_access(self):
+        """Write the access times of the disk hits since the last flush in one transaction"""
+        if self._pending_access:
+            pending, self._pending_access = self._pending_access, {}
+            try:
+                self._conn.executemany(
+                    "UPDATE responses SET accessed_at = ? WHERE key = ?",
+                    [(accessed_at, key) for key, accessed_at in pending.items()],
+                )
+                self._conn.commit()
+            except sqlite3.OperationalError:
+                self._conn.rollback()
+                raise
+
+    def _prune_disk(self):
+        """Drop expired entries, then the least recently used ones above the size limit"""
+        self._flush_access()
+        self._puts_since_prune = 0
+        cutoff = time.time() - self.max_age_seconds
+        self._conn.execute("DELETE FROM responses WHERE created_at < ?", (cutoff,))
+        self._conn.execute(
+            "DELETE FROM responses WHERE key IN ("
+            "SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_entries,),
+        )
+        self._conn.commit()
+
+
+_response_cache = None
+
+
+def configure_response_cache(db_path=None, enabled=True, **kwargs):
+    """
+    Configure the process-wide response cache used by the Converse call sites.
+
+    Args:
+        db_path (str, optional): SQLite file for the persistent store; memory-only if None
+        enabled (bool): If False, caching is disabled
+        **kwargs: Extra arguments passed to ResponseCache
+
+    Returns:
+        ResponseCache: The configured cache, or None if disabled
+    """
+    global _response_cache
+    if _response_cache is not None:
+        _response_cache.close()
+    _response_cache = ResponseCache(db_path=db_path, **kwargs) if enabled else None
+    return _response_cache
+
+
+def get_response_cache():
+    """Return the process-wide response cache, or None if caching is not configured"""
+    return _response_cache
+
+
+@contextmanager
+def response_cache_disabled():
+    """Bypass the process-wide response cache inside the block, so every request reaches the model"""
+    global _response_cache
+    cache, _response_cache = _response_cache, None
+    try:
+        yield
+    finally:
+        _response_cache = cache
\ No newline at end of file
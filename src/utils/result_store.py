@@ -0,0 +1,489 @@
+"""
+Compact columnar storage of suite results.
+
+A suite result is a list of case dicts, each repeating the full user question,
+the ground truth and prediction label strings and the case_type. ResultStore
+keeps the same data as columns instead: labels, case types and parse methods
+are interned into small string pools and stored as integer codes, questions
+are referenced by the index of their test case in the suite (or stored once
+in a question pool), and the numeric fields live in typed arrays. The
+executors append each case result as it completes and scoring works on the
+label codes, so a suite in memory costs a few dozen bytes per case plus its
+explanations. The store is a read-only sequence of case dicts in case_idx
+order, each built on access.
+
+Stores serialize to Arrow IPC (".arrow" / ".feather") or Parquet (".parquet")
+with dictionary-encoded string columns. A loaded store reads Arrow IPC files
+through a memory map: the numeric and code columns become compact NumPy arrays
+and questions and explanations are decoded from the mapped file only when a
+case is accessed. pyarrow is only needed for files, not for the in-memory store.
+"""
+import json
+import math
+import os
+from array import array
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.ipc as pa_ipc
+except ImportError:
+    pa = None
+    pc = None
+    pa_ipc = None
+
+ARROW_EXTENSIONS = (".arrow", ".feather")
+PARQUET_EXTENSIONS = (".parquet",)
+COLUMNAR_EXTENSIONS = ARROW_EXTENSIONS + PARQUET_EXTENSIONS
+
+# Per-call metrics, stored as float64 (NaN for missing) and int64 (-1 for missing) columns
+FLOAT_FIELDS = ("wall_time_ms", "server_latency_ms")
+INT_FIELDS = ("input_tokens", "output_tokens", "cache_read_tokens", "cache_write_tokens", "retries")
+# Nullable booleans, stored as int8 (-1 for missing)
+FLAG_FIELDS = ("task_succeed", "cache_hit")
+# Interned string fields, stored as pool codes (-1 for missing)
+LABEL_FIELDS = ("ground_truth", "prediction")
+CODED_FIELDS = ("case_type", "parse_method")
+COLUMN_FIELDS = (("case_idx", "user_question", "explanation") + LABEL_FIELDS + CODED_FIELDS
+                 + FLAG_FIELDS + FLOAT_FIELDS + INT_FIELDS)
+
+
+def is_columnar_path(path):
+    """Whether a results path names an Arrow IPC or Parquet file"""
+    return path.lower().endswith(COLUMNAR_EXTENSIONS)
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("Reading and writing columnar result files requires pyarrow (pip install pyarrow)")
+
+
+class StringPool:
+    """Interns strings to dense integer codes; code -1 stands for a missing value"""
+
+    def __init__(self, values=None):
+        self.values = []
+        self.codes = {}
+        for value in values or []:
+            self.code(value)
+
+    def code(self, value):
+        if value is None:
+            return -1
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def value(self, code):
+        return None if code < 0 else self.values[code]
+
+    def __len__(self):
+        return len(self.values)
+
+
+def _label_text(value):
+    # Labels are strings; the occasional list answer (["LABEL"]) is kept as its JSON text
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _label_value(text):
+    """Inverse of _label_text: list answers come back as lists"""
+    if text is not None and text.startswith("["):
+        try:
+            value = json.loads(text)
+        except json.JSONDecodeError:
+            return text
+        if isinstance(value, list):
+            return value
+    return text
+
+
+def _flag(value):
+    return -1 if value is None else int(bool(value))
+
+
+class ArrowStringPool:
+    """Read-only string pool over the dictionary of an Arrow column; values are decoded on access"""
+
+    def __init__(self, dictionary):
+        self.dictionary = dictionary
+
+    def value(self, code):
+        return None if code < 0 else self.dictionary[int(code)].as_py()
+
+    @property
+    def values(self):
+        return self.dictionary.to_pylist()
+
+    def __len__(self):
+        return len(self.dictionary)
+
+
+class ResultStore:
+    """
+    Column-oriented suite results.
+
+    Ground truth and prediction share one label pool, so a case succeeded
+    exactly when both codes are equal (before normalization). Keys of a case
+    result that have no column are kept per row in extras and restored with it.
+    Rows are kept in the order they were appended; indexing and iteration go
+    by case_idx.
+    """
+
+    def __init__(self, prompt_template="", stats=None, questions=None, test_cases=None):
+        """
+        Args:
+            prompt_template (str): Template the results belong to
+            stats (dict, optional): Suite statistics
+            questions (list, optional): Known questions, coded first and in this order
+            test_cases (list, optional): Test cases of the run; the question of a result appended
+                with the position of its test case is stored as that position instead of a copy
+        """
+        self.prompt_template = prompt_template
+        self.stats = stats or {}
+        self.test_cases = test_cases
+        self.questions = StringPool(questions)
+        self.labels = StringPool()
+        self.case_types = StringPool()
+        self.parse_methods = StringPool()
+        self.case_idx = array("l")
+        self.question_positions = array("l")
+        self.question_codes = array("l")
+        self.ground_truth_codes = array("l")
+        self.prediction_codes = array("l")
+        self.case_type_codes = array("b")
+        self.parse_method_codes = array("b")
+        self.explanations = []
+        self.flags = {field: array("b") for field in FLAG_FIELDS}
+        self.float_columns = {field: array("d") for field in FLOAT_FIELDS}
+        self.int_columns = {field: array("q") for field in INT_FIELDS}
+        self.extras = {}
+        self._order = None
+
+    @classmethod
+    def from_suite_results(cls, suite_results, test_cases=None):
+        """
+        Build a store from a suite_results structure.
+
+        Args:
+            suite_results (dict): prompt_template, test_cases and stats; test_cases may already
+                be a ResultStore, which is then returned with the template and stats set
+            test_cases (list, optional): Test cases of the suite, in case_idx order, whose
+                questions the stored results refer to instead of copying them
+        """
+        if isinstance(suite_results.get("test_cases"), ResultStore):
+            store = suite_results["test_cases"]
+            store.prompt_template = suite_results.get("prompt_template", "")
+            store.stats = suite_results.get("stats", {})
+            return store
+        store = cls(suite_results.get("prompt_template", ""), suite_results.get("stats", {}), test_cases=test_cases)
+        for case_result in suite_results.get("test_cases", []):
+            if case_result is not None:
+                store.append(case_result, case_result.get("case_idx", 0) - 1 if test_cases is not None else None)
+        return store
+
+    def append(self, case_result, position=None):
+        """
+        Add one case result.
+
+        Args:
+            case_result (dict): The case result
+            position (int, optional): Position of its test case in test_cases
+        """
+        row = len(self.case_idx)
+        self._order = None
+        self.case_idx.append(case_result.get("case_idx", row + 1))
+        question = case_result.get("user_question")
+        if (position is not None and self.test_cases is not None and 0 <= position < len(self.test_cases)
+                and self.test_cases[position].get("user_question") == question):
+            self.question_positions.append(position)
+            self.question_codes.append(-1)
+        else:
+            self.question_positions.append(-1)
+            self.question_codes.append(self.questions.code(question))
+        self.ground_truth_codes.append(self.labels.code(_label_text(case_result.get("ground_truth"))))
+        self.prediction_codes.append(self.labels.code(_label_text(case_result.get("prediction"))))
+        self.case_type_codes.append(self.case_types.code(case_result.get("case_type")))
+        self.parse_method_codes.append(self.parse_methods.code(case_result.get("parse_method")))
+        self.explanations.append(case_result.get("explanation"))
+        for field, column in self.flags.items():
+            column.append(_flag(case_result.get(field)))
+        for field, column in self.float_columns.items():
+            value = case_result.get(field)
+            column.append(math.nan if value is None else float(value))
+        for field, column in self.int_columns.items():
+            value = case_result.get(field)
+            column.append(-1 if value is None else int(value))
+        extra = {key: value for key, value in case_result.items() if key not in COLUMN_FIELDS}
+        if extra:
+            self.extras[row] = extra
+
+    def question(self, row):
+        """User question of one row, or None if it had none"""
+        position = self.question_positions[row]
+        if position >= 0:
+            return self.test_cases[position].get("user_question")
+        return self.questions.value(self.question_codes[row])
+
+    def explanation(self, row):
+        value = self.explanations[row]
+        # A loaded store keeps the explanations in the (memory-mapped) Arrow column
+        return value.as_py() if pa is not None and isinstance(value, pa.Scalar) else value
+
+    def label(self, codes, row):
+        """Ground truth or prediction of one row from its code column, list answers as lists"""
+        return _label_value(self.labels.value(codes[row]))
+
+    def case(self, row):
+        """The case result dict of one row; fields that were missing are left out"""
+        case_result = {"case_idx": int(self.case_idx[row])}
+        question = self.question(row)
+        if question is not None:
+            case_result["user_question"] = question
+        for key, codes in (("ground_truth", self.ground_truth_codes), ("prediction", self.prediction_codes)):
+            if codes[row] >= 0:
+                case_result[key] = self.label(codes, row)
+        explanation = self.explanation(row)
+        if explanation is not None:
+            case_result["explanation"] = explanation
+        for key, pool, codes in (
+            ("case_type", self.case_types, self.case_type_codes),
+            ("parse_method", self.parse_methods, self.parse_method_codes),
+        ):
+            if codes[row] >= 0:
+                case_result[key] = pool.value(codes[row])
+        for field, column in self.flags.items():
+            if column[row] >= 0:
+                case_result[field] = bool(column[row])
+        for field, column in self.float_columns.items():
+            if not math.isnan(column[row]):
+                case_result[field] = float(column[row])
+        for field, column in self.int_columns.items():
+            if column[row] >= 0:
+                case_result[field] = int(column[row])
+        case_result.update(self.extras.get(row, {}))
+        return case_result
+
+    def rows(self):
+        """Row numbers in case_idx order"""
+        if self._order is None:
+            self._order = np.argsort(np.asarray(self.case_idx), kind="stable").tolist()
+        return self._order
+
+    def outcomes(self, rows=None):
+        """
+        Yield (row, ground_truth, prediction, task_succeed) per case without building case dicts
+        (task_succeed is None before scoring).
+
+        Args:
+            rows (list, optional): Rows to go through; every row in case_idx order if None
+        """
+        task_succeed = self.flags["task_succeed"]
+        for row in self.rows() if rows is None else rows:
+            yield (row, self.label(self.ground_truth_codes, row) or "",
+                   self.label(self.prediction_codes, row) or "",
+                   None if task_succeed[row] < 0 else bool(task_succeed[row]))
+
+    def select(self, rows):
+        """Lazy view of some rows (e.g. one critique shard)"""
+        return ResultRows(self, rows)
+
+    def score(self, engine):
+        """
+        Count every case in a ScoringEngine from the label codes and set the task_succeed column.
+
+        Returns:
+            int: Number of successful cases
+        """
+        # Counted in case order, so labels get the same engine codes as when scoring a case list
+        order = np.asarray(self.rows(), dtype=np.int64)
+        successes = np.zeros(len(self), dtype=np.int8)
+        successes[order] = engine.add_coded(
+            [_label_value(value) for value in self.labels.values],
+            np.asarray(self.ground_truth_codes)[order],
+            np.asarray(self.prediction_codes)[order],
+        )
+        self.flags["task_succeed"] = array("b", successes.tobytes())
+        return int(successes.sum())
+
+    def __len__(self):
+        return len(self.case_idx)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.case(row) for row in self.rows()[index]]
+        return self.case(self.rows()[index])
+
+    def __iter__(self):
+        return (self.case(row) for row in self.rows())
+
+    def to_suite_results(self):
+        """Rebuild the suite_results structure with a list of case dicts, in case_idx order"""
+        return {
+            "prompt_template": self.prompt_template,
+            "test_cases": list(self),
+            "stats": self.stats,
+        }
+
+    def to_arrow(self):
+        """
+        The store as a pyarrow Table.
+
+        String columns are dictionary-encoded from the pools, so each question
+        and label is written once; prompt_template, stats and extras go into
+        the schema metadata.
+        """
+        _require_pyarrow()
+
+        def dictionary(codes, values):
+            indices = pa.array(codes, type=pa.int32(), mask=[code < 0 for code in codes])
+            return pa.DictionaryArray.from_arrays(indices, pa.array(values, type=pa.string()))
+
+        # Questions referenced by test case position are pooled for the file
+        questions = StringPool()
+        question_codes = [questions.code(self.question(row)) for row in range(len(self))]
+        columns = {
+            "case_idx": pa.array(self.case_idx, type=pa.int32()),
+            "user_question": dictionary(question_codes, questions.values),
+            "ground_truth": dictionary(self.ground_truth_codes, self.labels.values),
+            "prediction": dictionary(self.prediction_codes, self.labels.values),
+            "explanation": pa.array([self.explanation(row) for row in range(len(self))], type=pa.string()),
+            "case_type": dictionary(self.case_type_codes, self.case_types.values),
+            "parse_method": dictionary(self.parse_method_codes, self.parse_methods.values),
+        }
+        for field, column in self.flags.items():
+            columns[field] = pa.array([value > 0 for value in column], type=pa.bool_(),
+                                      mask=[value < 0 for value in column])
+        for field, column in self.float_columns.items():
+            columns[field] = pa.array(column, type=pa.float64(), from_pandas=True)
+        for field, column in self.int_columns.items():
+            columns[field] = pa.array(column, type=pa.int64(), mask=[value < 0 for value in column])
+
+        metadata = {
+            "prompt_template": self.prompt_template or "",
+            "stats": json.dumps(self.stats, ensure_ascii=False),
+            "extras": json.dumps({str(row): extra for row, extra in self.extras.items()}, ensure_ascii=False),
+        }
+        return pa.table(columns, metadata=metadata)
+
+    @classmethod
+    def from_arrow(cls, table):
+        """
+        Build a read-only store over a Table written by to_arrow.
+
+        Code, flag and numeric columns are converted to compact NumPy arrays
+        (zero-copy where the file allows it); the question dictionary and the
+        explanations stay in the table and are decoded per accessed case.
+        """
+        _require_pyarrow()
+        metadata = {key.decode(): value.decode() for key, value in (table.schema.metadata or {}).items()}
+        store = cls(metadata.get("prompt_template", ""), json.loads(metadata.get("stats") or "{}"))
+        store.extras = {int(row): extra for row, extra in json.loads(metadata.get("extras") or "{}").items()}
+
+        def dictionary_column(name):
+            column = table.column(name).combine_chunks()
+            if not pa.types.is_dictionary(column.type):
+                column = column.dictionary_encode()
+            # Missing values become -1; indices already match the dictionary order
+            return column.dictionary, pc.fill_null(column.indices, -1).to_numpy(zero_copy_only=False)
+
+        def small_pool(dictionary):
+            return StringPool(dictionary.to_pylist())
+
+        store.case_idx = table.column("case_idx").combine_chunks().to_numpy(zero_copy_only=False)
+        questions, store.question_codes = dictionary_column("user_question")
+        store.questions = ArrowStringPool(questions)
+        store.question_positions = np.full(len(store.case_idx), -1, dtype=np.int64)
+        ground_truths, store.ground_truth_codes = dictionary_column("ground_truth")
+        store.labels = small_pool(ground_truths)
+        # Predictions have their own dictionary in the file; remap it onto the shared label pool
+        predictions, prediction_codes = dictionary_column("prediction")
+        remap = np.array([store.labels.code(value) for value in predictions.to_pylist()] + [-1], dtype=np.int64)
+        store.prediction_codes = remap[prediction_codes]
+        case_types, store.case_type_codes = dictionary_column("case_type")
+        store.case_types = small_pool(case_types)
+        parse_methods, store.parse_method_codes = dictionary_column("parse_method")
+        store.parse_methods = small_pool(parse_methods)
+        store.explanations = table.column("explanation").combine_chunks()
+        for field in FLAG_FIELDS:
+            column = pc.cast(table.column(field), pa.int8())
+            store.flags[field] = pc.fill_null(column, -1).to_numpy()
+        for field in FLOAT_FIELDS:
+            store.float_columns[field] = pc.fill_null(table.column(field), math.nan).to_numpy()
+        for field in INT_FIELDS:
+            store.int_columns[field] = pc.fill_null(table.column(field), -1).to_numpy()
+        return store
+
+    def save(self, path):
+        """
+        Write the store to an Arrow IPC (".arrow", ".feather") or Parquet (".parquet") file.
+
+        Returns:
+            str: The path written
+        """
+        _require_pyarrow()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        table = self.to_arrow()
+        if path.lower().endswith(PARQUET_EXTENSIONS):
+            import pyarrow.parquet as pq
+            pq.write_table(table, path)
+        else:
+            with pa.OSFile(path, "wb") as sink:
+                with pa_ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        """Open a store written by save, reading Arrow IPC files through a memory map"""
+        return cls.from_arrow(read_result_table(path))
+
+
+class ResultRows:
+    """Lazy sequence of some rows of a ResultStore, e.g. the cases of one critique shard"""
+
+    def __init__(self, store, rows):
+        self.store = store
+        self.rows = list(rows)
+
+    def case(self, row):
+        return self.store.case(row)
+
+    def outcomes(self):
+        """As ResultStore.outcomes, for these rows"""
+        return self.store.outcomes(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.store.case(row) for row in self.rows[index]]
+        return self.store.case(self.rows[index])
+
+    def __iter__(self):
+        return (self.store.case(row) for row in self.rows)
+
+
+def read_result_table(path, memory_map=True):
+    """
+    Read a columnar results file as a pyarrow Table without building case dicts.
+
+    Arrow IPC files are memory-mapped, so columns are read lazily from the page
+    cache and opening even a large file is near-instant; Parquet files are
+    decoded with a memory-mapped reader.
+    """
+    _require_pyarrow()
+    if path.lower().endswith(PARQUET_EXTENSIONS):
+        import pyarrow.parquet as pq
+        return pq.read_table(path, memory_map=memory_map)
+    source = pa.memory_map(path, "r") if memory_map else pa.OSFile(path, "rb")
+    return pa_ipc.open_file(source).read_all()
\ No newline at end of file
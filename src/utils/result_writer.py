@@ -0,0 +1,184 @@
+import json
+import os
+import threading
+
+from src.utils.result_store import ResultStore, is_columnar_path
+
+
+def summary_path(results_file):
+    """Path of the summary file written next to a JSONL results file"""
+    base, _ = os.path.splitext(results_file)
+    return base + ".summary.json"
+
+
+class JsonlResultWriter:
+    """
+    Append-only JSONL writer for case results.
+
+    The first line is a header recording the prompt template, every following
+    line is one case result. Each line is flushed as soon as it is written, so a
+    crash loses at most the case that was being written.
+    """
+
+    def __init__(self, path, prompt_template="", append=False):
+        """
+        Args:
+            path (str): Path of the JSONL file
+            prompt_template (str): Template the results belong to, stored in the header
+            append (bool): Continue an existing file instead of starting a new one
+        """
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        existing = append and os.path.exists(path) and os.path.getsize(path) > 0
+        if existing:
+            _truncate_partial_line(path)
+            # A crash while writing the header leaves nothing after truncation; start over
+            existing = os.path.getsize(path) > 0
+        self._file = open(path, "a" if existing else "w", encoding="utf-8")
+        if not existing:
+            self._write_line({"record_type": "header", "prompt_template": prompt_template})
+
+    def write(self, case_result):
+        """Append one case result"""
+        self._write_line(case_result)
+
+    def close(self):
+        """Close the file"""
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _write_line(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+
+def _truncate_partial_line(path):
+    """Drop a trailing line left incomplete by a crash"""
+    with open(path, "rb+") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if size == 0:
+            return
+        f.seek(size - 1)
+        if f.read(1) == b"\n":
+            return
+        # Walk back to the last complete line
+        position = size - 1
+        while position > 0:
+            f.seek(position - 1)
+            if f.read(1) == b"\n":
+                break
+            position -= 1
+        f.truncate(position)
+
+
+def iter_result_records(path):
+    """
+    Yield the case results of a JSONL results file, skipping the header.
+
+    A truncated last line (from a crash) is ignored.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("record_type") == "header":
+                continue
+            yield record
+
+
+def read_results_header(path):
+    """Return the header record of a JSONL results file, or None if it has none"""
+    with open(path, "r", encoding="utf-8") as f:
+        first_line = f.readline()
+    try:
+        record = json.loads(first_line)
+    except json.JSONDecodeError:
+        return None
+    return record if record.get("record_type") == "header" else None
+
+
+def load_completed_cases(path, prompt_template=None):
+    """
+    Load the cases already finished in a partial JSONL results file.
+
+    Args:
+        path (str): Path of the JSONL file
+        prompt_template (str, optional): If given, the file must belong to this template
+
+    Returns:
+        dict: case_idx (1-based) -> case result; empty if the file does not exist
+    """
+    if not os.path.exists(path):
+        return {}
+
+    if prompt_template is not None:
+        header = read_results_header(path)
+        if header is not None and header.get("prompt_template") != prompt_template:
+            raise ValueError(f"Results file '{path}' was written for a different prompt template")
+
+    return {record["case_idx"]: record for record in iter_result_records(path) if "case_idx" in record}
+
+
+def write_summary(suite_results, results_file):
+    """
+    Write the small summary file (template and stats) for a JSONL results file.
+
+    Returns:
+        str: Path of the summary file
+    """
+    path = summary_path(results_file)
+    summary = {
+        "prompt_template": suite_results.get("prompt_template", ""),
+        "results_file": os.path.basename(results_file),
+        "stats": suite_results.get("stats", {}),
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    return path
+
+
+def load_suite_results(results_file):
+    """
+    Rebuild the suite_results structure from a JSONL results file and its summary, or from a columnar file.
+
+    The test_cases of a columnar file are the loaded ResultStore itself, a lazy
+    view over the memory-mapped table that builds each case dict on access.
+    """
+    if is_columnar_path(results_file):
+        store = ResultStore.load(results_file)
+        return {
+            "prompt_template": store.prompt_template,
+            "test_cases": store,
+            "stats": store.stats,
+        }
+    header = read_results_header(results_file) or {}
+    test_cases = sorted(iter_result_records(results_file), key=lambda case: case.get("case_idx", 0))
+    stats = {}
+    if os.path.exists(summary_path(results_file)):
+        with open(summary_path(results_file), "r", encoding="utf-8") as f:
+            stats = json.load(f).get("stats", {})
+    return {
+        "prompt_template": header.get("prompt_template", ""),
+        "test_cases": test_cases,
+        "stats": stats,
+    }
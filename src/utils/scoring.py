@@ -0,0 +1,218 @@
+import numpy as np
+
+
+def normalize_label(value):
+    """
+    Canonical form of a ground truth or prediction label.
+
+    Lists (the model sometimes answers ["LABEL"]) are reduced to their first
+    element, the primary prediction. Strings are stripped, upper-cased and
+    have spaces and hyphens turned into underscores, so "pin reset" and
+    "PIN_RESET" score the same.
+    """
+    if isinstance(value, (list, tuple)):
+        value = value[0] if value else ""
+    if value is None:
+        return ""
+    return " ".join(str(value).split()).upper().replace(" ", "_").replace("-", "_")
+
+
+class ScoringEngine:
+    """
+    Confusion-matrix scoring of classification results.
+
+    Labels are mapped to integer codes as they are seen and counts are kept in
+    a NumPy confusion matrix (rows: ground truth, columns: prediction), which
+    grows when new labels appear. Cases can be added one at a time as results
+    stream in or in bulk; per-class precision, recall and F1 and macro/micro
+    averages are computed from the matrix in one pass.
+    """
+
+    def __init__(self, labels=None, normalize=True):
+        """
+        Args:
+            labels (list, optional): Known labels, coded first and in this order
+            normalize (bool): Compare labels after normalize_label
+        """
+        self.normalize = normalize
+        self.labels = []
+        self.label_codes = {}
+        # Codes of raw string labels, so repeated labels skip normalization
+        self._raw_codes = {}
+        self._matrix = np.zeros((0, 0), dtype=np.int64)
+        for label in labels or []:
+            self.code(label)
+
+    def _key(self, label):
+        if self.normalize:
+            return normalize_label(label)
+        if isinstance(label, (list, tuple)):
+            return label[0] if label else ""
+        return label
+
+    def code(self, label):
+        """Integer code of a label, assigning a new one if needed"""
+        if isinstance(label, str):
+            code = self._raw_codes.get(label)
+            if code is None:
+                code = self._raw_codes[label] = self._code_of_key(self._key(label))
+            return code
+        return self._code_of_key(self._key(label))
+
+    def _code_of_key(self, key):
+        code = self.label_codes.get(key)
+        if code is None:
+            code = self.label_codes[key] = len(self.labels)
+            self.labels.append(key)
+        return code
+
+    def _codes(self, labels):
+        # Plain dict lookups for labels seen before, the full path only for new or list labels
+        raw_get = self._raw_codes.get
+        codes = [raw_get(label) if label.__class__ is str else None for label in labels]
+        for position, code in enumerate(codes):
+            if code is None:
+                codes[position] = self.code(labels[position])
+        return codes
+
+    def _grow(self):
+        size = len(self.labels)
+        if self._matrix.shape[0] < size:
+            # Grow geometrically so streaming in new labels stays cheap
+            capacity = max(size, 2 * self._matrix.shape[0])
+            matrix = np.zeros((capacity, capacity), dtype=np.int64)
+            matrix[:self._matrix.shape[0], :self._matrix.shape[1]] = self._matrix
+            self._matrix = matrix
+
+    def add(self, ground_truth, prediction):
+        """Count one case; returns whether the prediction matches the ground truth"""
+        truth_code = self.code(ground_truth)
+        prediction_code = self.code(prediction)
+        self._grow()
+        self._matrix[truth_code, prediction_code] += 1
+        return truth_code == prediction_code
+
+    def add_many(self, ground_truths, predictions):
+        """
+        Count many cases at once.
+
+        Returns:
+            np.ndarray: Boolean success mask, one entry per case
+        """
+        truth_codes = np.array(self._codes(ground_truths), dtype=np.int64)
+        prediction_codes = np.array(self._codes(predictions), dtype=np.int64)
+        self._grow()
+        np.add.at(self._matrix, (truth_codes, prediction_codes), 1)
+        return truth_codes == prediction_codes
+
+    def add_coded(self, labels, truth_codes, prediction_codes):
+        """
+        Count many cases given as codes into a label list, as a columnar store keeps them.
+
+        Args:
+            labels (list): Label of each code
+            truth_codes (np.ndarray): Ground-truth code per case; -1 stands for a missing label
+            prediction_codes (np.ndarray): Prediction code per case; -1 stands for a missing label
+
+        Returns:
+            np.ndarray: Boolean success mask, one entry per case
+        """
+        labels = list(labels) + [""]
+        # Missing labels (-1) take the last code, ""
+        truth_codes = np.asarray(truth_codes, dtype=np.int64) % len(labels)
+        prediction_codes = np.asarray(prediction_codes, dtype=np.int64) % len(labels)
+        # New labels get engine codes in order of first appearance (ground truths, then
+        # predictions), as add_many would give them
+        seen = np.concatenate([truth_codes, prediction_codes])
+        _, first = np.unique(seen, return_index=True)
+        mapping = np.zeros(len(labels), dtype=np.int64)
+        for code in seen[np.sort(first)].tolist():
+            mapping[code] = self.code(labels[code])
+        truth_codes = mapping[truth_codes]
+        prediction_codes = mapping[prediction_codes]
+        self._grow()
+        np.add.at(self._matrix, (truth_codes, prediction_codes), 1)
+        return truth_codes == prediction_codes
+
+    def add_cases(self, test_cases):
+        """
+        Count case results and set their task_succeed flag.
+
+        Args:
+            test_cases (list): Case results with ground_truth and prediction (None entries are skipped)
+
+        Returns:
+            int: Number of successful cases among those added
+        """
+        cases = [test_case for test_case in test_cases if test_case is not None]
+        successes = self.add_many(
+            [test_case.get("ground_truth", "") for test_case in cases],
+            [test_case.get("prediction", "") for test_case in cases],
+        )
+        for test_case, succeeded in zip(cases, successes.tolist()):
+            test_case["task_succeed"] = succeeded
+        return int(successes.sum())
+
+    def merge(self, other):
+        """Add the counts of another engine (e.g. a minibatch or a worker) to this one"""
+        codes = np.array([self.code(label) for label in other.labels], dtype=np.int64)
+        self._grow()
+        if len(codes):
+            np.add.at(self._matrix, np.ix_(codes, codes), other.confusion_matrix)
+        return self
+
+    @property
+    def confusion_matrix(self):
+        """Counts with ground-truth rows and prediction columns, in label code order"""
+        size = len(self.labels)
+        return self._matrix[:size, :size]
+
+    @property
+    def total(self):
+        return int(self.confusion_matrix.sum())
+
+    def metrics(self):
+        """
+        Per-class and averaged scores.
+
+        Macro averages are taken over the classes that occur in the ground
+        truth; labels that were only ever predicted (e.g. "Error") are left
+        out of them, while their cases still count as misses of the true
+        class. For single-label classification micro precision, recall and F1
+        all equal accuracy.
+
+        Returns:
+            dict: accuracy, per_class {label: precision, recall, f1, support}, macro and micro
+        """
+        matrix = self.confusion_matrix
+        true_positives = np.diag(matrix).astype(np.float64)
+        support = matrix.sum(axis=1)
+        predicted = matrix.sum(axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            precision = np.where(predicted > 0, true_positives / predicted, 0.0)
+            recall = np.where(support > 0, true_positives / support, 0.0)
+            f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+
+        total = int(support.sum())
+        accuracy = float(true_positives.sum() / total) if total else 0.0
+        present = support > 0
+        per_class = {
+            label: {
+                "precision": round(float(precision[code]), 4),
+                "recall": round(float(recall[code]), 4),
+                "f1": round(float(f1[code]), 4),
+                "support": int(support[code]),
+            }
+            for code, label in enumerate(self.labels) if present[code]
+        }
+        macro = {
+            "precision": round(float(precision[present].mean()), 4) if present.any() else 0.0,
+            "recall": round(float(recall[present].mean()), 4) if present.any() else 0.0,
+            "f1": round(float(f1[present].mean()), 4) if present.any() else 0.0,
+        }
+        micro = {"precision": round(accuracy, 4), "recall": round(accuracy, 4), "f1": round(accuracy, 4)}
+        return {"accuracy": round(accuracy, 4), "per_class": per_class, "macro": macro, "micro": micro}
+
+    def to_dict(self):
+        """Metrics plus the confusion matrix with its labels, JSON serializable"""
+        return dict(self.metrics(), labels=list(self.labels), confusion_matrix=self.confusion_matrix.tolist())
\ No newline at end of file
@@ -0,0 +1,180 @@
+import re
+from functools import lru_cache
+
+from src.utils.scoring import normalize_label
+
+# Category lines of a classification template, e.g. "PIN_RESET - For PIN number issues",
+# optionally bulleted or numbered ("- PIN_RESET:", "1. CARD_LOST -")
+LABEL_PATTERN = re.compile(r"^[ \t]*(?:[-*\u2022][ \t]+|\d+[.)][ \t]+)?([A-Z][A-Z0-9_]{2,})[ \t]*[-:\u2013]",
+                           re.MULTILINE)
+# Upper-case words that introduce instructions rather than categories, e.g. "IMPORTANT: ..."
+NON_LABEL_WORDS = frozenset({
+    "ANSWER", "CATEGORIES", "CATEGORY", "CONTEXT", "EXAMPLE", "EXAMPLES", "FORMAT", "IMPORTANT",
+    "INPUT", "INSTRUCTIONS", "JSON", "LABELS", "NOTE", "OUTPUT", "QUESTION", "REMEMBER", "RESPONSE",
+    "RULES", "STEP", "SYSTEM", "TASK", "TIP", "USER", "WARNING",
+})
+
+CLASSIFICATION_TOOL_NAME = "record_classification"
+BATCH_CLASSIFICATION_TOOL_NAME = "record_classifications"
+REWRITE_TOOL_NAME = "record_improved_template"
+
+_structured_output = False
+_known_labels = None
+
+
+def configure_structured_output(enabled=True):
+    """Read evaluation results from a forced toolUse block instead of parsing ```json text"""
+    global _structured_output
+    _structured_output = enabled
+
+
+def structured_output_enabled():
+    return _structured_output
+
+
+def configure_known_labels(labels):
+    """
+    Ground-truth labels of the suite being evaluated.
+
+    The prediction enum is only sent when every one of them is among the labels
+    read from the template, so a template whose categories are not all
+    recognized gets a free-string prediction instead of one forced into the
+    wrong classes.
+
+    Args:
+        labels (iterable, optional): Ground-truth labels; None skips the check
+    """
+    global _known_labels
+    _known_labels = frozenset(normalize_label(label) for label in labels) if labels is not None else None
+    classification_tool_config.cache_clear()
+    batch_classification_tool_config.cache_clear()
+
+
+def known_labels():
+    """Normalized ground-truth labels set with configure_known_labels, None if not set"""
+    return _known_labels
+
+
+@lru_cache(maxsize=64)
+def extract_labels(prompt_template):
+    """
+    Category labels listed in a classification template.
+
+    Returns:
+        tuple: Labels in template order, without duplicates
+    """
+    labels = LABEL_PATTERN.findall(prompt_template or "")
+    return tuple(dict.fromkeys(label for label in labels if label not in NON_LABEL_WORDS))
+
+
+@lru_cache(maxsize=64)
+def _enum_labels(prompt_template, ground_truth_labels):
+    labels = extract_labels(prompt_template)
+    if labels and ground_truth_labels is not None:
+        missing = ground_truth_labels - {normalize_label(label) for label in labels}
+        if missing:
+            print(f"Labels {sorted(missing)} of the suite are not listed in the template; "
+                  f"not restricting predictions to {list(labels)}")
+            return ()
+    return labels
+
+
+def _tool_config(name, description, properties, required):
+    return {
+        "tools": [{
+            "toolSpec": {
+                "name": name,
+                "description": description,
+                "inputSchema": {"json": {
+                    "type": "object",
+                    "properties": properties,
+                    "required": required,
+                }},
+            }
+        }],
+        "toolChoice": {"tool": {"name": name}},
+    }
+
+
+def _classification_properties(prompt_template):
+    labels = _enum_labels(prompt_template, _known_labels)
+    prediction = {"type": "string", "description": "The category of the inquiry"}
+    if labels:
+        prediction["enum"] = list(labels)
+    return {
+        "prediction": prediction,
+        "explanation": {"type": "string", "description": "Why the inquiry belongs to this category"},
+    }
+
+
+@lru_cache(maxsize=64)
+def classification_tool_config(prompt_template):
+    """
+    Converse toolConfig forcing a classification answer.
+
+    prediction is restricted to the labels listed in the template; without
+    recognizable labels, or when they miss ground-truth labels of the suite
+    (see configure_known_labels), it is a free string.
+
+    Returns:
+        dict: toolConfig for the Converse request (shared, do not modify)
+    """
+    return _tool_config(
+        CLASSIFICATION_TOOL_NAME,
+        "Record the category of the customer inquiry and the reasoning behind it.",
+        _classification_properties(prompt_template),
+        ["prediction", "explanation"],
+    )
+
+
+@lru_cache(maxsize=64)
+def batch_classification_tool_config(prompt_template):
+    """
+    Converse toolConfig forcing one classification per inquiry of a batched request.
+
+    Returns:
+        dict: toolConfig whose input is {"classifications": [{id, prediction, explanation}]}
+            (shared, do not modify)
+    """
+    item = {
+        "type": "object",
+        "properties": dict(
+            {"id": {"type": "integer", "description": "The id of the inquiry"}},
+            **_classification_properties(prompt_template)
+        ),
+        "required": ["id", "prediction", "explanation"],
+    }
+    return _tool_config(
+        BATCH_CLASSIFICATION_TOOL_NAME,
+        "Record the category of every customer inquiry and the reasoning behind it.",
+        {"classifications": {"type": "array", "items": item}},
+        ["classifications"],
+    )
+
+
+@lru_cache(maxsize=1)
+def rewrite_tool_config():
+    """Converse toolConfig forcing a root_cause / improved_template answer (shared, do not modify)"""
+    return _tool_config(
+        REWRITE_TOOL_NAME,
+        "Record the root cause analysis and the complete improved prompt template.",
+        {
+            "root_cause": {"type": "string", "description": "Root cause analysis of the errors"},
+            "improved_template": {"type": "string", "description": "The complete improved template"},
+        },
+        ["root_cause", "improved_template"],
+    )
+
+
+def extract_tool_input(response, tool_name=None):
+    """
+    Input of the first toolUse block of a Converse response.
+
+    Returns:
+        dict: The tool input, None if the response has no (matching) toolUse block
+    """
+    for block in response["output"]["message"]["content"]:
+        tool_use = block.get("toolUse")
+        if tool_use and (tool_name is None or tool_use.get("name") == tool_name):
+            return tool_use.get("input")
+    return None
\ No newline at end of file
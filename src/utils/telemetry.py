@@ -0,0 +1,231 @@
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+# Per-call metric fields recorded on each case result
+CALL_METRIC_FIELDS = ("wall_time_ms", "server_latency_ms", "input_tokens", "output_tokens",
+                      "cache_read_tokens", "cache_write_tokens", "retries")
+
+
+def response_metrics(response):
+    """
+    Extract server latency and token usage from a Converse response.
+
+    Returns:
+        dict: server_latency_ms, input_tokens, output_tokens and the prompt cache
+            cache_read_tokens and cache_write_tokens (None when not reported)
+    """
+    usage = response.get("usage", {}) or {}
+    metrics = response.get("metrics", {}) or {}
+    return {
+        "server_latency_ms": metrics.get("latencyMs"),
+        "input_tokens": usage.get("inputTokens"),
+        "output_tokens": usage.get("outputTokens"),
+        "cache_read_tokens": usage.get("cacheReadInputTokens"),
+        "cache_write_tokens": usage.get("cacheWriteInputTokens"),
+    }
+
+
+def empty_call_metrics():
+    """Metrics of a call that never reached the model (cache hit or early failure)"""
+    return {
+        "wall_time_ms": 0.0,
+        "server_latency_ms": None,
+        "input_tokens": 0,
+        "output_tokens": 0,
+        "cache_read_tokens": 0,
+        "cache_write_tokens": 0,
+        "retries": 0,
+    }
+
+
+def percentiles(values, points=(50, 90, 99)):
+    """
+    Nearest-rank percentiles of a list of numbers.
+
+    Returns:
+        dict: {"p50": ..., "p90": ..., "p99": ..., "max": ..., "mean": ...}, empty if no values
+    """
+    ordered = sorted(value for value in values if value is not None)
+    if not ordered:
+        return {}
+    summary = {}
+    for point in points:
+        index = min(len(ordered) - 1, max(0, int(round(point / 100 * len(ordered))) - 1))
+        summary[f"p{point}"] = ordered[index]
+    summary["max"] = ordered[-1]
+    summary["mean"] = sum(ordered) / len(ordered)
+    return summary
+
+
+class ReservoirSample:
+    """
+    Uniform random sample of a stream of unknown length (reservoir sampling).
+
+    With capacity None every item is kept.
+    """
+
+    def __init__(self, capacity=None, seed=0):
+        self.capacity = capacity
+        self.items = []
+        self.seen = 0
+        self._rng = random.Random(seed)
+
+    def add(self, item):
+        self.seen += 1
+        if self.capacity is None or len(self.items) < self.capacity:
+            self.items.append(item)
+            return
+        slot = self._rng.randrange(self.seen)
+        if slot < self.capacity:
+            self.items[slot] = item
+
+
+class CaseMetricsAccumulator:
+    """
+    Running roll-up of per-case call metrics, fed one case result at a time.
+
+    Token, retry and endpoint totals are exact; latency percentiles are taken
+    over a uniform sample of at most max_latency_samples calls (all calls if None),
+    so the memory used does not grow with the suite when a bound is set.
+    """
+
+    def __init__(self, max_latency_samples=None, seed=0):
+        self.wall_times = ReservoirSample(max_latency_samples, seed)
+        self.server_latencies = ReservoirSample(max_latency_samples, seed + 1)
+        self.tokens = {"input": 0, "output": 0, "cache_read": 0, "cache_write": 0}
+        self.retries = 0
+        self.endpoints = {}
+
+    def add(self, case_result):
+        """Fold one case result in"""
+        # Cache hits and copies of duplicate questions made no call
+        if (not case_result.get("cache_hit") and not case_result.get("duplicate_of")
+                and case_result.get("wall_time_ms") is not None):
+            self.wall_times.add(case_result["wall_time_ms"])
+        if case_result.get("server_latency_ms") is not None:
+            self.server_latencies.add(case_result["server_latency_ms"])
+        self.tokens["input"] += case_result.get("input_tokens") or 0
+        self.tokens["output"] += case_result.get("output_tokens") or 0
+        self.tokens["cache_read"] += case_result.get("cache_read_tokens") or 0
+        self.tokens["cache_write"] += case_result.get("cache_write_tokens") or 0
+        self.retries += case_result.get("retries") or 0
+        if case_result.get("endpoint") is not None:
+            self.endpoints[case_result["endpoint"]] = self.endpoints.get(case_result["endpoint"], 0) + 1
+
+    def summary(self):
+        """Suite statistics in the shape of summarize_case_metrics"""
+        summary = {
+            "latency_ms": {
+                "wall": percentiles(self.wall_times.items),
+                "server": percentiles(self.server_latencies.items),
+            },
+            "tokens": dict(self.tokens),
+            "retries": self.retries,
+        }
+        if self.endpoints:
+            summary["endpoints"] = dict(self.endpoints)
+        return summary
+
+
+def summarize_case_metrics(case_results):
+    """
+    Roll per-case call metrics up into suite statistics.
+
+    Args:
+        case_results (list): Case results carrying the CALL_METRIC_FIELDS
+
+    Returns:
+        dict: latency_ms (wall/server percentiles), tokens (input/output and prompt cache
+            read/write totals), retries and, when calls were routed, endpoints with the
+            number of cases each endpoint served
+    """
+    accumulator = CaseMetricsAccumulator()
+    for case_result in case_results:
+        if case_result is not None:
+            accumulator.add(case_result)
+    return accumulator.summary()
+
+
+class JsonlSpanExporter:
+    """Local file exporter writing one JSON line per finished span"""
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span_record):
+        line = json.dumps(span_record, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+
+class Span:
+    """A timed stage; attributes can be added while it is open"""
+
+    def __init__(self, name, parent_id=None, **attributes):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = dict(attributes)
+        self.start_time = datetime.now().isoformat()
+        self._start = time.perf_counter()
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def to_record(self, status):
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time": self.start_time,
+            "duration_ms": (time.perf_counter() - self._start) * 1000,
+            "status": status,
+            "attributes": self.attributes,
+        }
+
+
+_span_exporter = None
+_span_stack = threading.local()
+
+
+def configure_span_exporter(path):
+    """Send finished spans to a JSONL file at path (None disables span export)"""
+    global _span_exporter
+    _span_exporter = JsonlSpanExporter(path) if path else None
+    return _span_exporter
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Time a stage and export it as a span when it ends.
+
+    Spans opened inside another span on the same thread record it as parent.
+    Without a configured exporter the span is still timed but not written.
+    """
+    stack = getattr(_span_stack, "spans", None)
+    if stack is None:
+        stack = _span_stack.spans = []
+    current = Span(name, parent_id=stack[-1].span_id if stack else None, **attributes)
+    stack.append(current)
+    status = "ok"
+    try:
+        yield current
+    except BaseException as exc:
+        status = f"error: {type(exc).__name__}"
+        raise
+    finally:
+        stack.pop()
+        if _span_exporter is not None:
+            _span_exporter.export(current.to_record(status))
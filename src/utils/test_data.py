@@ -0,0 +1,126 @@
+"""
+Reading test suites.
+
+A suite is one of:
+
+- a JSON document {"prompt_template": ..., "test_cases": [...]}
+- a JSONL file with one test case per line, optionally preceded by a header
+  line {"record_type": "header", "prompt_template": ...}
+- a set of such shards: a directory (its .jsonl and .json files) or a glob
+  pattern, read in sorted path order
+
+iter_test_cases reads JSONL input one line at a time, so a suite can be
+streamed without holding it in memory; JSON documents are parsed whole.
+"""
+import glob
+import json
+import os
+
+SUITE_EXTENSIONS = (".jsonl", ".json")
+
+
+def suite_paths(source):
+    """
+    Files of a suite.
+
+    Args:
+        source (str): A JSON or JSONL file, a directory of shards or a glob pattern
+
+    Returns:
+        list: File paths in read order
+    """
+    if os.path.isdir(source):
+        return sorted(os.path.join(source, name) for name in os.listdir(source)
+                      if name.lower().endswith(SUITE_EXTENSIONS))
+    if glob.has_magic(source):
+        return sorted(glob.glob(source))
+    return [source]
+
+
+def _iter_jsonl(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Invalid JSON on line {line_number} of '{path}': {e}") from e
+            yield record
+
+
+def iter_test_cases(source):
+    """
+    Yield the test cases of a suite in order, reading JSONL input lazily.
+
+    Args:
+        source (str): A JSON or JSONL file, a directory of shards or a glob pattern
+
+    Yields:
+        dict: Test cases with user_question and ground_truth
+    """
+    for path in suite_paths(source):
+        if path.lower().endswith(".jsonl"):
+            for record in _iter_jsonl(path):
+                if record.get("record_type") != "header":
+                    yield record
+        else:
+            with open(path, "r", encoding="utf-8") as f:
+                document = json.load(f)
+            yield from (document.get("test_cases", []) if isinstance(document, dict) else document)
+
+
+def read_prompt_template(source):
+    """Prompt template of a suite: from the first JSON document or JSONL header that has one, else None"""
+    for path in suite_paths(source):
+        if path.lower().endswith(".jsonl"):
+            record = next(_iter_jsonl(path), None)
+            if record is not None and record.get("record_type") == "header":
+                return record.get("prompt_template")
+        else:
+            with open(path, "r", encoding="utf-8") as f:
+                document = json.load(f)
+            if isinstance(document, dict) and document.get("prompt_template") is not None:
+                return document["prompt_template"]
+    return None
+
+
+def load_test_data(source):
+    """
+    Read a whole suite into memory.
+
+    Returns:
+        dict: prompt_template and the list of test_cases, as in a JSON suite document
+    """
+    return {"prompt_template": read_prompt_template(source), "test_cases": list(iter_test_cases(source))}
+
+
+class TestCaseSource:
+    """
+    Re-iterable view of a suite on disk.
+
+    Every iteration reads the suite again from the start, so a suite can be
+    evaluated once per optimization iteration without keeping it in memory.
+    """
+
+    def __init__(self, source):
+        """
+        Args:
+            source (str): A JSON or JSONL file, a directory of shards or a glob pattern
+        """
+        self.source = source
+        self._count = None
+
+    def __iter__(self):
+        return iter_test_cases(self.source)
+
+    @property
+    def prompt_template(self):
+        return read_prompt_template(self.source)
+
+    def count(self):
+        """Number of test cases, counted with one pass over the suite on first use"""
+        if self._count is None:
+            self._count = sum(1 for _ in self)
+        return self._count
\ No newline at end of file